@@ -0,0 +1,382 @@
+import os
+import sys
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.indicators import batch_indicators, rolling_mean_2d
+from scripts.run_model import ForexModel, INDICATOR_PARAMS, indicator_params, load_data
+
+# Exit reasons recorded per trade
+EXIT_STOP_LOSS = 0
+EXIT_TAKE_PROFIT = 1
+EXIT_TIMEOUT = 2
+EXIT_END = 3
+EXIT_REASONS = ["STOP_LOSS", "TAKE_PROFIT", "TIMEOUT", "END"]
+
+# Market regimes, as returned by ForexModel.detect_market_regime
+REGIMES = ["TRENDING", "VOLATILE", "RANGING"]
+
+# One row per simulated trade
+TRADE_DTYPE = np.dtype([
+    ('entry_index', np.int64),
+    ('exit_index', np.int64),
+    ('direction', np.int8),
+    ('entry_price', np.float64),
+    ('exit_price', np.float64),
+    ('reason', np.int8)
+])
+
+# Function to compute technical signals for every bar
+def technical_signals(close, columns):
+    """Vectorized ForexModel.technical_prediction over whole arrays.
+    
+    Returns (prediction, confidence) arrays; bars where no rule fires get 0.
+    """
+    sma_20 = columns['sma_20']
+    sma_50 = columns['sma_50']
+    rsi = columns['rsi']
+    macd = columns['macd']
+    macd_signal = columns['macd_signal']
+    
+    signals = [
+        # Moving averages
+        np.where((close > sma_20) & (sma_20 > sma_50), 1.0,
+                 np.where((close < sma_20) & (sma_20 < sma_50), -1.0, 0.0)),
+        # RSI
+        np.where(rsi < 30, 1.0, np.where(rsi > 70, -1.0, 0.0)),
+        # MACD
+        np.where((macd > macd_signal) & (macd > 0), 1.0,
+                 np.where((macd < macd_signal) & (macd < 0), -1.0, 0.0)),
+        # Bollinger bands
+        np.where(close < columns['bollinger_lower'], 1.0,
+                 np.where(close > columns['bollinger_upper'], -1.0, 0.0))
+    ]
+    
+    total = np.sum(signals, axis=0)
+    count = np.count_nonzero(signals, axis=0)
+    prediction = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+    
+    return prediction, np.minimum(np.abs(prediction), 1.0)
+
+# Function to read backtest settings from a model features dict
+def settings_from_features(features):
+    """Map the model features configuration to run_backtest keyword arguments"""
+    dl_params = features.get('Deep Learning', {}).get('parameters', {})
+    settings = {
+        "confidence_threshold": float(dl_params.get('confidenceThreshold', 0.7)),
+        "risk_reward_minimum": None,
+        "dynamic_stop_loss": False,
+        "indicator_params": indicator_params(features)
+    }
+    
+    risk = features.get('Advanced Risk Management', {})
+    if risk.get('enabled', False):
+        risk_params = risk.get('parameters', {})
+        settings["risk_reward_minimum"] = float(risk_params.get('riskRewardMinimum', 1.5))
+        settings["dynamic_stop_loss"] = bool(risk_params.get('dynamicStopLoss', True))
+    
+    return settings
+
+# Maximum number of bars gathered at once while searching for exits
+EXIT_SEARCH_CELLS = 1 << 22
+
+# Function to find where trades are closed
+def find_exits(adverse, favourable, entries, ends, stop_loss, take_profit):
+    """Find the first bar after each entry (and before its end) reaching stop loss or take profit.
+    
+    ``adverse`` holds each bar's worst price for the position and
+    ``favourable`` its best, oriented so losses go down. All entries are
+    searched together over windows that double in width. When both levels are
+    inside the same bar the stop loss is assumed to fill first. Returns
+    (index, reason) arrays; index is -1 where neither level is reached.
+    """
+    index = np.full(len(entries), -1, dtype=np.int64)
+    reason = np.full(len(entries), -1, dtype=np.int8)
+    starts = np.asarray(entries, dtype=np.int64) + 1
+    pending = np.flatnonzero(starts < ends)
+    bars = len(adverse)
+    limited = bool(np.any(ends < bars))
+    chunk = 32
+    
+    while len(pending):
+        width = max(1, min(chunk, bars, EXIT_SEARCH_CELLS // len(pending)))
+        
+        # Padding past the last bar never reaches either level
+        adverse_rows = sliding_window_view(np.concatenate((adverse, np.full(width, np.inf))), width)[starts[pending]]
+        favourable_rows = sliding_window_view(np.concatenate((favourable, np.full(width, -np.inf))), width)[starts[pending]]
+        
+        hit_sl = adverse_rows <= stop_loss[pending, None]
+        hits = hit_sl | (favourable_rows >= take_profit[pending, None])
+        if limited:
+            hits &= starts[pending, None] + np.arange(width) < ends[pending, None]
+        
+        found = hits.any(axis=1)
+        first = hits[found].argmax(axis=1)
+        
+        done = pending[found]
+        index[done] = starts[done] + first
+        reason[done] = np.where(hit_sl[found, first], EXIT_STOP_LOSS, EXIT_TAKE_PROFIT)
+        
+        starts[pending] += width
+        pending = pending[~found]
+        pending = pending[starts[pending] < ends[pending]]
+        chunk *= 2
+    
+    return index, reason
+
+# Function to compute indicator columns over full history
+def indicator_columns(high, low, close, indicator_params=None):
+    """Return the preprocess_data indicator columns (plus adx) as 1-D arrays"""
+    params = dict(INDICATOR_PARAMS, **(indicator_params or {}))
+    return {
+        name: values[0]
+        for name, values in batch_indicators(high[None, :], low[None, :], close[None, :], **params).items()
+    }
+
+# Function to classify the market regime of every bar
+def market_regimes(close, columns):
+    """Vectorized ForexModel.detect_market_regime; returns indexes into REGIMES"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        volatility = columns['atr'] / close * 100
+        average = rolling_mean_2d(volatility[None, :], 20)[0]
+    
+    return np.where(columns['adx'] > 25, 0, np.where(volatility > average * 1.5, 1, 2)).astype(np.int8)
+
+# Function to compute trade direction and SL/TP distances for every bar
+def trade_levels(close, columns, confidence_threshold=0.7, risk_reward_minimum=None,
+                 dynamic_stop_loss=False, stop_loss_atr=2.0, take_profit_atr=3.0):
+    """Return (prediction, direction, sl_distance, tp_distance) arrays as in build_prediction"""
+    prediction, confidence = technical_signals(close, columns)
+    atr = columns['atr']
+    
+    # Direction as in build_prediction with only the technical component
+    direction = np.where(prediction > 0.2, 1, np.where(prediction < -0.2, -1, 0)).astype(np.int8)
+    direction[confidence < confidence_threshold] = 0
+    
+    # Bars preprocess_data would drop can't trade
+    valid = np.ones(len(close), dtype=bool)
+    for values in columns.values():
+        valid &= ~np.isnan(values)
+    direction[~valid | ~(atr > 0)] = 0
+    
+    # Stop loss / take profit distances for every bar
+    sl_distance = atr * stop_loss_atr
+    tp_distance = atr * take_profit_atr
+    risk_reward = take_profit_atr / stop_loss_atr
+    
+    if risk_reward_minimum is not None:
+        if dynamic_stop_loss:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                volatility = rolling_mean_2d(atr[None, :], 20)[0] / rolling_mean_2d(close[None, :], 20)[0]
+            sl_distance = atr * (1 + volatility * 5)
+            tp_distance = sl_distance * risk_reward
+            direction[np.isnan(volatility)] = 0
+        
+        if risk_reward < risk_reward_minimum:
+            direction[:] = 0
+    
+    return prediction, direction, sl_distance, tp_distance
+
+# Function to simulate trades from per-bar signals
+def simulate_trades(high, low, close, spread, direction, sl_distance, tp_distance,
+                    start=0, stop=None, max_bars_held=None):
+    """Open one position at a time on signals in [start, stop) and close it on SL/TP.
+    
+    Exits are searched for every signal bar at once; positions are then
+    chained so each trade opens on the first signal after the previous exit.
+    Positions still open at ``stop`` are closed there. Returns a structured
+    array with one row per trade.
+    """
+    stop = len(close) if stop is None else stop
+    high, low, close, spread = high[start:stop], low[start:stop], close[start:stop], spread[start:stop]
+    bars = len(close)
+    
+    entries = np.flatnonzero(direction[start:stop])
+    side = direction[start:stop][entries].astype(np.int8)
+    is_long = side > 0
+    
+    if max_bars_held is None:
+        ends = np.full(len(entries), bars, dtype=np.int64)
+    else:
+        ends = np.minimum(bars, entries + 1 + max_bars_held)
+    
+    # Buys pay the spread on entry
+    entry_price = close[entries] + np.where(is_long, spread[entries], 0.0)
+    stop_loss = entry_price - side * sl_distance[start:stop][entries]
+    take_profit = entry_price + side * tp_distance[start:stop][entries]
+    
+    # Bars are bid prices and shorts are closed on the ask (bid + spread);
+    # negating their prices lets one search handle both sides
+    exit_index = np.empty(len(entries), dtype=np.int64)
+    reason = np.empty(len(entries), dtype=np.int8)
+    for mask, adverse, favourable, sign in (
+        (is_long, low, high, 1.0),
+        (~is_long, -(high + spread), -(low + spread), -1.0)
+    ):
+        exit_index[mask], reason[mask] = find_exits(
+            adverse, favourable, entries[mask], ends[mask], sign * stop_loss[mask], sign * take_profit[mask]
+        )
+    
+    exit_price = np.where(reason == EXIT_STOP_LOSS, stop_loss, take_profit)
+    
+    # Close at the last bar of the window or holding period
+    open_ended = exit_index < 0
+    exit_index[open_ended] = ends[open_ended] - 1
+    reason[open_ended] = np.where(ends[open_ended] == bars, EXIT_END, EXIT_TIMEOUT)
+    last_close = close[exit_index[open_ended]]
+    exit_price[open_ended] = np.where(is_long[open_ended], last_close, last_close + spread[exit_index[open_ended]])
+    
+    # Each trade opens on the first signal after the previous exit
+    following = np.searchsorted(entries, exit_index, side='right').tolist()
+    taken = []
+    position = 0
+    while position < len(entries):
+        taken.append(position)
+        position = following[position]
+    
+    trades = np.empty(len(taken), dtype=TRADE_DTYPE)
+    trades['entry_index'] = entries[taken] + start
+    trades['exit_index'] = exit_index[taken] + start
+    trades['direction'] = side[taken]
+    trades['entry_price'] = entry_price[taken]
+    trades['exit_price'] = exit_price[taken]
+    trades['reason'] = reason[taken]
+    
+    return trades
+
+# Function to summarize trades
+def trade_stats(trades, pnl, initial_balance=10000.0):
+    """Return trade count, hit rate, net profit and max drawdown (over closed trades)"""
+    equity = initial_balance + np.cumsum(pnl)
+    peak = np.maximum.accumulate(np.maximum(equity, initial_balance)) if len(pnl) else equity
+    wins = int(np.count_nonzero(pnl > 0))
+    
+    return {
+        "trades": len(trades),
+        "wins": wins,
+        "losses": len(trades) - wins,
+        "hitRate": wins / len(trades) if len(trades) else 0.0,
+        "netProfit": float(pnl.sum()),
+        "maxDrawdown": float(((peak - equity) / peak).max()) if len(pnl) else 0.0,
+        "exitReasons": {
+            name: int(np.count_nonzero(trades['reason'] == code))
+            for code, name in enumerate(EXIT_REASONS)
+        }
+    }
+
+# Function to run a backtest on price arrays
+def run_backtest(high, low, close, confidence_threshold=0.7, risk_reward_minimum=None,
+                 dynamic_stop_loss=False, stop_loss_atr=2.0, take_profit_atr=3.0,
+                 spread=0.0, commission=0.0, volume=100000, initial_balance=10000.0,
+                 max_bars_held=None, indicator_params=None, columns=None):
+    """Backtest the technical strategy of ForexModel over full price history.
+    
+    Indicators and signals are computed once for all bars (or taken from
+    ``columns``). A signal on a bar opens a position at its close (buys pay
+    the spread), with ATR based stop loss and take profit as in
+    ForexModel.build_prediction. Only one position is open at a time.
+    ``spread`` is in price units (scalar or per bar), ``commission`` is
+    charged per trade in account currency.
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    close = np.asarray(close, dtype=float)
+    spread = np.broadcast_to(np.asarray(spread, dtype=float), close.shape)
+    bars = len(close)
+    
+    if columns is None:
+        columns = indicator_columns(high, low, close, indicator_params)
+    
+    prediction, direction, sl_distance, tp_distance = trade_levels(
+        close, columns, confidence_threshold, risk_reward_minimum,
+        dynamic_stop_loss, stop_loss_atr, take_profit_atr
+    )
+    trades = simulate_trades(
+        high, low, close, spread, direction, sl_distance, tp_distance, max_bars_held=max_bars_held
+    )
+    pnl = (trades['exit_price'] - trades['entry_price']) * trades['direction'] * volume - commission
+    
+    # Equity curve (closed trades) and drawdown for every bar
+    equity = initial_balance + np.cumsum(np.bincount(trades['exit_index'], weights=pnl, minlength=bars))
+    peak = np.maximum.accumulate(np.maximum(equity, initial_balance))
+    drawdown = (peak - equity) / peak
+    
+    stats = trade_stats(trades, pnl, initial_balance)
+    stats.update({
+        "bars": bars,
+        "finalBalance": float(equity[-1]) if bars else float(initial_balance),
+        "maxDrawdown": float(drawdown.max()) if bars else 0.0
+    })
+    
+    return {
+        "stats": stats,
+        "trades": trades,
+        "pnl": pnl,
+        "equity": equity,
+        "drawdown": drawdown,
+        "prediction": prediction,
+        "direction": direction,
+        "regime": market_regimes(close, columns)
+    }
+
+# Function to backtest a symbol's market data
+def backtest(symbol, timeframe, features, data=None, data_path=None, **kwargs):
+    """Backtest market data (inline, .npy path or data source; see load_data) with the features' settings"""
+    model = ForexModel(symbol, timeframe, {}, {})
+    df = model.prepare_frame(load_data(symbol, data, data_path, timeframe, bars=None))
+    
+    settings = settings_from_features(features)
+    settings.update(kwargs)
+    
+    result = run_backtest(
+        df['high'].to_numpy(dtype=float),
+        df['low'].to_numpy(dtype=float),
+        df['close'].to_numpy(dtype=float),
+        **settings
+    )
+    result["time"] = df['time'].to_numpy()
+    
+    return result
+
+# Function to run a backtest and return JSON
+def run_backtest_command(symbol, timeframe, features_json, options_json="{}", data_path=None, max_points=1000):
+    """Run a backtest and return the statistics and a downsampled equity curve as JSON"""
+    try:
+        features = json.loads(features_json)
+        options = json.loads(options_json)
+        
+        result = backtest(symbol, timeframe, features, data_path=data_path, **options)
+        step = max(1, len(result["equity"]) // max_points)
+        
+        return json.dumps({
+            "success": True,
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "stats": result["stats"],
+            "equityCurve": {
+                "time": np.datetime_as_string(result["time"][::step].astype('datetime64[s]')).tolist(),
+                "equity": result["equity"][::step].tolist(),
+                "drawdown": result["drawdown"][::step].tolist()
+            }
+        })
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "message": f"Backtest error: {str(e)}"
+        })
+
+# Main execution
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(json.dumps({
+            "success": False,
+            "message": "Missing arguments. Required: symbol, timeframe, features_json [options_json] [data_path]"
+        }))
+        sys.exit(1)
+    
+    options_json = sys.argv[4] if len(sys.argv) > 4 else "{}"
+    data_path = sys.argv[5] if len(sys.argv) > 5 else None
+    
+    print(run_backtest_command(sys.argv[1], sys.argv[2], sys.argv[3], options_json, data_path))
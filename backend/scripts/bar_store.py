@@ -0,0 +1,334 @@
+import os
+import sys
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.market_data import RATES_DTYPE, check_path_name
+
+# Bar length in seconds for each supported timeframe
+TIMEFRAME_SECONDS = {
+    "1m": 60,
+    "5m": 300,
+    "15m": 900,
+    "30m": 1800,
+    "1h": 3600,
+    "4h": 14400,
+    "1d": 86400
+}
+
+# Environment variable holding the bar store directory (the store is disabled when unset)
+BAR_STORE_ENV = "BAR_STORE_DIR"
+
+# Most bars kept per symbol/timeframe (0: unlimited)
+BAR_STORE_MAX_BARS = int(os.environ.get("BAR_STORE_MAX_BARS", 200000))
+
+# File naming the current version directory of a series
+CURRENT_FILE = "CURRENT"
+
+# Marker of a history holding every bar the broker had (or all the store keeps)
+COMPLETE_FILE = "complete"
+
+class BarStore:
+    """Local bar history: one append-only file per field per symbol/timeframe.
+    
+    Files live in a version directory of <directory>/<symbol>/<timeframe>,
+    named by its CURRENT file, as <field>.bin holding raw values of the
+    RATES_DTYPE field, sorted by time. The time column is written last, so
+    its length is the number of complete bars even if an append was
+    interrupted. Reads memory-map the files, so only the pages a query
+    touches are loaded. Rewrites go to a new version directory and switch
+    CURRENT with one rename. Histories longer than ``max_bars`` are trimmed
+    to their newest ``max_bars`` bars. Writers of a series hold its
+    <timeframe>.lock file, so processes sharing the store don't interleave
+    appends and rewrites.
+    """
+    
+    def __init__(self, directory, max_bars=BAR_STORE_MAX_BARS):
+        self.directory = directory
+        self.max_bars = max_bars
+        self.held = threading.local()
+    
+    @classmethod
+    def from_env(cls):
+        """Return the store configured by BAR_STORE_DIR, or None"""
+        directory = os.environ.get(BAR_STORE_ENV)
+        return cls(directory) if directory else None
+    
+    def series_path(self, symbol, timeframe):
+        return os.path.join(self.directory, check_path_name(symbol), check_path_name(timeframe, "timeframe"))
+    
+    @contextmanager
+    def lock(self, symbol, timeframe):
+        """Hold the write lock of a series (reentrant within a thread)"""
+        lock_path = self.series_path(symbol, timeframe) + ".lock"
+        held = self.held.__dict__.setdefault("paths", {})
+        if lock_path in held:
+            held[lock_path] += 1
+            try:
+                yield
+            finally:
+                held[lock_path] -= 1
+            return
+        
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, "a+b") as f:
+            _lock_file(f)
+            held[lock_path] = 1
+            try:
+                yield
+            finally:
+                del held[lock_path]
+                _unlock_file(f)
+    
+    def path(self, symbol, timeframe):
+        """Directory holding the current column files of a series"""
+        series_path = self.series_path(symbol, timeframe)
+        try:
+            with open(os.path.join(series_path, CURRENT_FILE)) as f:
+                return os.path.join(series_path, f.read().strip())
+        except OSError:
+            # Never rewritten: the columns live in the series directory
+            return series_path
+    
+    def count(self, symbol, timeframe):
+        """Number of stored bars"""
+        return _count(self.path(symbol, timeframe))
+    
+    def column(self, symbol, timeframe, field):
+        """Memory-map one stored column"""
+        return _column(self.path(symbol, timeframe), field)
+    
+    def last_time(self, symbol, timeframe):
+        """Timestamp of the newest stored bar, or None"""
+        times = self.column(symbol, timeframe, 'time')
+        return int(times[-1]) if len(times) else None
+    
+    def is_complete(self, symbol, timeframe):
+        """Whether the stored history holds every bar the broker had when it was written"""
+        return os.path.exists(os.path.join(self.path(symbol, timeframe), COMPLETE_FILE))
+    
+    def append(self, symbol, timeframe, rates):
+        """Add bars newer than the stored ones and return how many were appended.
+        
+        A bar with the same time as the newest stored one (the bar that was
+        still forming at the last sync) replaces it. Older bars are ignored.
+        """
+        with self.lock(symbol, timeframe):
+            return self._append(symbol, timeframe, rates)
+    
+    def _append(self, symbol, timeframe, rates):
+        rates = np.sort(np.asarray(rates), order='time')
+        path = self.path(symbol, timeframe)
+        os.makedirs(path, exist_ok=True)
+        
+        count = self.count(symbol, timeframe)
+        last = self.last_time(symbol, timeframe)
+        
+        if last is not None:
+            # Update the bar that was still forming
+            same = rates[rates['time'] == last]
+            if len(same):
+                for field in RATES_DTYPE.names:
+                    stored = np.memmap(os.path.join(path, f"{field}.bin"), dtype=RATES_DTYPE[field], mode='r+', shape=(count,))
+                    stored[-1] = same[-1][field]
+                    stored.flush()
+                    del stored
+            
+            rates = rates[rates['time'] > last]
+        
+        if len(rates) == 0:
+            return 0
+        
+        _write_columns(path, rates, count)
+        
+        # Trim a quarter past the limit, so trimming rewrites rarely
+        if self.max_bars and count + len(rates) > self.max_bars + self.max_bars // 4:
+            self._replace(symbol, timeframe, _slice(path, count + len(rates) - self.max_bars, count + len(rates)), True)
+        
+        return len(rates)
+    
+    def replace(self, symbol, timeframe, rates, complete=False):
+        """Rewrite the whole history of a symbol/timeframe.
+        
+        ``complete`` marks the history as all the broker has (see
+        sync_bars); a history trimmed to ``max_bars`` is always complete.
+        """
+        with self.lock(symbol, timeframe):
+            self._replace(symbol, timeframe, rates, complete)
+    
+    def _replace(self, symbol, timeframe, rates, complete):
+        rates = np.sort(np.asarray(rates), order='time')
+        if self.max_bars and len(rates) > self.max_bars:
+            rates = rates[-self.max_bars:]
+            complete = True
+        
+        series_path = self.series_path(symbol, timeframe)
+        previous = os.path.basename(self.path(symbol, timeframe))
+        version = f"v{time.time_ns()}.{os.getpid()}"
+        
+        version_path = os.path.join(series_path, version)
+        os.makedirs(version_path)
+        _write_columns(version_path, rates, 0)
+        if complete:
+            open(os.path.join(version_path, COMPLETE_FILE), "w").close()
+        
+        # Switch readers to the new version with one rename
+        current_tmp = os.path.join(series_path, f"{CURRENT_FILE}.{version}.tmp")
+        with open(current_tmp, "w") as f:
+            f.write(version)
+        os.replace(current_tmp, os.path.join(series_path, CURRENT_FILE))
+        
+        # Keep the version just replaced for readers still on it; drop older ones
+        for name in os.listdir(series_path):
+            if name.startswith("v") and name not in (version, previous):
+                shutil.rmtree(os.path.join(series_path, name), ignore_errors=True)
+            elif name.endswith(".bin") or name == COMPLETE_FILE:
+                # Columns of a series that had never been rewritten
+                os.remove(os.path.join(series_path, name))
+    
+    def read(self, symbol, timeframe, start=None, end=None):
+        """Return bars with start <= time < end (epoch seconds) as a rates array"""
+        path = self.path(symbol, timeframe)
+        times = _column(path, 'time')
+        first = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+        last = len(times) if end is None else int(np.searchsorted(times, end, side='left'))
+        return _slice(path, first, last)
+    
+    def tail(self, symbol, timeframe, bars):
+        """Return the newest ``bars`` bars as a rates array"""
+        path = self.path(symbol, timeframe)
+        count = _count(path)
+        return _slice(path, max(0, count - bars), count)
+    
+    def slice(self, symbol, timeframe, first, last):
+        """Copy rows [first, last) into a rates array"""
+        return _slice(self.path(symbol, timeframe), first, last)
+    
+    def gaps(self, symbol, timeframe, start=None, end=None, skip_weekends=True):
+        """Find missing bars between stored ones.
+        
+        Returns (from_time, to_time, missing_bars) tuples, where from/to are
+        the stored bars around the gap. Gaps of at most three days that
+        include a Saturday are market closures and are skipped unless
+        ``skip_weekends`` is False.
+        """
+        step = TIMEFRAME_SECONDS[timeframe]
+        times = self.read(symbol, timeframe, start, end)['time']
+        
+        delta = np.diff(times)
+        positions = np.flatnonzero(delta > step)
+        before = times[positions]
+        after = times[positions + 1]
+        
+        if skip_weekends and len(positions):
+            # First and last missing day (1970-01-01 was a Thursday)
+            first_day = (before + step) // 86400
+            last_day = (after - 1) // 86400
+            saturday = first_day + (5 - (first_day + 3) % 7) % 7
+            weekend = (saturday <= last_day) & (after - before <= 3 * 86400 + step)
+            before, after = before[~weekend], after[~weekend]
+        
+        return [
+            (int(a), int(b), int((b - a) // step - 1))
+            for a, b in zip(before, after)
+        ]
+
+# Function to take an exclusive lock on an open file
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        f.seek(0)
+        # LK_LOCK gives up after 10 one-second retries
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+# Function to release a lock taken by _lock_file
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Function to count the bars in a column directory
+def _count(path):
+    try:
+        size = os.path.getsize(os.path.join(path, "time.bin"))
+    except OSError:
+        return 0
+    return size // RATES_DTYPE['time'].itemsize
+
+# Function to memory-map one column of a column directory
+def _column(path, field):
+    count = _count(path)
+    if count == 0:
+        return np.empty(0, dtype=RATES_DTYPE[field])
+    return np.memmap(os.path.join(path, f"{field}.bin"), dtype=RATES_DTYPE[field], mode='r', shape=(count,))
+
+# Function to copy rows [first, last) of a column directory into a rates array
+def _slice(path, first, last):
+    rates = np.empty(max(0, last - first), dtype=RATES_DTYPE)
+    for field in RATES_DTYPE.names:
+        rates[field] = _column(path, field)[first:last]
+    return rates
+
+# Function to append rates to the column files of a directory
+def _write_columns(path, rates, count):
+    # Data columns first, time last: a partial append is invisible
+    for field in RATES_DTYPE.names[1:] + ('time',):
+        file_path = os.path.join(path, f"{field}.bin")
+        with open(file_path, "r+b" if os.path.exists(file_path) else "wb") as f:
+            # Drop the leftovers of an interrupted append
+            f.truncate(count * RATES_DTYPE[field].itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(rates[field], dtype=RATES_DTYPE[field]).tobytes())
+
+# Function to bring a symbol/timeframe up to date and return its newest bars
+def sync_bars(store, symbol, timeframe, bars, fetch_latest, fetch_since):
+    """Serve the newest ``bars`` bars from the store, fetching only what's missing.
+    
+    ``fetch_latest(count)`` returns the newest ``count`` bars from the broker
+    and ``fetch_since(timestamp)`` the bars from ``timestamp`` onwards. Only
+    bars newer than the last stored one are fetched; when the store holds
+    fewer than ``bars`` bars the history is fetched once and rewritten. A
+    broker returning fewer than ``bars`` bars has no older history, so the
+    store is marked complete and later syncs only fetch new bars. The
+    series stays locked for the whole sync, so concurrent syncs of it fetch
+    once.
+    """
+    with store.lock(symbol, timeframe):
+        return _sync_bars(store, symbol, timeframe, bars, fetch_latest, fetch_since)
+
+# Function to sync a symbol/timeframe whose lock is held
+def _sync_bars(store, symbol, timeframe, bars, fetch_latest, fetch_since):
+    if store.count(symbol, timeframe) < bars and not store.is_complete(symbol, timeframe):
+        rates = fetch_latest(bars)
+        if rates is None or len(rates) == 0:
+            return None
+        store.replace(symbol, timeframe, rates, complete=len(rates) < bars)
+    else:
+        # Refetch from the last stored bar, which may still have been forming
+        rates = fetch_since(store.last_time(symbol, timeframe))
+        if rates is not None and len(rates):
+            store.append(symbol, timeframe, rates)
+    
+    return store.tail(symbol, timeframe, bars)
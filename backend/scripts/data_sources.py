@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.bar_store import BarStore
+
+# Seconds a fetched series is shared with later requests for the same bars
+BAR_FETCH_TTL = 1.0
+
+# Bars requested from MT5 when a caller asks for the whole history
+MT5_MAX_BARS = 100000
+
+class InlineSource:
+    """Bars sent with the request, as {"<symbol>/<timeframe>": rows or columnar payload}"""
+    
+    def __init__(self, series):
+        self.series = series
+        self.key = None
+    
+    def fetch(self, symbol, timeframe, bars):
+        return self.series.get(f"{symbol}/{timeframe}")
+
+class BarStoreSource:
+    """Bars already synced into a local BarStore"""
+    
+    def __init__(self, store):
+        self.store = store
+        self.key = ("store", store.directory)
+    
+    def fetch(self, symbol, timeframe, bars):
+        if not self.store.count(symbol, timeframe):
+            return None
+        if bars is None:
+            return self.store.read(symbol, timeframe)
+        return self.store.tail(symbol, timeframe, bars)
+
+class MT5Source:
+    """Bars read on the MT5 session of this process (see mt5_connection.fetch_rates).
+    
+    The session is kept open between fetches, as in the SERVE daemon, so
+    predictions don't each pay for initialize, login and shutdown.
+    """
+    
+    def __init__(self, server, login):
+        self.server = server
+        self.login = login
+        self.key = ("mt5", server, str(login))
+        self.error = None
+    
+    def fetch(self, symbol, timeframe, bars):
+        # Imported here, so processes without the MetaTrader5 package can use the other sources
+        from scripts import mt5_connection
+        
+        mt5_connection.keep_session_open()
+        rates, self.error = mt5_connection.fetch_rates(
+            self.server, self.login, symbol, timeframe, MT5_MAX_BARS if bars is None else bars
+        )
+        return rates
+
+# Function to build data sources from a request
+def data_sources(spec):
+    """Build sources from a dict such as {"type": "mt5", "server": ..., "login": ...},
+    {"type": "store", "directory": ...} or {"type": "inline", "series": {...}}, or a
+    list of them tried in order. None gives the sources configured by the environment.
+    """
+    if spec is None:
+        store = BarStore.from_env()
+        return [BarStoreSource(store)] if store is not None else []
+    
+    if isinstance(spec, (list, tuple)):
+        return [source for item in spec for source in data_sources(item)]
+    
+    kind = spec.get("type")
+    if kind == "mt5":
+        return [MT5Source(spec["server"], spec["login"])]
+    if kind == "store":
+        return [BarStoreSource(BarStore(spec["directory"]))]
+    if kind == "inline":
+        return [InlineSource(spec.get("series", {}))]
+    
+    raise ValueError(f"Unknown data source: {kind}")
+
+class BarFetcher:
+    """Shares fetched bars between the models of one process.
+    
+    A fetch tries the sources in order and keeps the first result for ``ttl``
+    seconds, keyed by the sources, symbol, timeframe and bar count. Requests
+    for the same bars in that window (or arriving while the fetch is still
+    running) get the same series instead of fetching again.
+    """
+    
+    def __init__(self, ttl=BAR_FETCH_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.fetches = 0
+        self.shared = 0
+    
+    def fetch(self, symbol, timeframe, bars, sources):
+        """Return the bars from the first source that has them, or None"""
+        # Request-scoped sources (key None) are not shared
+        if any(source.key is None for source in sources):
+            return _first(sources, symbol, timeframe, bars)
+        
+        key = (tuple(source.key for source in sources), symbol, timeframe, bars)
+        
+        with self.lock:
+            key_lock = self.locks.setdefault(key, threading.Lock())
+        
+        with key_lock:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and self.clock() < entry[1]:
+                    self.shared += 1
+                    return entry[0]
+            
+            data = _first(sources, symbol, timeframe, bars)
+            
+            with self.lock:
+                self.fetches += 1
+                now = self.clock()
+                
+                # Drop expired series, so the cache only holds what is being shared
+                for expired in [k for k, (_, expiry) in self.entries.items() if expiry <= now]:
+                    del self.entries[expired]
+                    self.locks.pop(expired, None)
+                
+                if data is not None:
+                    self.entries[key] = (data, now + self.ttl)
+                    self.locks[key] = key_lock
+                else:
+                    self.locks.pop(key, None)
+            
+            return data
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.locks.clear()
+    
+    def stats(self):
+        with self.lock:
+            return {"fetches": self.fetches, "shared": self.shared, "series": len(self.entries)}
+
+# Function to fetch from the first source that has the bars
+def _first(sources, symbol, timeframe, bars):
+    for source in sources:
+        data = source.fetch(symbol, timeframe, bars)
+        if data is not None and len(data):
+            return data
+    return None
@@ -0,0 +1,100 @@
+import json
+import functools
+from datetime import date, datetime
+import numpy as np
+
+# Optional fast encoders; JSON through the standard library is always available
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Encoding used unless a request negotiates another one
+DEFAULT_ENCODING = "json"
+
+# Function to convert values the encoders cannot handle natively
+def _default(value):
+    """Encode NumPy scalars and arrays, and datetimes, as plain values"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+# Function to encode a message as JSON text
+def dumps(message):
+    """Return ``message`` as JSON text; NumPy values need no coercion by the caller"""
+    return json.dumps(message, default=_default)
+
+def _encode_json(message):
+    return dumps(message).encode("utf-8")
+
+def _encode_orjson(message):
+    return orjson.dumps(message, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+def _encode_msgpack(message):
+    return msgpack.packb(message, default=_default, use_bin_type=True)
+
+def _decode_msgpack(payload):
+    return msgpack.unpackb(payload, raw=False)
+
+# Encoders by name: (wire format, encode). orjson writes JSON, so it shares the json wire format
+ENCODINGS = {
+    "json": ("json", _encode_json),
+    "orjson": ("json", _encode_orjson),
+    "msgpack": ("msgpack", _encode_msgpack)
+}
+
+# Function to list the encodings usable in this process
+def available_encodings():
+    available = ["json"]
+    if orjson is not None:
+        available.append("orjson")
+    if msgpack is not None:
+        available.append("msgpack")
+    return available
+
+# Function to pick the encoding of a response
+def negotiate(requested):
+    """Return the requested encoding if it is usable here, else the JSON default"""
+    return requested if requested in available_encodings() else DEFAULT_ENCODING
+
+# Function to encode a message
+def encode(message, encoding=DEFAULT_ENCODING):
+    """Return (wire format, payload bytes) for ``message`` in a negotiated encoding"""
+    wire_format, encoder = ENCODINGS[negotiate(encoding)]
+    return wire_format, encoder(message)
+
+# Function to decode a payload
+def decode(payload, wire_format="json"):
+    """Decode a payload of the given wire format; malformed payloads raise ValueError"""
+    if wire_format == "msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack payload received but msgpack is not installed")
+        try:
+            return _decode_msgpack(payload)
+        except Exception as e:
+            raise ValueError(f"Invalid msgpack payload: {str(e)}")
+    return json.loads(payload)
+
+# Function to make a command that builds a response dict return JSON text
+def json_response(func):
+    """Decorate a command returning a response dict.
+    
+    Calls return the response as JSON text, as the script has always printed
+    it; ``func.response`` returns the dict, for callers that encode it
+    themselves (see negotiate).
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return dumps(func(*args, **kwargs))
+    
+    wrapper.response = func
+    return wrapper
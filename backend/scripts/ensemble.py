@@ -0,0 +1,186 @@
+import os
+import time
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Largest number of frames run through the deep learning models in one call
+DL_MAX_BATCH = int(os.environ.get("DL_MAX_BATCH", 64))
+
+# Milliseconds a batch waits for requests from concurrent callers (0: only batch what is already queued)
+DL_MAX_WAIT_MS = float(os.environ.get("DL_MAX_WAIT_MS", 2))
+
+class _Request:
+    __slots__ = ("item", "result", "error", "done")
+    
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.error = None
+        self.done = False
+
+class MicroBatcher:
+    """Collects items from concurrent callers into batches for one function.
+    
+    ``func`` takes a list of items and returns one result per item. A caller
+    finding no batch in flight leads the next one: it waits until
+    ``max_batch`` items are queued or ``max_wait`` seconds have passed, runs
+    ``func`` on the queue without holding the lock, and hands every caller
+    its results. Callers arriving meanwhile queue up for the following
+    batch, so a lone caller pays at most ``max_wait`` and busy periods run
+    few, large batches.
+    """
+    
+    def __init__(self, func, max_batch=DL_MAX_BATCH, max_wait=DL_MAX_WAIT_MS / 1000):
+        self.func = func
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = []
+        self.leading = False
+        self.condition = threading.Condition()
+        self.batches = 0
+        self.items = 0
+    
+    def submit(self, items):
+        """Return func's results for ``items``, computed together with other callers' items"""
+        requests = [_Request(item) for item in items]
+        
+        with self.condition:
+            self.pending.extend(requests)
+            self.condition.notify_all()
+            
+            while not all(request.done for request in requests):
+                if self.leading:
+                    self.condition.wait()
+                    continue
+                
+                # Lead the next batch, giving concurrent callers until the deadline to join
+                self.leading = True
+                deadline = time.monotonic() + self.max_wait
+                while len(self.pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                
+                batch = self.pending[:self.max_batch]
+                del self.pending[:self.max_batch]
+                self._run(batch)
+                
+                self.leading = False
+                self.condition.notify_all()
+        
+        for request in requests:
+            if request.error is not None:
+                raise request.error
+        return [request.result for request in requests]
+    
+    def _run(self, batch):
+        # Called with the lock held; releases it while func runs
+        self.condition.release()
+        try:
+            results = self.func([request.item for request in batch])
+            error = None
+        except Exception as e:
+            results = [None] * len(batch)
+            error = e
+        finally:
+            self.condition.acquire()
+        
+        for request, result in zip(batch, results):
+            request.result = result
+            request.error = error
+            request.done = True
+        
+        self.batches += 1
+        self.items += len(batch)
+    
+    def stats(self):
+        with self.condition:
+            return {"batches": self.batches, "items": self.items, "pending": len(self.pending)}
+
+class EnsembleRunner:
+    """Runs the members of a model ensemble concurrently on the same frames.
+    
+    Members are called on a thread pool, so runtimes that release the GIL
+    during inference (TensorFlow, ONNX Runtime, TFLite) overlap instead of
+    running one after the other.
+    """
+    
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = threading.Lock()
+    
+    def run(self, members, dfs):
+        """Return {member name: [(prediction, confidence), ...]} for the frames"""
+        names = list(members)
+        calls = [functools.partial(predict_frames, members[name], dfs) for name in names]
+        
+        if len(calls) == 1:
+            return {names[0]: list(calls[0]())}
+        
+        executor = self._executor(len(calls))
+        futures = [executor.submit(call) for call in calls]
+        return {name: list(future.result()) for name, future in zip(names, futures)}
+    
+    def _executor(self, workers):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers or workers,
+                    thread_name_prefix="ensemble"
+                )
+            return self.executor
+    
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+            self.executor = None
+
+class ModelSet:
+    """The deep learning model(s) of one configuration and the batcher feeding them.
+    
+    ``models`` is one model or a dict of ensemble members. A set is shared by
+    every ForexModel with the same Deep Learning configuration, so
+    concurrent predictions for different symbols and timeframes join the
+    same micro-batches and the models are loaded once.
+    """
+    
+    def __init__(self, models, max_batch=DL_MAX_BATCH, max_wait=DL_MAX_WAIT_MS / 1000):
+        self.models = models
+        self.batcher = MicroBatcher(self.run, max_batch, max_wait)
+        self.ensemble = EnsembleRunner()
+    
+    def predict(self, dfs):
+        """Return (prediction, confidence) for each frame, batched with concurrent callers"""
+        return self.batcher.submit(dfs)
+    
+    def run(self, dfs):
+        """Run the model, or all ensemble members concurrently, on a batch of frames"""
+        if not isinstance(self.models, dict):
+            return predict_frames(self.models, dfs)
+        
+        # Ensemble: weighted average based on confidence
+        return combine_outputs(self.ensemble.run(self.models, dfs))
+
+# Function to run a deep learning model on several frames
+def predict_frames(model, dfs):
+    """Return (prediction, confidence) of a model for each frame"""
+    return [model.predict(df) for df in dfs]
+
+# Function to combine the outputs of ensemble members
+def combine_outputs(member_outputs):
+    """Confidence-weighted average of the members' predictions, with the highest confidence"""
+    combined = []
+    for outputs in zip(*member_outputs.values()):
+        total_conf = sum(confidence for _, confidence in outputs)
+        if total_conf > 0:
+            combined.append((
+                sum(prediction * confidence for prediction, confidence in outputs) / total_conf,
+                max(confidence for _, confidence in outputs)
+            ))
+        else:
+            combined.append((0.0, 0.0))
+    return combined
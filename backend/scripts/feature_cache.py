@@ -0,0 +1,144 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+class FeatureCache:
+    """Bounded LRU cache of preprocessed feature frames.
+    
+    Entries expire after ``ttl`` seconds and the least recently used ones are
+    evicted when there are more than ``max_entries`` or their frames use more
+    than ``max_bytes``. Each entry may carry the streaming indicator state
+    after its last bar, so a frame that only adds bars to a cached one can be
+    extended (see get_prefix). Hit, miss, extension, eviction and expiration
+    counts are kept for monitoring.
+    """
+    
+    def __init__(self, max_entries=512, ttl=300, max_bytes=128 * 1024 * 1024, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.latest = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.extensions = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def digest(df):
+        """Hash every bar of a frame, column by column"""
+        digest = hashlib.blake2b(digest_size=16)
+        for name in df.columns:
+            values = df[name].to_numpy()
+            if values.dtype == object:
+                values = pd.util.hash_pandas_object(df[name], index=False).to_numpy()
+            digest.update(str(name).encode())
+            digest.update(np.ascontiguousarray(values).view(np.uint8))
+        return digest.hexdigest()
+    
+    @classmethod
+    def make_key(cls, symbol, timeframe, params, df):
+        """Key a prepared frame by symbol, timeframe, indicator parameters and its bars.
+        
+        All bars are hashed, so a broker correcting an old bar is a new key.
+        The column buffers are hashed directly, which keeps this cheap next
+        to computing the features.
+        """
+        last_time = df['time'].iloc[-1] if len(df) else None
+        
+        return (symbol, timeframe, tuple(sorted(params.items())), len(df), str(last_time), cls.digest(df))
+    
+    def get(self, key):
+        """Return the cached frame (a shallow copy) or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            df, size, expires, _ = entry
+            if self.clock() >= expires:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return df.copy(deep=False)
+    
+    def get_prefix(self, key, bars):
+        """Return the latest cached entry of key's series if its bars start ``bars``.
+        
+        ``key`` is the make_key of the prepared frame ``bars``. Returns
+        (features, length, state): the cached features, the number of bars
+        they cover and the indicator state after them (None if the entry was
+        computed in one pass), or None when no entry of the series is a prefix.
+        """
+        with self.lock:
+            cached_key = self.latest.get(key[:3])
+            entry = self.entries.get(cached_key)
+            if entry is None or self.clock() >= entry[2]:
+                return None
+            df, _, _, state = entry
+        
+        length = cached_key[3]
+        if not 0 < length < len(bars) or str(bars['time'].iloc[length - 1]) != cached_key[4]:
+            return None
+        if self.digest(bars.iloc[:length]) != cached_key[5]:
+            return None
+        
+        with self.lock:
+            self.extensions += 1
+        return df.copy(deep=False), length, state
+    
+    def put(self, key, df, state=None):
+        """Store a frame (and the indicator state after it), evicting least recently used entries to stay within bounds"""
+        size = int(df.memory_usage(index=True, deep=False).sum())
+        if size > self.max_bytes:
+            return
+        
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            
+            self.entries[key] = (df.copy(deep=False), size, self.clock() + self.ttl, state)
+            self.bytes += size
+            if isinstance(key, tuple):
+                self.latest[key[:3]] = key
+            
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.latest.clear()
+            self.bytes = 0
+    
+    def stats(self):
+        """Return cache counters"""
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "extensions": self.extensions,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+    
+    def _remove(self, key):
+        _, size, _, _ = self.entries.pop(key)
+        self.bytes -= size
+        if isinstance(key, tuple) and self.latest.get(key[:3]) == key:
+            del self.latest[key[:3]]
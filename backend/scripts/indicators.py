@@ -0,0 +1,405 @@
+import math
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+NAN = float('nan')
+
+class RollingWindow:
+    """Fixed-size window with running sums, matching pandas rolling(window).
+    
+    A statistic is NaN until the window is full or while it holds a NaN.
+    Running sums are re-summed exactly once per window length to stop
+    floating-point drift, which keeps updates amortized O(1).
+    """
+    
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.nan_count = 0
+        self.pushes = 0
+        self.anchor = None
+        self.total = 0.0
+        self.total_sq = 0.0
+    
+    def push(self, value):
+        if self.anchor is None and value == value:
+            self.anchor = value
+        
+        self.values.append(value)
+        self.add(value, 1)
+        if len(self.values) > self.size:
+            self.add(self.values.popleft(), -1)
+        
+        self.pushes += 1
+        if self.pushes % self.size == 0:
+            self.resync()
+    
+    def add(self, value, sign):
+        if value != value:
+            self.nan_count += sign
+            return
+        shifted = value - self.anchor
+        self.total += sign * shifted
+        self.total_sq += sign * shifted * shifted
+    
+    def resync(self):
+        valid = [value for value in self.values if value == value]
+        self.anchor = valid[0] if valid else None
+        self.total = math.fsum(value - self.anchor for value in valid)
+        self.total_sq = math.fsum((value - self.anchor) ** 2 for value in valid)
+    
+    def ready(self):
+        return len(self.values) == self.size and self.nan_count == 0
+    
+    def sum(self):
+        if not self.ready():
+            return NAN
+        return self.total + self.anchor * self.size
+    
+    def mean(self):
+        if not self.ready():
+            return NAN
+        return self.total / self.size + self.anchor
+    
+    def std(self):
+        if not self.ready() or self.size < 2:
+            return NAN
+        variance = (self.total_sq - self.total * self.total / self.size) / (self.size - 1)
+        return math.sqrt(max(variance, 0.0))
+    
+    def copy(self):
+        window = RollingWindow.__new__(RollingWindow)
+        window.__dict__.update(self.__dict__)
+        window.values = deque(self.values)
+        return window
+
+class EWM:
+    """Exponentially weighted mean, matching pandas ewm(span, adjust=False)"""
+    
+    def __init__(self, span):
+        self.alpha = 2.0 / (span + 1.0)
+        self.value = None
+    
+    def push(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value = self.alpha * value + (1.0 - self.alpha) * self.value
+        return self.value
+    
+    def copy(self):
+        ewm = EWM.__new__(EWM)
+        ewm.__dict__.update(self.__dict__)
+        return ewm
+
+def _ratio(numerator, denominator):
+    """Division with pandas semantics for zero denominators"""
+    if denominator == 0:
+        if numerator == 0 or numerator != numerator:
+            return NAN
+        return math.copysign(math.inf, numerator)
+    return numerator / denominator
+
+class IncrementalIndicators:
+    """Streaming version of the ForexModel indicators.
+    
+    ``update(bar)`` appends one bar in O(1) and returns the latest feature
+    row: the bar fields plus returns, log_returns, sma_20, sma_50, rsi, atr,
+    bollinger_upper, bollinger_lower, macd, macd_signal and adx. Values match
+    ForexModel.preprocess_data and calculate_adx on the same history within
+    floating-point tolerance; they are NaN until enough bars have been seen.
+    """
+    
+    def __init__(self, sma_fast=20, sma_slow=50, rsi_period=14, atr_period=14,
+                 bollinger_period=20, bollinger_std=2, macd_fast=12, macd_slow=26,
+                 macd_signal=9, adx_period=14):
+        self.bollinger_std = bollinger_std
+        
+        self.sma_fast = RollingWindow(sma_fast)
+        self.sma_slow = RollingWindow(sma_slow)
+        self.gains = RollingWindow(rsi_period)
+        self.losses = RollingWindow(rsi_period)
+        self.atr_tr = RollingWindow(atr_period)
+        self.bollinger = RollingWindow(bollinger_period)
+        self.macd_fast = EWM(macd_fast)
+        self.macd_slow = EWM(macd_slow)
+        self.macd_signal = EWM(macd_signal)
+        self.adx_tr = RollingWindow(adx_period)
+        self.adx_plus_dm = RollingWindow(adx_period)
+        self.adx_minus_dm = RollingWindow(adx_period)
+        self.adx_dx = RollingWindow(adx_period)
+        
+        self.prev_bar = None
+        self.bars = 0
+    
+    def update(self, bar):
+        """Append one bar and return its feature row"""
+        high = float(bar['high'])
+        low = float(bar['low'])
+        close = float(bar['close'])
+        prev = self.prev_bar
+        
+        row = dict(bar)
+        
+        if prev is None:
+            row['returns'] = NAN
+            row['log_returns'] = NAN
+            delta = NAN
+            true_range = high - low
+            plus_dm = minus_dm = 0.0
+        else:
+            prev_high, prev_low, prev_close = prev
+            row['returns'] = _ratio(close, prev_close) - 1
+            row['log_returns'] = math.log(close / prev_close) if prev_close and close / prev_close > 0 else NAN
+            delta = close - prev_close
+            true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+            
+            # Directional movement, as in ForexModel.calculate_adx
+            up_move = high - prev_high
+            down_move = low - prev_low
+            plus_dm = up_move if up_move > 0 and up_move > abs(down_move) else 0.0
+            minus_dm = abs(down_move) if down_move < 0 and abs(down_move) > plus_dm else 0.0
+        
+        # Moving averages
+        self.sma_fast.push(close)
+        self.sma_slow.push(close)
+        row['sma_20'] = self.sma_fast.mean()
+        row['sma_50'] = self.sma_slow.mean()
+        
+        # RSI
+        self.gains.push(delta if delta > 0 else 0.0)
+        self.losses.push(-delta if delta < 0 else 0.0)
+        row['rsi'] = 100 - (100 / (1 + _ratio(self.gains.mean(), self.losses.mean())))
+        
+        # ATR
+        self.atr_tr.push(true_range)
+        row['atr'] = self.atr_tr.mean()
+        
+        # Bollinger bands
+        self.bollinger.push(close)
+        middle = self.bollinger.mean()
+        std = self.bollinger.std()
+        row['bollinger_upper'] = middle + std * self.bollinger_std
+        row['bollinger_lower'] = middle - std * self.bollinger_std
+        
+        # MACD
+        macd = self.macd_fast.push(close) - self.macd_slow.push(close)
+        row['macd'] = macd
+        row['macd_signal'] = self.macd_signal.push(macd)
+        
+        # ADX
+        self.adx_tr.push(true_range)
+        self.adx_plus_dm.push(plus_dm)
+        self.adx_minus_dm.push(minus_dm)
+        smoothed_tr = self.adx_tr.sum()
+        plus_di = 100 * _ratio(self.adx_plus_dm.sum(), smoothed_tr)
+        minus_di = 100 * _ratio(self.adx_minus_dm.sum(), smoothed_tr)
+        self.adx_dx.push(100 * _ratio(abs(plus_di - minus_di), plus_di + minus_di))
+        row['adx'] = self.adx_dx.mean()
+        
+        self.prev_bar = (high, low, close)
+        self.bars += 1
+        
+        return row
+    
+    def peek(self, bar):
+        """Return the feature row for ``bar`` without appending it"""
+        return self.copy().update(bar)
+    
+    def copy(self):
+        """Return an independent copy of the indicator state"""
+        engine = IncrementalIndicators.__new__(IncrementalIndicators)
+        for name, value in self.__dict__.items():
+            engine.__dict__[name] = value.copy() if isinstance(value, (RollingWindow, EWM)) else value
+        return engine
+
+# Function to compute a rolling sum along the bar axis
+def rolling_sum_2d(values, window):
+    """Rolling sum over the last axis; NaN until the window is full or holds a NaN"""
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] >= window:
+        np.sum(sliding_window_view(values, window, axis=-1), axis=-1, out=out[..., window - 1:])
+    return out
+
+# Function to compute a rolling mean along the bar axis
+def rolling_mean_2d(values, window):
+    """Rolling mean over the last axis; NaN until the window is full or holds a NaN"""
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] >= window:
+        np.mean(sliding_window_view(values, window, axis=-1), axis=-1, out=out[..., window - 1:])
+    return out
+
+# Function to compute a rolling standard deviation along the bar axis
+def rolling_std_2d(values, window, ddof=1):
+    """Rolling sample standard deviation over the last axis"""
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] >= window:
+        np.std(sliding_window_view(values, window, axis=-1), axis=-1, ddof=ddof, out=out[..., window - 1:])
+    return out
+
+# Function to compute the true range family of indicators
+def true_range_kernel(high, low, close, atr_period=14, adx_period=14):
+    """Compute TR, ATR, +DM/-DM, +DI/-DI, DX and ADX together.
+    
+    Works on 1-D arrays or stacked (series x bars) arrays and shares the true
+    range and directional movement buffers between ATR and ADX. Results match
+    ForexModel.calculate_atr and calculate_adx.
+    """
+    shape = close.shape
+    buffer = np.empty(shape)
+    
+    prev_close = np.full(shape, np.nan)
+    prev_close[..., 1:] = close[..., :-1]
+    up_move = np.full(shape, np.nan)
+    np.subtract(high[..., 1:], high[..., :-1], out=up_move[..., 1:])
+    down_move = np.full(shape, np.nan)
+    np.subtract(low[..., 1:], low[..., :-1], out=down_move[..., 1:])
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # True range: max(high - low, |high - prev close|, |low - prev close|)
+        true_range = np.subtract(high, low)
+        np.abs(np.subtract(high, prev_close, out=buffer), out=buffer)
+        np.fmax(true_range, buffer, out=true_range)
+        np.abs(np.subtract(low, prev_close, out=buffer), out=buffer)
+        np.fmax(true_range, buffer, out=true_range)
+        
+        # Directional movement
+        abs_down = np.abs(down_move)
+        plus_dm = np.where((up_move > 0) & (up_move > abs_down), up_move, 0.0)
+        minus_dm = np.where((down_move < 0) & (abs_down > plus_dm), abs_down, 0.0)
+        
+        # Directional indices
+        smoothed_tr = rolling_sum_2d(true_range, adx_period)
+        plus_di = rolling_sum_2d(plus_dm, adx_period)
+        np.divide(plus_di, smoothed_tr, out=plus_di)
+        np.multiply(plus_di, 100, out=plus_di)
+        minus_di = rolling_sum_2d(minus_dm, adx_period)
+        np.divide(minus_di, smoothed_tr, out=minus_di)
+        np.multiply(minus_di, 100, out=minus_di)
+        
+        # DX and ADX
+        dx = np.abs(np.subtract(plus_di, minus_di, out=buffer), out=buffer)
+        np.divide(dx, plus_di + minus_di, out=dx)
+        np.multiply(dx, 100, out=dx)
+    
+    return {
+        'tr': true_range,
+        'atr': rolling_mean_2d(true_range, atr_period),
+        'plus_dm': plus_dm,
+        'minus_dm': minus_dm,
+        'plus_di': plus_di,
+        'minus_di': minus_di,
+        'dx': dx,
+        'adx': rolling_mean_2d(dx, adx_period)
+    }
+
+# Function to compute an exponential moving average along the bar axis
+def ewm_2d(values, span):
+    """EMA over axis 1 like pandas ewm(span, adjust=False), starting at each row's first value.
+    
+    Leading NaN padding stays NaN. The recursion is evaluated in blocks: a
+    scaled cumulative sum inside each block and a carry between blocks, so
+    the Python loop runs once per block instead of once per bar.
+    """
+    values = np.asarray(values, dtype=float)
+    alpha = 2.0 / (span + 1.0)
+    decay = 1.0 - alpha
+    if decay <= 0:
+        return values.copy()
+    
+    rows, bars = values.shape
+    padding = np.logical_and.accumulate(np.isnan(values), axis=1)
+    first = padding.sum(axis=1)
+    
+    # Scale each row's first value so the recursion starts exactly at it
+    x = np.where(padding, 0.0, values)
+    started = np.flatnonzero(first < bars)
+    x[started, first[started]] /= alpha
+    
+    # Keep decay ** -block bounded so the scaled sums stay accurate
+    block = max(1, min(bars, int(27.0 / -math.log(decay))))
+    blocks = -(-bars // block)
+    
+    stacked = np.zeros((rows, blocks * block))
+    stacked[:, :bars] = x
+    stacked = stacked.reshape(rows, blocks, block)
+    
+    powers = decay ** np.arange(block)
+    local = alpha * powers * np.cumsum(stacked / powers, axis=2)
+    
+    carry_weights = powers * decay
+    carry = np.zeros((rows, 1))
+    for b in range(blocks):
+        local[:, b] += carry * carry_weights
+        carry = local[:, b, -1:]
+    
+    out = local.reshape(rows, -1)[:, :bars]
+    out[padding] = np.nan
+    return out
+
+# Function to compute RSI along the bar axis
+def rsi_2d(close, period=14):
+    """RSI over axis 1 like ForexModel.calculate_rsi; NaN padding never counts as a move"""
+    padding = np.isnan(close)
+    delta = np.full(close.shape, np.nan)
+    delta[:, 1:] = close[:, 1:] - close[:, :-1]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gain = np.where(padding, np.nan, np.where(delta > 0, delta, 0.0))
+        loss = np.where(padding, np.nan, np.where(delta < 0, -delta, 0.0))
+        rs = rolling_mean_2d(gain, period) / rolling_mean_2d(loss, period)
+        return 100 - (100 / (1 + rs))
+
+# Function to compute Bollinger bands along the bar axis
+def bollinger_2d(close, period=20, std_dev=2):
+    """Return (upper, lower) bands over axis 1"""
+    middle = rolling_mean_2d(close, period)
+    std = rolling_std_2d(close, period)
+    return middle + std * std_dev, middle - std * std_dev
+
+# Function to compute MACD along the bar axis
+def macd_2d(close, fast_period=12, slow_period=26, signal_period=9):
+    """Return (macd, signal) over axis 1"""
+    macd = ewm_2d(close, fast_period) - ewm_2d(close, slow_period)
+    return macd, ewm_2d(macd, signal_period)
+
+# Function to compute the preprocess_data indicators for many series at once
+def batch_indicators(high, low, close, sma_fast=20, sma_slow=50, rsi_period=14, atr_period=14,
+                     bollinger_period=20, bollinger_std=2, macd_fast=12, macd_slow=26, macd_signal=9,
+                     adx_period=14):
+    """Compute indicators on stacked (series x bars) arrays.
+    
+    Shorter series are expected to be left-padded with NaN; padded cells stay
+    NaN and never leak into the windows of real bars. The result holds the
+    preprocess_data columns followed by adx.
+    """
+    prev_close = np.full(close.shape, np.nan)
+    prev_close[:, 1:] = close[:, :-1]
+    
+    columns = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Returns
+        columns['returns'] = close / prev_close - 1
+        columns['log_returns'] = np.log(close / prev_close)
+        
+        # Moving averages
+        columns['sma_20'] = rolling_mean_2d(close, sma_fast)
+        columns['sma_50'] = rolling_mean_2d(close, sma_slow)
+        
+        # RSI
+        columns['rsi'] = rsi_2d(close, rsi_period)
+        
+        # ATR (ADX comes from the same kernel call)
+        ranges = true_range_kernel(high, low, close, atr_period, adx_period)
+        columns['atr'] = ranges['atr']
+        
+        # Bollinger bands
+        columns['bollinger_upper'], columns['bollinger_lower'] = bollinger_2d(close, bollinger_period, bollinger_std)
+        
+        # MACD
+        columns['macd'], columns['macd_signal'] = macd_2d(close, macd_fast, macd_slow, macd_signal)
+    
+    columns['adx'] = ranges['adx']
+    
+    return columns
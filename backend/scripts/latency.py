@@ -0,0 +1,106 @@
+import io
+import time
+import bisect
+import cProfile
+import pstats
+import threading
+from collections import OrderedDict
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class StageTimer:
+    """Lap timer for the stages of one request.
+    
+    ``lap(name)`` charges the time since the previous lap (or since the
+    timer was created) to ``name``, so consecutive laps cover the request
+    without gaps. Times are taken with perf_counter_ns.
+    """
+    
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.last = time.perf_counter_ns()
+    
+    def lap(self, name):
+        now = time.perf_counter_ns()
+        self.stages[name] = self.stages.get(name, 0) + now - self.last
+        self.last = now
+    
+    def copy(self):
+        timer = StageTimer()
+        timer.stages = OrderedDict(self.stages)
+        return timer
+    
+    def milliseconds(self):
+        """Return the stage durations in milliseconds"""
+        return OrderedDict((name, round(ns / 1e6, 3)) for name, ns in self.stages.items())
+
+class LatencyHistograms:
+    """Cumulative per-stage latency histograms in the Prometheus layout"""
+    
+    def __init__(self, name="prediction_stage_seconds", buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.counts = OrderedDict()
+        self.sums = {}
+        self.lock = threading.Lock()
+    
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.counts:
+                self.counts[stage] = [0] * (len(self.buckets) + 1)
+                self.sums[stage] = 0.0
+            self.counts[stage][bisect.bisect_left(self.buckets, seconds)] += 1
+            self.sums[stage] += seconds
+    
+    def observe_timings(self, timings_ms):
+        """Record a ``timings_ms`` dict as produced by StageTimer.milliseconds"""
+        for stage, milliseconds in timings_ms.items():
+            self.observe(stage, milliseconds / 1000)
+    
+    def snapshot(self):
+        """Return count, sum and cumulative bucket counts per stage"""
+        with self.lock:
+            stages = {}
+            for stage, counts in self.counts.items():
+                cumulative = 0
+                buckets = OrderedDict()
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+                stages[stage] = {"count": cumulative, "sum": self.sums[stage], "buckets": buckets}
+            return stages
+    
+    def render(self):
+        """Return the histograms in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {self.name} Time spent in each prediction stage.",
+            f"# TYPE {self.name} histogram"
+        ]
+        for stage, histogram in self.snapshot().items():
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{stage="{stage}"}} {histogram["sum"]!r}')
+            lines.append(f'{self.name}_count{{stage="{stage}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+# Function to run a call under a profiler
+def profile_call(func, *args, profiler="cprofile", limit=30, **kwargs):
+    """Run ``func`` under cProfile (or pyinstrument) and return (result, report text)"""
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+        
+        profile = Profiler()
+        profile.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profile.stop()
+        return result, profile.output_text()
+    
+    profile = cProfile.Profile()
+    result = profile.runcall(func, *args, **kwargs)
+    
+    report = io.StringIO()
+    pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(limit)
+    return result, report.getvalue()
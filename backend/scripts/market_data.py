@@ -0,0 +1,90 @@
+import os
+import tempfile
+import numpy as np
+
+# Layout of the rates arrays returned by MT5 copy_rates_*
+RATES_DTYPE = np.dtype([
+    ('time', np.int64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('tick_volume', np.uint64),
+    ('spread', np.int32),
+    ('real_volume', np.uint64)
+])
+
+# Per-bar fields of a rates array
+RATES_FIELDS = ["open", "high", "low", "close", "tick_volume", "spread", "real_volume"]
+
+# Supported market data layouts
+RATES_LAYOUTS = ("rows", "columnar", "npy")
+
+# Directory for binary rates files (shared memory where available)
+RATES_DIR = os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+    "robotrading-rates"
+)
+
+# Function to check a symbol/timeframe before it becomes part of a file path
+def check_path_name(value, name="symbol"):
+    """Return value, or raise ValueError when it could escape its directory"""
+    value = str(value)
+    if not value or value in (".", "..") or "/" in value or "\\" in value or "\0" in value:
+        raise ValueError(f"Invalid {name}: {value!r}")
+    return value
+
+# Function to serialize a rates array
+def serialize_rates(rates, layout="rows"):
+    """Serialize an MT5 rates array column by column.
+    
+    ``rows`` returns a list of per-bar dicts; ``columnar`` returns one list
+    per field ({"time": [...], "open": [...], ...}).
+    """
+    columns = {
+        "time": np.datetime_as_string(rates['time'].astype('datetime64[s]'), unit='s').tolist()
+    }
+    for field in RATES_FIELDS:
+        columns[field] = rates[field].tolist()
+    
+    if layout == "columnar":
+        return columns
+    
+    fields = list(columns)
+    return [dict(zip(fields, values)) for values in zip(*columns.values())]
+
+# Function to write a rates array as a .npy file
+def save_rates(rates, symbol, timeframe, directory=None):
+    """Write rates to <directory>/<symbol>_<timeframe>.npy and return the path.
+    
+    The file is written next to its final name and moved into place, so
+    readers that already mapped the previous file keep a consistent view.
+    """
+    symbol = check_path_name(symbol)
+    timeframe = check_path_name(timeframe, "timeframe")
+    directory = directory or RATES_DIR
+    os.makedirs(directory, exist_ok=True)
+    
+    path = os.path.join(directory, f"{symbol}_{timeframe}.npy")
+    
+    # A unique temporary name, so concurrent writers of the same file don't collide
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(rates))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    
+    return path
+
+# Function to read a .npy rates file
+def load_rates(path):
+    """Memory-map a rates file written by save_rates"""
+    rates = np.load(path, mmap_mode='r')
+    
+    if rates.dtype.names is None or 'time' not in rates.dtype.names:
+        raise ValueError(f"Not a rates file: {path}")
+    
+    return rates
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import threading
+import numpy as np
+
+# Directory holding exported deep learning models (export is unused when unset)
+DL_EXPORT_ENV = "DL_EXPORT_DIR"
+
+# Exported model file extension per runtime, in order of preference
+RUNTIME_EXTENSIONS = {"tflite": ".tflite", "onnx": ".onnx"}
+
+# Supported quantization modes (None keeps float32 weights)
+QUANTIZATIONS = (None, "fp16", "int8")
+
+# Inference threads of the exported runtimes
+DL_EXPORT_THREADS = int(os.environ.get("DL_EXPORT_THREADS", 1))
+
+# Input features of the deep learning models
+MODEL_FEATURES = ['open', 'high', 'low', 'close', 'volume']
+
+# Random inputs each export is checked on against its source model
+EXPORT_CHECK_SAMPLES = 32
+
+# Function to get the Keras model behind a deep learning wrapper
+def keras_model(model):
+    """LSTMModel/TransformerModel keep their Keras model in ``.model``"""
+    model = getattr(model, 'model', model)
+    
+    # A wrapper already running on an export still holds its Keras model
+    if isinstance(model, RuntimeModel) and model.original is not None:
+        return model.original
+    return model
+
+# Function to get the file name of trained model weights
+def weights_path(directory, name, lookback):
+    return os.path.join(directory, f"{name}_{lookback}.weights.h5")
+
+# Function to get the file name of an exported model
+def export_path(directory, name, lookback, runtime="tflite", quantization=None):
+    suffix = f"_{quantization}" if quantization else ""
+    return os.path.join(directory, f"{name}_{lookback}{suffix}{RUNTIME_EXTENSIONS[runtime]}")
+
+# Function to export a Keras model for a lightweight CPU runtime
+def export_model(model, path, runtime="tflite", quantization=None, representative_data=None):
+    """Convert a (wrapped) Keras model to TFLite or ONNX and write it to ``path``.
+    
+    ``quantization`` "fp16" stores half-precision weights; "int8" quantizes
+    weights (and activations, for TFLite, when ``representative_data`` input
+    samples are given). Returns ``path``.
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    
+    model = keras_model(model)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    
+    if runtime == "tflite":
+        import tensorflow as tf
+        
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        
+        # Recurrent layers may need TF ops TFLite has no builtin for
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+        
+        if quantization == "fp16":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantization == "int8":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            if representative_data is not None:
+                converter.representative_dataset = lambda: ([sample[np.newaxis].astype(np.float32)] for sample in representative_data)
+        
+        with open(path, "wb") as f:
+            f.write(converter.convert())
+    
+    elif runtime == "onnx":
+        import tf2onnx
+        
+        float_path = path if quantization is None else path + ".float"
+        tf2onnx.convert.from_keras(model, opset=13, output_path=float_path)
+        
+        if quantization == "int8":
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(float_path, path, weight_type=QuantType.QInt8)
+        elif quantization == "fp16":
+            import onnx
+            from onnxconverter_common import float16
+            onnx.save(float16.convert_float_to_float16(onnx.load(float_path), keep_io_types=True), path)
+        
+        if float_path != path:
+            os.remove(float_path)
+    
+    else:
+        raise ValueError(f"Unknown runtime: {runtime}")
+    
+    return path
+
+class CompiledModel:
+    """Runs an exported model with TFLite (XNNPACK) or ONNX Runtime on the CPU"""
+    
+    def __init__(self, path, threads=DL_EXPORT_THREADS):
+        self.path = path
+        self.runtime = "onnx" if path.endswith(RUNTIME_EXTENSIONS["onnx"]) else "tflite"
+        self.lock = threading.Lock()
+        
+        if self.runtime == "onnx":
+            import onnxruntime
+            
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            self.input_name = self.session.get_inputs()[0].name
+        else:
+            # The standalone runtime is much lighter than TensorFlow, which is the fallback
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                from tensorflow.lite import Interpreter
+            
+            self.interpreter = Interpreter(model_path=path, num_threads=threads)
+            self.interpreter.allocate_tensors()
+            self.input_index = self.interpreter.get_input_details()[0]['index']
+            self.output_index = self.interpreter.get_output_details()[0]['index']
+            self.input_shape = None
+    
+    def run(self, inputs):
+        """Return the model output for a batch of inputs"""
+        inputs = np.asarray(inputs, dtype=np.float32)
+        
+        if self.runtime == "onnx":
+            return self.session.run(None, {self.input_name: inputs})[0]
+        
+        # The interpreter holds per-call state, so calls take turns
+        with self.lock:
+            if inputs.shape != self.input_shape:
+                self.interpreter.resize_tensor_input(self.input_index, inputs.shape)
+                self.interpreter.allocate_tensors()
+                self.input_shape = inputs.shape
+            
+            self.interpreter.set_tensor(self.input_index, inputs)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+class RuntimeModel:
+    """Stands in for a Keras model, answering predict() and calls with an exported model"""
+    
+    def __init__(self, compiled, original=None):
+        self.compiled = compiled
+        self.original = original
+    
+    def predict(self, inputs, *args, **kwargs):
+        return self.compiled.run(inputs)
+    
+    def __call__(self, inputs, *args, **kwargs):
+        return self.compiled.run(inputs)
+
+# Function to swap a wrapper's Keras model for its exported version
+def use_exported(model, name, lookback, directory=None, quantization=None):
+    """Point ``model.model`` at an exported model when one exists and its runtime is installed.
+    
+    Looks for ``export_path(directory, name, lookback, runtime, quantization)``
+    in DL_EXPORT_DIR for each runtime in RUNTIME_EXTENSIONS. Returns True if
+    the model now runs on the exported version; otherwise it is unchanged.
+    """
+    directory = directory or os.environ.get(DL_EXPORT_ENV)
+    if not directory or not hasattr(model, 'model'):
+        return False
+    
+    quantization = quantization or os.environ.get("DL_EXPORT_QUANTIZATION") or None
+    for runtime in RUNTIME_EXTENSIONS:
+        path = export_path(directory, name, lookback, runtime, quantization)
+        if not os.path.exists(path):
+            continue
+        
+        try:
+            compiled = CompiledModel(path)
+        except ImportError:
+            continue
+        
+        model.model = RuntimeModel(compiled, model.model)
+        return True
+    
+    return False
+
+# Function to check that an exported model stays close to the original
+def compare_outputs(model, compiled, inputs):
+    """Return the largest absolute difference between the Keras and exported outputs"""
+    expected = np.asarray(keras_model(model).predict(inputs, verbose=0))
+    actual = compiled.run(inputs)
+    return float(np.max(np.abs(expected - actual)))
+
+# Function to export the deep learning models of a configuration
+def export_models(directory, lookback=60, runtime="tflite", quantization=None, model_types=("LSTM", "Transformer"),
+                  weights_dir=None, models=None):
+    """Export trained LSTMModel/TransformerModel for use_exported and return a result dict.
+    
+    ``models`` maps model names ("lstm", "transformer") to trained wrappers,
+    such as the dl_model members of a running ForexModel. Model types not
+    given there are built and load their weights from
+    ``weights_path(weights_dir, name, lookback)``; untrained models are never
+    exported. Each export is checked against its source model on random
+    inputs, and the largest output difference is reported in ``errors``.
+    """
+    models = {name.lower(): model for name, model in (models or {}).items()}
+    missing = [model_type for model_type in model_types if model_type.lower() not in models]
+    
+    if missing:
+        if not weights_dir:
+            return {
+                "success": False,
+                "message": f"No trained weights for {', '.join(missing)}: pass weights_dir or the live models"
+            }
+        
+        from models.deep_learning import LSTMModel, TransformerModel
+        
+        classes = {"LSTM": LSTMModel, "Transformer": TransformerModel}
+        for model_type in missing:
+            path = weights_path(weights_dir, model_type.lower(), lookback)
+            if not os.path.exists(path):
+                return {
+                    "success": False,
+                    "message": f"Weights not found: {path}"
+                }
+            
+            model = classes[model_type](lookback=lookback, features=MODEL_FEATURES)
+            keras_model(model).load_weights(path)
+            models[model_type.lower()] = model
+    
+    inputs = np.random.default_rng(0).random((EXPORT_CHECK_SAMPLES, lookback, len(MODEL_FEATURES))).astype(np.float32)
+    exported = {}
+    errors = {}
+    for model_type in model_types:
+        model = models[model_type.lower()]
+        path = export_path(directory, model_type.lower(), lookback, runtime, quantization)
+        exported[model_type] = export_model(model, path, runtime, quantization, representative_data=inputs)
+        errors[model_type] = compare_outputs(model, CompiledModel(path), inputs)
+    
+    return {
+        "success": True,
+        "message": f"Exported {len(exported)} models",
+        "paths": exported,
+        "errors": errors
+    }
+
+# Main function
+if __name__ == "__main__":
+    # Check arguments
+    if len(sys.argv) < 3:
+        print(json.dumps({
+            "success": False,
+            "message": "Missing arguments. Required: output_dir, weights_dir, [lookback], [runtime], [quantization]"
+        }))
+        sys.exit(1)
+    
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    
+    try:
+        print(json.dumps(export_models(
+            sys.argv[1],
+            int(sys.argv[3]) if len(sys.argv) > 3 else 60,
+            sys.argv[4] if len(sys.argv) > 4 else "tflite",
+            sys.argv[5] if len(sys.argv) > 5 and sys.argv[5] != "none" else None,
+            weights_dir=sys.argv[2]
+        )))
+    except Exception as e:
+        print(json.dumps({
+            "success": False,
+            "message": f"Model export failed: {str(e)}"
+        }))
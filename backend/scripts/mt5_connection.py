@@ -1,40 +1,164 @@
 import os
 import sys
 import json
+import time
+import threading
 import MetaTrader5 as mt5
-from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
+from datetime import datetime
 
-# Function to connect to MT5
-def connect(server, login, password):
-    # Initialize MT5
-    if not mt5.initialize():
-        return json.dumps({
-            "success": False,
-            "message": f"MT5 initialization failed: {mt5.last_error()}"
-        })
+# Import the shared market data helpers
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.market_data import RATES_LAYOUTS, serialize_rates, save_rates
+from scripts.bar_store import BarStore, sync_bars
+from scripts.tick_aggregator import TickAggregator
+from scripts.protocol import open_channel, stdio_streams
+from scripts.encoding import json_response
+
+# Seconds a resident session may stay idle before it is shut down
+SESSION_IDLE_TIMEOUT = 300
+
+# Seconds between tick polls of the STREAM command
+STREAM_INTERVAL = 0.1
+
+# History bars read to seed the indicators of streamed bars
+STREAM_SEED_BARS = 200
+
+# MT5 timeframe constant names by timeframe string
+MT5_TIMEFRAMES = {
+    "1m": "TIMEFRAME_M1",
+    "5m": "TIMEFRAME_M5",
+    "15m": "TIMEFRAME_M15",
+    "30m": "TIMEFRAME_M30",
+    "1h": "TIMEFRAME_H1",
+    "4h": "TIMEFRAME_H4",
+    "1d": "TIMEFRAME_D1"
+}
+
+class MT5Session:
+    """Authenticated MT5 terminal session shared by the commands of one process.
     
-    # Connect to MT5 account
-    authorized = mt5.login(login=int(login), password=password, server=server)
-    if not authorized:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": f"MT5 login failed: {mt5.last_error()}"
-        })
+    By default the session is shut down after every command, matching the
+    one-process-per-command CLI. In persistent mode (used by the SERVE daemon)
+    the session for the current (server, login) is kept open, re-established
+    when the terminal drops it, and shut down once it has been idle for
+    ``idle_timeout`` seconds. Passwords are kept per account until DISCONNECT,
+    so a session shut down for being idle logs in again on the next command.
+    """
     
-    # Get account info
-    account_info = mt5.account_info()
-    if account_info is None:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": "Failed to get account info"
-        })
+    def __init__(self, persistent=False, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.persistent = persistent
+        self.idle_timeout = idle_timeout
+        self.key = None
+        self.passwords = {}
+        self.last_used = 0.0
+        self.symbols = {}
+        self.lock = threading.RLock()
     
-    # Convert account info to dict
-    account_info_dict = {
+    def open(self, server, login, password=None):
+        """Ensure a logged in session, returning an error dict on failure"""
+        with self.lock:
+            key = (server, str(login))
+            
+            if password is None:
+                password = self.passwords.get(key)
+            
+            # Reuse the live session for the same account
+            if self.key == key:
+                if mt5.terminal_info() is not None:
+                    self.last_used = time.monotonic()
+                    return None
+            
+            self.shutdown()
+            
+            # Initialize MT5
+            if not mt5.initialize():
+                return {
+                    "success": False,
+                    "message": f"MT5 initialization failed: {mt5.last_error()}"
+                }
+            
+            # Connect to MT5 account
+            if password is None:
+                authorized = mt5.login(login=int(login), server=server)
+            else:
+                authorized = mt5.login(login=int(login), password=password, server=server)
+            
+            if not authorized:
+                error = {
+                    "success": False,
+                    "message": f"MT5 login failed: {mt5.last_error()}"
+                }
+                mt5.shutdown()
+                return error
+            
+            self.key = key
+            if password is not None:
+                self.passwords[key] = password
+            self.last_used = time.monotonic()
+            return None
+    
+    def close(self):
+        """Release the session after a command"""
+        with self.lock:
+            if self.persistent:
+                self.last_used = time.monotonic()
+            else:
+                self.shutdown()
+    
+    def shutdown(self, forget=False):
+        """Shut down the terminal connection, also dropping stored passwords if ``forget``"""
+        with self.lock:
+            if self.key is not None:
+                mt5.shutdown()
+            self.key = None
+            self.symbols = {}
+            if forget:
+                self.passwords = {}
+    
+    def symbol_info(self, symbol):
+        """Return the symbol's specification (digits, volume step, filling modes), cached for the session"""
+        with self.lock:
+            if symbol not in self.symbols:
+                info = mt5.symbol_info(symbol)
+                if info is None:
+                    return None
+                self.symbols[symbol] = info
+            return self.symbols[symbol]
+    
+    def evict_if_idle(self):
+        """Shut down the session if it has been idle too long"""
+        with self.lock:
+            if self.key is not None and time.monotonic() - self.last_used > self.idle_timeout:
+                self.shutdown()
+
+# Session used by every command in this process
+_session = MT5Session()
+
+# Thread shutting the session down once it has been idle too long
+_evictor = None
+
+# Function to keep the session open between the commands of this process
+def keep_session_open(idle_timeout=SESSION_IDLE_TIMEOUT):
+    """Make the session persistent, as in the SERVE daemon, shutting it down once idle for ``idle_timeout`` seconds"""
+    global _evictor
+    
+    with _session.lock:
+        _session.persistent = True
+        _session.idle_timeout = idle_timeout
+    
+    if _evictor is None:
+        _evictor = threading.Thread(target=_evict_idle_session, daemon=True)
+        _evictor.start()
+
+# Function to shut down idle sessions in the background
+def _evict_idle_session():
+    while True:
+        time.sleep(min(_session.idle_timeout, 30))
+        _session.evict_if_idle()
+
+# Function to convert account info to a dict
+def account_info_to_dict(account_info):
+    return {
         "login": account_info.login,
         "name": account_info.name,
         "server": account_info.server,
@@ -46,114 +170,161 @@ def connect(server, login, password):
         "margin_level": account_info.margin_level,
         "leverage": account_info.leverage
     }
+
+# Function to connect to MT5
+@json_response
+def connect(server, login, password):
+    # Open (or reuse) the MT5 session
+    error = _session.open(server, login, password)
+    if error:
+        return error
+    
+    # Get account info
+    account_info = mt5.account_info()
+    if account_info is None:
+        _session.close()
+        return {
+            "success": False,
+            "message": "Failed to get account info"
+        }
     
-    return json.dumps({
+    # Convert account info to dict
+    account_info_dict = account_info_to_dict(account_info)
+    
+    # Release the MT5 session
+    _session.close()
+    
+    return {
         "success": True,
         "message": "Connection successful",
         "accountInfo": account_info_dict
-    })
+    }
 
-# Function to get market data
-def get_market_data(server, login, symbol, timeframe, bars=100):
-    # Initialize MT5
-    if not mt5.initialize():
-        return json.dumps({
-            "success": False,
-            "message": f"MT5 initialization failed: {mt5.last_error()}"
-        })
+# Function to get account info
+@json_response
+def get_account_info(server, login):
+    # Open (or reuse) the MT5 session
+    error = _session.open(server, login)
+    if error:
+        return error
     
-    # Connect to MT5 account
-    authorized = mt5.login(login=int(login), server=server)
-    if not authorized:
-        mt5.shutdown()
-        return json.dumps({
+    # Get account info
+    account_info = mt5.account_info()
+    if account_info is None:
+        _session.close()
+        return {
             "success": False,
-            "message": f"MT5 login failed: {mt5.last_error()}"
-        })
+            "message": "Failed to get account info"
+        }
+    
+    account_info_dict = account_info_to_dict(account_info)
     
-    # Map timeframe string to MT5 timeframe
-    timeframe_map = {
-        "1m": mt5.TIMEFRAME_M1,
-        "5m": mt5.TIMEFRAME_M5,
-        "15m": mt5.TIMEFRAME_M15,
-        "30m": mt5.TIMEFRAME_M30,
-        "1h": mt5.TIMEFRAME_H1,
-        "4h": mt5.TIMEFRAME_H4,
-        "1d": mt5.TIMEFRAME_D1
+    # Release the MT5 session
+    _session.close()
+    
+    return {
+        "success": True,
+        "accountInfo": account_info_dict
     }
+
+# Function to disconnect from MT5
+@json_response
+def disconnect(server, login):
+    _session.shutdown(forget=True)
     
-    if timeframe not in timeframe_map:
-        mt5.shutdown()
-        return json.dumps({
+    return {
+        "success": True,
+        "message": "Disconnected"
+    }
+
+# Function to fetch rates on the MT5 session
+def fetch_rates(server, login, symbol, timeframe, bars=100):
+    """Return (rates, None) or (None, error dict); goes through the bar store when one is configured"""
+    # Open (or reuse) the MT5 session
+    error = _session.open(server, login)
+    if error:
+        return None, error
+    
+    if timeframe not in MT5_TIMEFRAMES:
+        _session.close()
+        return None, {
             "success": False,
             "message": f"Invalid timeframe: {timeframe}"
-        })
+        }
+    
+    # Get rates, through the local bar store when one is configured
+    mt5_timeframe = getattr(mt5, MT5_TIMEFRAMES[timeframe])
+    store = BarStore.from_env()
+    
+    if store is None:
+        rates = mt5.copy_rates_from_pos(symbol, mt5_timeframe, 0, int(bars))
+    else:
+        rates = sync_bars(
+            store, symbol, timeframe, int(bars),
+            lambda count: mt5.copy_rates_from_pos(symbol, mt5_timeframe, 0, count),
+            lambda since: mt5.copy_rates_range(symbol, mt5_timeframe, since, int(time.time()) + 86400)
+        )
     
-    # Get rates
-    rates = mt5.copy_rates_from_pos(symbol, timeframe_map[timeframe], 0, int(bars))
+    # Release the MT5 session
+    _session.close()
     
     if rates is None or len(rates) == 0:
-        mt5.shutdown()
-        return json.dumps({
+        return None, {
             "success": False,
             "message": f"Failed to get rates for {symbol}"
-        })
+        }
     
-    # Convert to pandas dataframe
-    rates_df = pd.DataFrame(rates)
-    rates_df['time'] = pd.to_datetime(rates_df['time'], unit='s')
-    
-    # Convert to dict for JSON serialization
-    data = []
-    for _, row in rates_df.iterrows():
-        data.append({
-            "time": row['time'].isoformat(),
-            "open": row['open'],
-            "high": row['high'],
-            "low": row['low'],
-            "close": row['close'],
-            "tick_volume": row['tick_volume'],
-            "spread": row['spread'],
-            "real_volume": row['real_volume']
-        })
+    return rates, None
+
+# Function to get market data
+@json_response
+def get_market_data(server, login, symbol, timeframe, bars=100, layout="rows"):
+    if layout not in RATES_LAYOUTS:
+        return {
+            "success": False,
+            "message": f"Invalid layout: {layout}"
+        }
+    
+    rates, error = fetch_rates(server, login, symbol, timeframe, bars)
+    if error:
+        return error
     
-    # Shutdown MT5
-    mt5.shutdown()
+    # Hand binary layouts over as a file path
+    if layout == "npy":
+        return {
+            "success": True,
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "layout": layout,
+            "path": save_rates(rates, symbol, timeframe)
+        }
     
-    return json.dumps({
+    # Serialize straight from the structured array
+    return {
         "success": True,
         "symbol": symbol,
         "timeframe": timeframe,
-        "data": data
-    })
+        "layout": layout,
+        "data": serialize_rates(rates, layout)
+    }
 
 # Function to get open positions
+@json_response
 def get_positions(server, login):
-    # Initialize MT5
-    if not mt5.initialize():
-        return json.dumps({
-            "success": False,
-            "message": f"MT5 initialization failed: {mt5.last_error()}"
-        })
-    
-    # Connect to MT5 account
-    authorized = mt5.login(login=int(login), server=server)
-    if not authorized:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": f"MT5 login failed: {mt5.last_error()}"
-        })
+    # Open (or reuse) the MT5 session
+    error = _session.open(server, login)
+    if error:
+        return error
     
     # Get positions
     positions = mt5.positions_get()
     
     if positions is None:
-        mt5.shutdown()
-        return json.dumps({
+        _session.close()
+        return {
             "success": False,
             "message": "Failed to get positions"
-        })
+        }
     
     # Convert positions to dict
     positions_list = []
@@ -173,132 +344,162 @@ def get_positions(server, login):
             "commission": position.commission
         })
     
-    # Shutdown MT5
-    mt5.shutdown()
+    # Release the MT5 session
+    _session.close()
     
-    return json.dumps({
+    return {
         "success": True,
         "positions": positions_list
-    })
+    }
 
-# Function to place a trade
-def place_trade(server, login, symbol, trade_type, volume, price=0, sl=0, tp=0):
-    # Initialize MT5
-    if not mt5.initialize():
-        return json.dumps({
+# Function to pick an order filling mode the symbol allows
+def _filling_mode(info):
+    if info.filling_mode & mt5.SYMBOL_FILLING_IOC:
+        return mt5.ORDER_FILLING_IOC
+    if info.filling_mode & mt5.SYMBOL_FILLING_FOK:
+        return mt5.ORDER_FILLING_FOK
+    return mt5.ORDER_FILLING_RETURN
+
+# Function to get the symbol spec and current price for an order
+def _order_quote(symbol, buy):
+    """Return (symbol_info, price) with a single tick fetch, or an error dict"""
+    info = _session.symbol_info(symbol)
+    if info is None:
+        return None, {
             "success": False,
-            "message": f"MT5 initialization failed: {mt5.last_error()}"
-        })
+            "message": f"Unknown symbol: {symbol}"
+        }
     
-    # Connect to MT5 account
-    authorized = mt5.login(login=int(login), server=server)
-    if not authorized:
-        mt5.shutdown()
-        return json.dumps({
+    tick = mt5.symbol_info_tick(symbol)
+    if tick is None:
+        return None, {
             "success": False,
-            "message": f"MT5 login failed: {mt5.last_error()}"
-        })
+            "message": f"No price for {symbol}"
+        }
+    
+    return info, tick.ask if buy else tick.bid
+
+# Function to check the result of an order_send
+def _order_error(result, action):
+    """Return the error dict of a failed order, or None if it was done"""
+    # order_send returns None when the terminal rejects the request outright
+    if result is None:
+        return {
+            "success": False,
+            "message": f"{action} rejected by the terminal: {mt5.last_error()}"
+        }
+    
+    if result.retcode != mt5.TRADE_RETCODE_DONE:
+        return {
+            "success": False,
+            "message": f"{action} failed with error code: {result.retcode}"
+        }
+    
+    return None
+
+# Function to check an order volume against the symbol's limits
+def _volume_error(volume, info):
+    """Return the error dict of a volume the symbol doesn't accept, or None"""
+    steps = volume / info.volume_step
+    if volume < info.volume_min or volume > info.volume_max or abs(steps - round(steps)) > 1e-6:
+        return {
+            "success": False,
+            "message": (
+                f"Invalid volume {volume} for {info.name}: must be between {info.volume_min} "
+                f"and {info.volume_max} in steps of {info.volume_step}"
+            )
+        }
+    
+    return None
+
+# Function to send a market order on the open session
+def _send_trade(symbol, trade_type, volume, price=0, sl=0, tp=0):
+    buy = trade_type == "BUY"
+    info, quote = _order_quote(symbol, buy)
+    if info is None:
+        return quote
+    
+    # Reject volumes the broker would refuse instead of trading a different size
+    volume = float(volume)
+    error = _volume_error(volume, info)
+    if error:
+        return error
+    
+    # Round to the symbol's price digits and volume step
+    volume = round(round(volume / info.volume_step) * info.volume_step, 8)
+    price = round(float(price) if float(price) > 0 else quote, info.digits)
+    sl = round(float(sl), info.digits) if float(sl) > 0 else 0
+    tp = round(float(tp), info.digits) if float(tp) > 0 else 0
     
     # Prepare trade request
     request = {
         "action": mt5.TRADE_ACTION_DEAL,
         "symbol": symbol,
-        "volume": float(volume),
-        "type": mt5.ORDER_TYPE_BUY if trade_type == "BUY" else mt5.ORDER_TYPE_SELL,
-        "price": float(price) if float(price) > 0 else mt5.symbol_info_tick(symbol).ask if trade_type == "BUY" else mt5.symbol_info_tick(symbol).bid,
-        "sl": float(sl) if float(sl) > 0 else 0,
-        "tp": float(tp) if float(tp) > 0 else 0,
+        "volume": volume,
+        "type": mt5.ORDER_TYPE_BUY if buy else mt5.ORDER_TYPE_SELL,
+        "price": price,
+        "sl": sl,
+        "tp": tp,
         "deviation": 10,
         "magic": 123456,
         "comment": "Python script trade",
         "type_time": mt5.ORDER_TIME_GTC,
-        "type_filling": mt5.ORDER_FILLING_IOC
+        "type_filling": _filling_mode(info)
     }
     
     # Send trade request
     result = mt5.order_send(request)
     
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": f"Trade failed with error code: {result.retcode}"
-        })
+    error = _order_error(result, "Trade")
+    if error:
+        return error
     
     # Get trade details
     trade = {
         "ticket": result.order,
         "symbol": symbol,
         "type": trade_type,
-        "volume": float(volume),
+        "volume": volume,
         "open_price": result.price,
-        "sl": float(sl) if float(sl) > 0 else 0,
-        "tp": float(tp) if float(tp) > 0 else 0
+        "sl": sl,
+        "tp": tp
     }
     
-    # Shutdown MT5
-    mt5.shutdown()
-    
-    return json.dumps({
+    return {
         "success": True,
         "message": "Trade placed successfully",
         "trade": trade
-    })
+    }
 
-# Function to close a trade
-def close_trade(server, login, ticket):
-    # Initialize MT5
-    if not mt5.initialize():
-        return json.dumps({
-            "success": False,
-            "message": f"MT5 initialization failed: {mt5.last_error()}"
-        })
-    
-    # Connect to MT5 account
-    authorized = mt5.login(login=int(login), server=server)
-    if not authorized:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": f"MT5 login failed: {mt5.last_error()}"
-        })
-    
-    # Get position
-    position = mt5.positions_get(ticket=int(ticket))
-    
-    if position is None or len(position) == 0:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": f"Position with ticket {ticket} not found"
-        })
-    
-    position = position[0]
+# Function to close a position on the open session
+def _close_position(position):
+    # A buy position is closed by selling at the bid, a sell by buying at the ask
+    buy = position.type != mt5.ORDER_TYPE_BUY
+    info, price = _order_quote(position.symbol, buy)
+    if info is None:
+        return price
     
     # Prepare close request
     request = {
         "action": mt5.TRADE_ACTION_DEAL,
         "symbol": position.symbol,
         "volume": position.volume,
-        "type": mt5.ORDER_TYPE_SELL if position.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY,
+        "type": mt5.ORDER_TYPE_BUY if buy else mt5.ORDER_TYPE_SELL,
         "position": position.ticket,
-        "price": mt5.symbol_info_tick(position.symbol).bid if position.type == mt5.ORDER_TYPE_BUY else mt5.symbol_info_tick(position.symbol).ask,
+        "price": price,
         "deviation": 10,
         "magic": 123456,
         "comment": "Python script close",
         "type_time": mt5.ORDER_TIME_GTC,
-        "type_filling": mt5.ORDER_FILLING_IOC
+        "type_filling": _filling_mode(info)
     }
     
     # Send close request
     result = mt5.order_send(request)
     
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": f"Close failed with error code: {result.retcode}"
-        })
+    error = _order_error(result, "Close")
+    if error:
+        return error
     
     # Get close details
     close_result = {
@@ -311,157 +512,541 @@ def close_trade(server, login, ticket):
         "swap": position.swap
     }
     
-    # Shutdown MT5
-    mt5.shutdown()
-    
-    return json.dumps({
+    return {
         "success": True,
         "message": "Trade closed successfully",
         "result": close_result
-    })
+    }
 
-# Function to modify a trade
-def modify_trade(server, login, ticket, sl, tp):
-    # Initialize MT5
-    if not mt5.initialize():
-        return json.dumps({
-            "success": False,
-            "message": f"MT5 initialization failed: {mt5.last_error()}"
-        })
+# Function to change the SL/TP of a position on the open session
+def _modify_position(position, sl, tp):
+    sl = float(sl)
+    tp = float(tp)
     
-    # Connect to MT5 account
-    authorized = mt5.login(login=int(login), server=server)
-    if not authorized:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": f"MT5 login failed: {mt5.last_error()}"
-        })
-    
-    # Get position
-    position = mt5.positions_get(ticket=int(ticket))
-    
-    if position is None or len(position) == 0:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": f"Position with ticket {ticket} not found"
-        })
-    
-    position = position[0]
+    # Round to the symbol's price digits
+    info = _session.symbol_info(position.symbol)
+    if info is not None:
+        sl = round(sl, info.digits)
+        tp = round(tp, info.digits)
     
     # Prepare modify request
     request = {
         "action": mt5.TRADE_ACTION_SLTP,
         "symbol": position.symbol,
         "position": position.ticket,
-        "sl": float(sl),
-        "tp": float(tp)
+        "sl": sl,
+        "tp": tp
     }
     
     # Send modify request
     result = mt5.order_send(request)
     
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        mt5.shutdown()
-        return json.dumps({
-            "success": False,
-            "message": f"Modify failed with error code: {result.retcode}"
-        })
-    
-    # Shutdown MT5
-    mt5.shutdown()
+    error = _order_error(result, "Modify")
+    if error:
+        return error
     
-    return json.dumps({
+    return {
         "success": True,
         "message": "Trade modified successfully",
         "result": {
             "ticket": position.ticket,
-            "sl": float(sl),
-            "tp": float(tp)
+            "sl": sl,
+            "tp": tp
         }
-    })
+    }
 
-# Main function
-if __name__ == "__main__":
-    # Check arguments
-    if len(sys.argv) < 3:
-        print(json.dumps({
+# Function to look up a position by ticket on the open session
+def _get_position(ticket):
+    position = mt5.positions_get(ticket=int(ticket))
+    return position[0] if position else None
+
+# Function to place a trade
+@json_response
+def place_trade(server, login, symbol, trade_type, volume, price=0, sl=0, tp=0):
+    # Open (or reuse) the MT5 session
+    error = _session.open(server, login)
+    if error:
+        return error
+    
+    response = _send_trade(symbol, trade_type, volume, price, sl, tp)
+    
+    # Release the MT5 session
+    _session.close()
+    
+    return response
+
+# Function to close a trade
+@json_response
+def close_trade(server, login, ticket):
+    # Open (or reuse) the MT5 session
+    error = _session.open(server, login)
+    if error:
+        return error
+    
+    # Get position
+    position = _get_position(ticket)
+    
+    if position is None:
+        response = {
             "success": False,
-            "message": "Missing arguments. Required: command, server, login, [additional args]"
-        }))
-        sys.exit(1)
+            "message": f"Position with ticket {ticket} not found"
+        }
+    else:
+        response = _close_position(position)
     
-    # Get command and arguments
-    command = sys.argv[1]
-    server = sys.argv[2]
-    login = sys.argv[3]
+    # Release the MT5 session
+    _session.close()
     
-    # Execute command
+    return response
+
+# Function to modify a trade
+@json_response
+def modify_trade(server, login, ticket, sl, tp):
+    # Open (or reuse) the MT5 session
+    error = _session.open(server, login)
+    if error:
+        return error
+    
+    # Get position
+    position = _get_position(ticket)
+    
+    if position is None:
+        response = {
+            "success": False,
+            "message": f"Position with ticket {ticket} not found"
+        }
+    else:
+        response = _modify_position(position, sl, tp)
+    
+    # Release the MT5 session
+    _session.close()
+    
+    return response
+
+# Function to expand a batch item into (action, position) operations
+def _expand_batch_item(item, snapshot, positions):
+    action = str(item["action"]).upper()
+    if action == "TRADE":
+        return [(action, None)]
+    if action not in ("CLOSE", "MODIFY"):
+        raise ValueError(f"Unknown action: {action}")
+    
+    # "*" stands for every position of the snapshot (of one symbol when given)
+    ticket = str(item["ticket"])
+    if ticket == "*":
+        symbol = item.get("symbol")
+        return [
+            (action, position) for position in snapshot
+            if (symbol is None or position.symbol == symbol) and position.ticket in positions
+        ]
+    
+    return [(action, positions.get(int(ticket)))]
+
+# Function to run one expanded batch operation
+def _run_batch_operation(action, position, item):
+    if action == "TRADE":
+        return _send_trade(
+            item["symbol"],
+            item["type"],
+            item["volume"],
+            item.get("price", 0),
+            item.get("sl", 0),
+            item.get("tp", 0)
+        )
+    
+    if position is None:
+        return {
+            "success": False,
+            "message": f"Position with ticket {item['ticket']} not found"
+        }
+    
+    if action == "CLOSE":
+        return _close_position(position)
+    
+    # "breakeven" moves the stop loss to the open price
+    sl = item.get("sl", position.sl)
+    if str(sl).lower() == "breakeven":
+        sl = position.price_open
+    return _modify_position(position, sl, item.get("tp", position.tp))
+
+# Function to run several trade/close/modify requests in one session
+@json_response
+def execute_batch(server, login, items):
+    """Run trade, close and modify requests in one session.
+    
+    Items look like {"action": "CLOSE", "ticket": 123456},
+    {"action": "MODIFY", "ticket": 123456, "sl": 1.19, "tp": 1.21} or
+    {"action": "TRADE", "symbol": "EURUSD", "type": "BUY", "volume": 0.1}.
+    Positions come from one positions_get snapshot taken before the first
+    item; a ticket of "*" means every position in it (of ``symbol`` when
+    given) and an sl of "breakeven" the position's open price. Every
+    result carries the index of its item, its action and elapsed_ms.
+    """
+    started = time.perf_counter()
+    
+    # Open (or reuse) the MT5 session
+    error = _session.open(server, login)
+    if error:
+        return error
+    
+    # One snapshot of the open positions for the whole batch
+    snapshot = mt5.positions_get() or ()
+    positions = {position.ticket: position for position in snapshot}
+    
+    results = []
+    for index, item in enumerate(items):
+        try:
+            operations = _expand_batch_item(item, snapshot, positions)
+        except (KeyError, ValueError, TypeError) as e:
+            results.append({
+                "index": index,
+                "success": False,
+                "message": f"Invalid batch item: {str(e)}",
+                "elapsed_ms": 0.0
+            })
+            continue
+        
+        for action, position in operations:
+            item_started = time.perf_counter()
+            try:
+                response = _run_batch_operation(action, position, item)
+            except (KeyError, ValueError, TypeError) as e:
+                response = {
+                    "success": False,
+                    "message": f"Invalid batch item: {str(e)}"
+                }
+            except Exception as e:
+                # One failed operation must not lose the results of the others
+                response = {
+                    "success": False,
+                    "message": f"Batch operation failed: {str(e)}"
+                }
+            
+            # Closed positions are gone for the rest of the batch
+            if action == "CLOSE" and response["success"]:
+                positions.pop(position.ticket, None)
+            
+            results.append(dict(
+                response,
+                index=index,
+                action=action,
+                elapsed_ms=round((time.perf_counter() - item_started) * 1000, 3)
+            ))
+    
+    # Release the MT5 session
+    _session.close()
+    
+    failed = sum(1 for result in results if not result["success"])
+    return {
+        "success": True,
+        "message": f"{len(results) - failed} of {len(results)} operations succeeded",
+        "failed": failed,
+        "results": results,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+# Function to convert a tick to a dict
+def tick_to_dict(symbol, tick):
+    return {
+        "type": "tick",
+        "symbol": symbol,
+        "time": int(tick.time),
+        "time_msc": int(tick.time_msc),
+        "bid": float(tick.bid),
+        "ask": float(tick.ask),
+        "last": float(tick.last),
+        "volume": int(tick.volume)
+    }
+
+# Function to stream ticks for a set of symbols
+def stream_ticks(server, login, symbols, output_stream, control_stream=None, interval=STREAM_INTERVAL, max_polls=None, timeframes=None, indicator_params=None):
+    """Write newline-delimited JSON ticks for a set of symbols until stopped.
+    
+    Every ``interval`` seconds the latest tick of each subscribed symbol is
+    read in one loop, and only ticks that changed since the last one sent
+    for that symbol are written. Lines of ``control_stream`` such as
+    {"command": "SUBSCRIBE", "symbols": ["GBPUSD"]} (or UNSUBSCRIBE) change
+    the symbol set; the stream stops when it ends or after ``max_polls``.
+    
+    With ``timeframes`` the ticks are also aggregated into bars, and every
+    changed bar is written as a "bar" message (closed or still forming).
+    With ``indicator_params`` (a dict of IncrementalIndicators arguments, {}
+    for the defaults) each series is seeded from STREAM_SEED_BARS history
+    bars and bar messages carry their indicators under "features".
+    """
+    def write(messages):
+        output_stream.write("".join(json.dumps(message) + "\n" for message in messages))
+        output_stream.flush()
+    
+    error = _session.open(server, login)
+    if error:
+        write([dict(error, type="status")])
+        return
+    
+    subscribed = set()
+    last_ticks = {}
+    points = {}
+    aggregator = TickAggregator(timeframes, indicator_params) if timeframes else None
+    lock = threading.Lock()
+    stopped = threading.Event()
+    
+    def subscribe(names):
+        for symbol in names:
+            mt5.symbol_select(symbol, True)
+            subscribed.add(symbol)
+            
+            # Point size, to express bar spreads in points as MT5 does
+            info = _session.symbol_info(symbol)
+            points[symbol] = info.point if info is not None else 0
+            
+            # Start the indicators from history instead of from the first streamed bar
+            if aggregator is not None and indicator_params is not None:
+                for timeframe in timeframes:
+                    rates = mt5.copy_rates_from_pos(symbol, getattr(mt5, MT5_TIMEFRAMES[timeframe]), 0, STREAM_SEED_BARS)
+                    if rates is not None and len(rates):
+                        aggregator.seed(symbol, timeframe, rates)
+    
+    def bar_message(symbol, timeframe, bar, closed):
+        message = dict(bar, type="bar", symbol=symbol, timeframe=timeframe, closed=closed)
+        if indicator_params is not None:
+            features = aggregator.features(symbol, timeframe, closed) or {}
+            message["features"] = {
+                name: None if value != value else value
+                for name, value in features.items() if name not in bar
+            }
+        return message
+    
+    # Apply subscription changes until the control stream ends
+    def read_control():
+        for line in control_stream:
+            try:
+                request = json.loads(line)
+                command = request["command"]
+                names = [str(symbol) for symbol in request.get("symbols", [])]
+            except (ValueError, KeyError, TypeError):
+                continue
+            
+            with lock:
+                if command == "SUBSCRIBE":
+                    subscribe(names)
+                elif command == "UNSUBSCRIBE":
+                    for symbol in names:
+                        subscribed.discard(symbol)
+                        last_ticks.pop(symbol, None)
+        stopped.set()
+    
+    with lock:
+        subscribe(symbols)
+    
+    write([{
+        "type": "status",
+        "success": True,
+        "message": "Stream started",
+        "symbols": sorted(subscribed)
+    }])
+    
+    if control_stream is not None:
+        threading.Thread(target=read_control, daemon=True).start()
+    
+    polls = 0
+    try:
+        while not stopped.is_set() and (max_polls is None or polls < max_polls):
+            started = time.monotonic()
+            
+            # Re-establish the session if the terminal dropped it
+            error = _session.open(server, login)
+            if error:
+                write([dict(error, type="status")])
+            else:
+                changed = []
+                with lock:
+                    for symbol in sorted(subscribed):
+                        tick = mt5.symbol_info_tick(symbol)
+                        if tick is None:
+                            continue
+                        
+                        # Coalesce unchanged ticks
+                        key = (tick.time_msc, tick.bid, tick.ask, tick.last, tick.volume)
+                        if last_ticks.get(symbol) == key:
+                            continue
+                        
+                        last_ticks[symbol] = key
+                        changed.append(tick_to_dict(symbol, tick))
+                        
+                        if aggregator is not None:
+                            spread = int(round((tick.ask - tick.bid) / points[symbol])) if points[symbol] else 0
+                            for timeframe, bar, closed in aggregator.add_tick(symbol, tick.time, tick.bid, int(tick.volume), spread):
+                                changed.append(bar_message(symbol, timeframe, bar, closed))
+                
+                if changed:
+                    write(changed)
+            
+            polls += 1
+            stopped.wait(max(0.0, interval - (time.monotonic() - started)))
+    except BrokenPipeError:
+        # The reader went away
+        pass
+    finally:
+        _session.shutdown()
+
+# Function to run a command with CLI-style arguments
+@json_response
+def run_command(command, server, login, args):
     if command == "CONNECT":
-        if len(sys.argv) < 5:
-            print(json.dumps({
+        if len(args) < 1:
+            return {
                 "success": False,
                 "message": "Missing password for CONNECT command"
-            }))
-            sys.exit(1)
-        password = sys.argv[4]
-        print(connect(server, login, password))
+            }
+        password = args[0]
+        return connect.response(server, login, password)
+    
+    elif command == "DISCONNECT":
+        return disconnect.response(server, login)
+    
+    elif command == "ACCOUNT_INFO":
+        return get_account_info.response(server, login)
     
     elif command == "MARKET_DATA":
-        if len(sys.argv) < 6:
-            print(json.dumps({
+        if len(args) < 2:
+            return {
                 "success": False,
                 "message": "Missing symbol or timeframe for MARKET_DATA command"
-            }))
-            sys.exit(1)
-        symbol = sys.argv[4]
-        timeframe = sys.argv[5]
-        bars = sys.argv[6] if len(sys.argv) > 6 else "100"
-        print(get_market_data(server, login, symbol, timeframe, bars))
+            }
+        symbol = args[0]
+        timeframe = args[1]
+        bars = args[2] if len(args) > 2 else "100"
+        layout = args[3] if len(args) > 3 else "rows"
+        return get_market_data.response(server, login, symbol, timeframe, bars, layout)
     
     elif command == "POSITIONS":
-        print(get_positions(server, login))
+        return get_positions.response(server, login)
     
     elif command == "TRADE":
-        if len(sys.argv) < 7:
-            print(json.dumps({
+        if len(args) < 3:
+            return {
                 "success": False,
                 "message": "Missing parameters for TRADE command"
-            }))
-            sys.exit(1)
-        symbol = sys.argv[4]
-        trade_type = sys.argv[5]
-        volume = sys.argv[6]
-        price = sys.argv[7] if len(sys.argv) > 7 else "0"
-        sl = sys.argv[8] if len(sys.argv) > 8 else "0"
-        tp = sys.argv[9] if len(sys.argv) > 9 else "0"
-        print(place_trade(server, login, symbol, trade_type, volume, price, sl, tp))
+            }
+        symbol = args[0]
+        trade_type = args[1]
+        volume = args[2]
+        price = args[3] if len(args) > 3 else "0"
+        sl = args[4] if len(args) > 4 else "0"
+        tp = args[5] if len(args) > 5 else "0"
+        return place_trade.response(server, login, symbol, trade_type, volume, price, sl, tp)
     
     elif command == "CLOSE":
-        if len(sys.argv) < 5:
-            print(json.dumps({
+        if len(args) < 1:
+            return {
                 "success": False,
                 "message": "Missing ticket for CLOSE command"
-            }))
-            sys.exit(1)
-        ticket = sys.argv[4]
-        print(close_trade(server, login, ticket))
+            }
+        ticket = args[0]
+        return close_trade.response(server, login, ticket)
     
     elif command == "MODIFY":
-        if len(sys.argv) < 7:
-            print(json.dumps({
+        if len(args) < 3:
+            return {
                 "success": False,
                 "message": "Missing parameters for MODIFY command"
-            }))
-            sys.exit(1)
-        ticket = sys.argv[4]
-        sl = sys.argv[5]
-        tp = sys.argv[6]
-        print(modify_trade(server, login, ticket, sl, tp))
+            }
+        ticket = args[0]
+        sl = args[1]
+        tp = args[2]
+        return modify_trade.response(server, login, ticket, sl, tp)
+    
+    elif command == "BATCH":
+        if len(args) < 1:
+            return {
+                "success": False,
+                "message": "Missing items for BATCH command"
+            }
+        try:
+            items = json.loads(args[0])
+        except ValueError as e:
+            return {
+                "success": False,
+                "message": f"Invalid items for BATCH command: {str(e)}"
+            }
+        return execute_batch.response(server, login, items)
     
     else:
-        print(json.dumps({
+        return {
             "success": False,
             "message": f"Unknown command: {command}"
+        }
+
+# Function to run as a resident session daemon
+def serve(input_stream, output_stream, idle_timeout=SESSION_IDLE_TIMEOUT, framed=False):
+    """Serve commands (newline-delimited JSON, or length-prefixed frames when framed) over one persistent MT5 session.
+    
+    Responses are encoded once, in the encoding the request negotiated.
+    """
+    keep_session_open(idle_timeout)
+    
+    channel = open_channel(input_stream, output_stream, framed)
+    
+    for payload in channel:
+        try:
+            request = channel.decode(payload)
+            command = request["command"]
+            server = request.get("server")
+            login = request.get("login")
+            args = [
+                json.dumps(arg) if isinstance(arg, (dict, list)) else str(arg)
+                for arg in request.get("args", [])
+            ]
+        except (ValueError, KeyError, TypeError) as e:
+            request = {}
+            response = {
+                "success": False,
+                "message": f"Invalid request: {str(e)}"
+            }
+        else:
+            try:
+                with _session.lock:
+                    response = run_command.response(command, server, login, args)
+            except Exception as e:
+                response = {
+                    "success": False,
+                    "message": f"{command} failed: {str(e)}"
+                }
+        
+        # Echo the request id so the caller can match responses
+        if "id" in request:
+            response = dict(response, id=request["id"])
+        
+        channel.send(response, request.get("encoding"))
+    
+    _session.shutdown()
+
+# Main function
+if __name__ == "__main__":
+    # Resident session daemon mode
+    if len(sys.argv) > 1 and sys.argv[1] == "SERVE":
+        framed = "--framed" in sys.argv[2:]
+        options = [arg for arg in sys.argv[2:] if arg != "--framed"]
+        idle_timeout = float(options[0]) if options else SESSION_IDLE_TIMEOUT
+        serve(*stdio_streams(framed), idle_timeout, framed)
+        sys.exit(0)
+    
+    # Check arguments
+    if len(sys.argv) < 4:
+        print(json.dumps({
+            "success": False,
+            "message": "Missing arguments. Required: command, server, login, [additional args]"
         }))
+        sys.exit(1)
+    
+    # Tick streaming mode: STREAM server login SYMBOL[,SYMBOL...] [interval] [TIMEFRAME[,TIMEFRAME...]] [indicator_params_json]
+    if sys.argv[1] == "STREAM":
+        symbols = [symbol for symbol in sys.argv[4].split(",") if symbol] if len(sys.argv) > 4 else []
+        interval = float(sys.argv[5]) if len(sys.argv) > 5 else STREAM_INTERVAL
+        timeframes = [timeframe for timeframe in sys.argv[6].split(",") if timeframe] if len(sys.argv) > 6 else None
+        indicator_params = json.loads(sys.argv[7]) if len(sys.argv) > 7 and sys.argv[7] else None
+        stream_ticks(sys.argv[2], sys.argv[3], symbols, sys.stdout, sys.stdin, interval, timeframes=timeframes, indicator_params=indicator_params)
+        sys.exit(0)
+    
+    # Execute command
+    print(run_command(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4:]))
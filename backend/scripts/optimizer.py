@@ -0,0 +1,389 @@
+import os
+import sys
+import json
+import math
+import shutil
+import tempfile
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.backtest import (
+    REGIMES, settings_from_features, market_regimes, trade_levels, simulate_trades, trade_stats
+)
+from scripts.indicators import rolling_mean_2d, rsi_2d, bollinger_2d, macd_2d, true_range_kernel
+from scripts.market_data import RATES_DIR
+from scripts.run_model import ForexModel, INDICATOR_PARAMS, INDICATOR_FEATURE_PARAMS, load_data
+
+# Parameters swept when no grid is given
+DEFAULT_GRID = {
+    "sma_fast": [10, 20],
+    "sma_slow": [50, 100],
+    "rsi_period": [9, 14, 21],
+    "bollinger_std": [2.0, 2.5],
+    "confidence_threshold": [0.5, 0.6, 0.7]
+}
+
+# Backtest settings that can be swept besides the indicator periods
+SIGNAL_SETTINGS = ["confidence_threshold", "risk_reward_minimum", "dynamic_stop_loss", "stop_loss_atr", "take_profit_atr"]
+
+# Indicator periods each preprocess_data column depends on
+COLUMN_PARAMS = {
+    "returns": (),
+    "log_returns": (),
+    "sma_20": ("sma_fast",),
+    "sma_50": ("sma_slow",),
+    "rsi": ("rsi_period",),
+    "atr": ("atr_period",),
+    "adx": ("adx_period",),
+    "bollinger_upper": ("bollinger_period", "bollinger_std"),
+    "bollinger_lower": ("bollinger_period", "bollinger_std"),
+    "macd": ("macd_fast", "macd_slow"),
+    "macd_signal": ("macd_fast", "macd_slow", "macd_signal")
+}
+
+# Rows of the shared table before the indicator columns
+PRICE_ROWS = ["high", "low", "close", "spread", "regime"]
+
+# Shared table of a pool worker: (table, column index, costs)
+_shared = None
+
+# Function to compute one indicator column
+def indicator_column(name, high, low, close, params):
+    """Compute a single preprocess_data column on (series x bars) arrays"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if name in ("returns", "log_returns"):
+            prev_close = np.full(close.shape, np.nan)
+            prev_close[:, 1:] = close[:, :-1]
+            return close / prev_close - 1 if name == "returns" else np.log(close / prev_close)
+        if name == "sma_20":
+            return rolling_mean_2d(close, params["sma_fast"])
+        if name == "sma_50":
+            return rolling_mean_2d(close, params["sma_slow"])
+        if name == "rsi":
+            return rsi_2d(close, params["rsi_period"])
+        if name in ("atr", "adx"):
+            return true_range_kernel(high, low, close, params["atr_period"], params["adx_period"])[name]
+        if name in ("bollinger_upper", "bollinger_lower"):
+            upper, lower = bollinger_2d(close, params["bollinger_period"], params["bollinger_std"])
+            return upper if name == "bollinger_upper" else lower
+        
+        macd, signal = macd_2d(close, params["macd_fast"], params["macd_slow"], params["macd_signal"])
+        return macd if name == "macd" else signal
+
+# Function to key a column by the periods it depends on
+def column_key(name, params):
+    return (name,) + tuple(params[key] for key in COLUMN_PARAMS[name])
+
+# Function to expand a parameter grid into trials
+def expand_grid(grid, base_settings):
+    """Return one settings dict per valid grid point"""
+    names = list(grid)
+    trials = []
+    
+    for values in itertools.product(*(grid[name] for name in names)):
+        point = dict(zip(names, values))
+        params = dict(base_settings["indicator_params"])
+        params.update({name: value for name, value in point.items() if name in INDICATOR_PARAMS})
+        
+        # Skip crossed fast/slow periods
+        if params["sma_fast"] >= params["sma_slow"] or params["macd_fast"] >= params["macd_slow"]:
+            continue
+        
+        trial = {name: base_settings.get(name) for name in SIGNAL_SETTINGS if name in base_settings}
+        trial.update({name: value for name, value in point.items() if name in SIGNAL_SETTINGS})
+        trial["indicator_params"] = params
+        trials.append(trial)
+    
+    return trials
+
+# Function to build the shared indicator table
+def build_table(high, low, close, spread, trials):
+    """Stack prices, regimes and every distinct indicator column the trials need.
+    
+    Each column is computed once per distinct set of periods, however many
+    grid points use it. Returns (table, {column key: row}).
+    """
+    prices = [high[None, :], low[None, :], close[None, :]]
+    regimes = market_regimes(close, {
+        name: indicator_column(name, *prices, INDICATOR_PARAMS)[0] for name in ("atr", "adx")
+    })
+    
+    keys = {}
+    for trial in trials:
+        for name in COLUMN_PARAMS:
+            key = column_key(name, trial["indicator_params"])
+            keys.setdefault(key, trial["indicator_params"])
+    
+    table = np.empty((len(PRICE_ROWS) + len(keys), len(close)))
+    table[0], table[1], table[2] = high, low, close
+    table[3] = spread
+    table[4] = regimes
+    
+    index = {}
+    for row, (key, params) in enumerate(keys.items(), start=len(PRICE_ROWS)):
+        table[row] = indicator_column(key[0], *prices, params)[0]
+        index[key] = row
+    
+    return table, index
+
+# Function to evaluate one trial on several windows
+def evaluate_trial(trial, windows, table, index, costs):
+    """Backtest a trial on each (start, stop) window; returns one stats dict per window"""
+    high, low, close, spread = table[0], table[1], table[2], table[3]
+    regimes = table[4].astype(np.int8)
+    columns = {name: table[index[column_key(name, trial["indicator_params"])]] for name in COLUMN_PARAMS}
+    
+    settings = {name: trial[name] for name in SIGNAL_SETTINGS if name in trial}
+    _, direction, sl_distance, tp_distance = trade_levels(close, columns, **settings)
+    
+    results = []
+    for start, stop in windows:
+        trades = simulate_trades(
+            high, low, close, spread, direction, sl_distance, tp_distance,
+            start, stop, costs["max_bars_held"]
+        )
+        pnl = (trades['exit_price'] - trades['entry_price']) * trades['direction'] * costs["volume"] - costs["commission"]
+        
+        stats = trade_stats(trades, pnl, costs["initial_balance"])
+        entry_regimes = regimes[trades['entry_index']]
+        counts = np.bincount(entry_regimes, minlength=len(REGIMES))
+        profits = np.bincount(entry_regimes, weights=pnl, minlength=len(REGIMES))
+        stats["regimes"] = {
+            name: {"trades": int(counts[i]), "netProfit": float(profits[i])}
+            for i, name in enumerate(REGIMES)
+        }
+        results.append(stats)
+    
+    return results
+
+# Function to initialize an optimizer pool worker
+def _init_optimizer_worker(table_path, index, costs):
+    global _shared
+    
+    # All workers map the same file instead of receiving a copy of the table
+    _shared = (np.load(table_path, mmap_mode='r'), index, costs)
+
+# Function to evaluate a trial inside a pool worker
+def _run_optimizer_job(job):
+    trial, windows = job
+    table, index, costs = _shared
+    return evaluate_trial(trial, windows, table, index, costs)
+
+# Function to split bars into walk-forward windows
+def walk_forward_windows(bars, folds=4, train_fraction=0.75):
+    """Return [(train window, test window)] over consecutive segments of the history"""
+    segment = bars // folds
+    windows = []
+    
+    for fold in range(folds):
+        start = fold * segment
+        stop = bars if fold == folds - 1 else start + segment
+        split = start + int((stop - start) * train_fraction)
+        windows.append(((start, split), (split, stop)))
+    
+    return windows
+
+# Function to convert trial settings to a features fragment
+def features_fragment(trial):
+    """Express trial settings as a features dict fragment (see apply_settings)"""
+    fragment = {
+        "Technical Indicators": {
+            "enabled": True,
+            "parameters": {
+                name: trial["indicator_params"][key] for name, key in INDICATOR_FEATURE_PARAMS.items()
+            }
+        }
+    }
+    
+    if trial.get("confidence_threshold") is not None:
+        fragment["Deep Learning"] = {"parameters": {"confidenceThreshold": trial["confidence_threshold"]}}
+    
+    if trial.get("risk_reward_minimum") is not None:
+        fragment["Advanced Risk Management"] = {"parameters": {"riskRewardMinimum": trial["risk_reward_minimum"]}}
+    
+    return fragment
+
+# Function to merge optimized settings into a features dict
+def apply_settings(features, fragment):
+    """Return a copy of features with the fragment's parameters applied"""
+    merged = dict(features)
+    
+    for name, section in fragment.items():
+        current = dict(merged.get(name, {}))
+        current["parameters"] = dict(current.get("parameters", {}), **section.get("parameters", {}))
+        if "enabled" in section and "enabled" not in current:
+            current["enabled"] = section["enabled"]
+        merged[name] = current
+    
+    return merged
+
+# Function to score a window result
+def score(stats, min_trades):
+    return stats["netProfit"] if stats["trades"] >= min_trades else -math.inf
+
+# Function to run the walk-forward optimization on price arrays
+def optimize(high, low, close, features=None, grid=None, folds=4, train_fraction=0.75,
+             keep_fraction=0.5, min_trades=10, workers=None, spread=0.0, commission=0.0,
+             volume=100000, initial_balance=10000.0, max_bars_held=None):
+    """Walk-forward grid search over indicator periods and signal settings.
+    
+    Every trial is first scored (net profit, at least ``min_trades`` trades)
+    on the first training window; only the best ``keep_fraction`` go on to
+    the remaining folds. Each fold's best trial on its training window is
+    then backtested on the following test window. The last fold's pick is
+    returned as the best settings, together with the best trial per regime.
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    close = np.asarray(close, dtype=float)
+    spread = np.broadcast_to(np.asarray(spread, dtype=float), close.shape)
+    
+    base_settings = settings_from_features(features or {})
+    trials = expand_grid(grid or DEFAULT_GRID, base_settings)
+    windows = walk_forward_windows(len(close), folds, train_fraction)
+    costs = {
+        "commission": commission,
+        "volume": volume,
+        "initial_balance": initial_balance,
+        "max_bars_held": max_bars_held
+    }
+    
+    table, index = build_table(high, low, close, spread, trials)
+    workers = workers or os.cpu_count()
+    
+    if workers > 1:
+        os.makedirs(RATES_DIR, exist_ok=True)
+        directory = tempfile.mkdtemp(prefix="optimizer-", dir=RATES_DIR)
+        table_path = os.path.join(directory, "table.npy")
+        np.save(table_path, table)
+        
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in start_methods else "spawn")
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_optimizer_worker,
+            initargs=(table_path, index, costs)
+        )
+        
+        def run(jobs):
+            return list(pool.map(_run_optimizer_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        directory = pool = None
+        
+        def run(jobs):
+            return [evaluate_trial(trial, trial_windows, table, index, costs) for trial, trial_windows in jobs]
+    
+    try:
+        # First training window for every trial, then prune
+        first = [results[0] for results in run([(trial, [windows[0][0]]) for trial in trials])]
+        ranked = sorted(range(len(trials)), key=lambda i: score(first[i], min_trades), reverse=True)
+        survivors = ranked[:max(1, math.ceil(len(trials) * keep_fraction))]
+        
+        # Remaining windows for the survivors
+        rest = [window for fold, (train, test) in enumerate(windows) for window in ([test] if fold == 0 else [train, test])]
+        results = dict(zip(survivors, run([(trials[i], rest) for i in survivors])))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    # Per-trial train/test stats for every fold
+    def fold_stats(i, fold):
+        if fold == 0:
+            return first[i], results[i][0]
+        return results[i][2 * fold - 1], results[i][2 * fold]
+    
+    fold_reports = []
+    for fold, (train, test) in enumerate(windows):
+        best = max(survivors, key=lambda i: score(fold_stats(i, fold)[0], min_trades))
+        train_stats, test_stats = fold_stats(best, fold)
+        fold_reports.append({
+            "train": list(train),
+            "test": list(test),
+            "settings": trials[best],
+            "trainStats": train_stats,
+            "testStats": test_stats
+        })
+    
+    # Best trial per regime over all training windows
+    regimes = {}
+    for name in REGIMES:
+        def regime_score(i):
+            trades = sum(fold_stats(i, fold)[0]["regimes"][name]["trades"] for fold in range(folds))
+            profit = sum(fold_stats(i, fold)[0]["regimes"][name]["netProfit"] for fold in range(folds))
+            return profit if trades >= min_trades else -math.inf
+        
+        best = max(survivors, key=regime_score)
+        if regime_score(best) > -math.inf:
+            regimes[name] = {
+                "settings": trials[best],
+                "features": features_fragment(trials[best]),
+                "netProfit": regime_score(best)
+            }
+    
+    latest = fold_reports[-1]
+    
+    return {
+        "trials": len(trials),
+        "pruned": len(trials) - len(survivors),
+        "best": {
+            "settings": latest["settings"],
+            "features": features_fragment(latest["settings"]),
+            "trainStats": latest["trainStats"],
+            "testStats": latest["testStats"]
+        },
+        "folds": fold_reports,
+        "outOfSample": {
+            "trades": sum(report["testStats"]["trades"] for report in fold_reports),
+            "netProfit": sum(report["testStats"]["netProfit"] for report in fold_reports)
+        },
+        "regimes": regimes
+    }
+
+# Function to optimize a symbol's market data
+def optimize_symbol(symbol, timeframe, features, data=None, data_path=None, **kwargs):
+    """Run optimize() on market data (inline, .npy path or data source; see load_data)"""
+    model = ForexModel(symbol, timeframe, {}, {})
+    df = model.prepare_frame(load_data(symbol, data, data_path, timeframe, bars=None))
+    
+    result = optimize(
+        df['high'].to_numpy(dtype=float),
+        df['low'].to_numpy(dtype=float),
+        df['close'].to_numpy(dtype=float),
+        features,
+        **kwargs
+    )
+    
+    return dict(result, success=True, symbol=symbol, timeframe=timeframe)
+
+# Function to run the optimizer and return JSON
+def run_optimizer(symbol, timeframe, features_json, options_json="{}", data_path=None):
+    try:
+        features = json.loads(features_json)
+        options = json.loads(options_json)
+        
+        return json.dumps(optimize_symbol(symbol, timeframe, features, data_path=data_path, **options))
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "message": f"Optimization error: {str(e)}"
+        })
+
+# Main execution
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(json.dumps({
+            "success": False,
+            "message": "Missing arguments. Required: symbol, timeframe, features_json [options_json] [data_path]"
+        }))
+        sys.exit(1)
+    
+    options_json = sys.argv[4] if len(sys.argv) > 4 else "{}"
+    data_path = sys.argv[5] if len(sys.argv) > 5 else None
+    
+    print(run_optimizer(sys.argv[1], sys.argv[2], sys.argv[3], options_json, data_path))
@@ -0,0 +1,143 @@
+import os
+import sys
+import struct
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.encoding import DEFAULT_ENCODING, ENCODINGS, encode, decode
+
+# Frame header: payload length as an unsigned 32-bit big-endian integer
+FRAME_HEADER = struct.Struct(">I")
+
+# Wire format tag: the first payload byte of every frame
+FORMAT_TAGS = {"json": b"J", "msgpack": b"M"}
+TAG_FORMATS = {tag: wire_format for wire_format, tag in FORMAT_TAGS.items()}
+
+# Largest accepted frame payload in bytes
+MAX_FRAME_SIZE = 512 * 1024 * 1024
+
+# Function to read exactly n bytes from a binary stream
+def _read_exactly(stream, size):
+    """Return ``size`` bytes, or None if the stream ends first"""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+# Function to read one frame from a binary stream
+def read_frame(stream):
+    """Return the next frame payload, or None at the end of the stream"""
+    header = _read_exactly(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+    
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes exceeds MAX_FRAME_SIZE")
+    
+    payload = _read_exactly(stream, size)
+    if payload is None:
+        raise EOFError("Stream ended inside a frame")
+    return payload
+
+# Function to write one frame to a binary stream
+def write_frame(stream, payload):
+    stream.write(FRAME_HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+class LineChannel:
+    """Newline-delimited JSON messages over text streams"""
+    
+    def __init__(self, input_stream, output_stream):
+        self.input_stream = input_stream
+        self.output_stream = output_stream
+        self.lock = threading.Lock()
+    
+    def __iter__(self):
+        for line in self.input_stream:
+            line = line.strip()
+            if line:
+                yield line
+    
+    def decode(self, line):
+        return decode(line)
+    
+    def send(self, message, encoding=DEFAULT_ENCODING):
+        # Binary encodings cannot travel on text lines
+        if ENCODINGS.get(encoding, ("",))[0] != "json":
+            encoding = DEFAULT_ENCODING
+        line = encode(message, encoding)[1].decode("utf-8") + "\n"
+        with self.lock:
+            self.output_stream.write(line)
+            self.output_stream.flush()
+
+class FrameChannel:
+    """Length-prefixed messages over binary streams.
+    
+    Each message is a FRAME_HEADER followed by its payload: a FORMAT_TAGS
+    byte and the JSON or msgpack body. Bulk requests (bar history, many
+    symbols) need no escaping or line scanning and are read with a handful
+    of reads regardless of size. Responses use the encoding the request
+    negotiated; the tag tells the reader how to decode each frame.
+    
+    Iteration ends at the end of the input, including one that cuts a frame
+    short. A header announcing more than MAX_FRAME_SIZE bytes leaves no way
+    to find the next frame, so it is answered with an error frame and also
+    ends the iteration.
+    """
+    
+    def __init__(self, input_stream, output_stream):
+        self.input_stream = input_stream
+        self.output_stream = output_stream
+        self.lock = threading.Lock()
+    
+    def __iter__(self):
+        while True:
+            try:
+                payload = read_frame(self.input_stream)
+            except EOFError:
+                # The writer went away in the middle of a frame
+                return
+            except ValueError as e:
+                self.send({
+                    "success": False,
+                    "message": f"Invalid frame: {str(e)}"
+                })
+                return
+            
+            if payload is None:
+                return
+            yield payload
+    
+    def decode(self, payload):
+        wire_format = TAG_FORMATS.get(payload[:1])
+        if wire_format is None:
+            raise ValueError(f"Unknown frame format: {payload[:1]!r}")
+        return decode(payload[1:], wire_format)
+    
+    def send(self, message, encoding=DEFAULT_ENCODING):
+        wire_format, body = encode(message, encoding)
+        with self.lock:
+            write_frame(self.output_stream, FORMAT_TAGS[wire_format] + body)
+
+# Function to open the request channel of a resident worker
+def open_channel(input_stream, output_stream, framed=False):
+    """Return a FrameChannel over binary streams or a LineChannel over text streams"""
+    if framed:
+        return FrameChannel(input_stream, output_stream)
+    return LineChannel(input_stream, output_stream)
+
+# Function to get the request streams of the script's stdin/stdout
+def stdio_streams(framed=False):
+    """Return (input, output) streams; framed mode uses the binary buffers and sends stray prints to stderr"""
+    if not framed:
+        return sys.stdin, sys.stdout
+    
+    input_stream, output_stream = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr
+    return input_stream, output_stream
@@ -1,30 +1,92 @@
 import os
 import sys
 import json
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import tensorflow as tf
-from sklearn.preprocessing import StandardScaler
-import lightgbm as lgb
-import requests
-import re
-from bs4 import BeautifulSoup
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-
-# Ensure NLTK resources are downloaded
-try:
-    nltk.data.find('vader_lexicon')
-except LookupError:
-    nltk.download('vader_lexicon')
-
-# Import the advanced forex model components
+
+# Heavy dependencies (tensorflow, lightgbm, sklearn, nltk, BeautifulSoup) are
+# imported by ForexModel.initialize_components only for the enabled features,
+# so purely technical predictions start without them.
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models.deep_learning import LSTMModel, TransformerModel
-from models.sentiment_analyzer import MarketSentimentAnalyzer
-from models.advanced_risk import RiskManager
-from models.adaptive_parameters import AdaptiveParameterManager
+from scripts.market_data import load_rates, save_rates, serialize_rates
+from scripts.data_sources import BarFetcher, data_sources
+from scripts.indicators import IncrementalIndicators, batch_indicators, true_range_kernel
+from scripts.feature_cache import FeatureCache
+from scripts.latency import StageTimer, LatencyHistograms, profile_call
+from scripts.protocol import open_channel, stdio_streams
+from scripts.encoding import dumps
+from scripts.ensemble import ModelSet
+from scripts.model_export import use_exported
+from scripts.synthetic_data import generate_rates
+
+# Default indicator periods used by preprocess_data
+INDICATOR_PARAMS = {
+    "sma_fast": 20,
+    "sma_slow": 50,
+    "rsi_period": 14,
+    "atr_period": 14,
+    "adx_period": 14,
+    "bollinger_period": 20,
+    "bollinger_std": 2.0,
+    "macd_fast": 12,
+    "macd_slow": 26,
+    "macd_signal": 9
+}
+
+# "Technical Indicators" feature parameters and the periods they set
+INDICATOR_FEATURE_PARAMS = {
+    "smaFast": "sma_fast",
+    "smaSlow": "sma_slow",
+    "rsiPeriod": "rsi_period",
+    "atrPeriod": "atr_period",
+    "adxPeriod": "adx_period",
+    "bollingerPeriod": "bollinger_period",
+    "bollingerStd": "bollinger_std",
+    "macdFast": "macd_fast",
+    "macdSlow": "macd_slow",
+    "macdSignal": "macd_signal"
+}
+
+# Function to read indicator periods from a features dict
+def indicator_params(features):
+    """Return INDICATOR_PARAMS overridden by the "Technical Indicators" feature parameters"""
+    params = dict(INDICATOR_PARAMS)
+    feature_params = features.get('Technical Indicators', {}).get('parameters', {})
+    
+    for name, key in INDICATOR_FEATURE_PARAMS.items():
+        if name in feature_params:
+            params[key] = type(INDICATOR_PARAMS[key])(feature_params[name])
+    
+    return params
+
+# Preprocessed feature frames shared by every ForexModel in this process
+FEATURE_CACHE = FeatureCache()
+
+# Stage latencies of the predictions served by this process
+LATENCY = LatencyHistograms()
+
+# Whether the NLTK resources have been checked in this process
+_nltk_ready = False
+
+# Function to make sure NLTK resources are available
+def ensure_nltk_resources():
+    """Download the VADER lexicon on first use of sentiment analysis"""
+    global _nltk_ready
+    if _nltk_ready:
+        return
+    
+    import nltk
+    try:
+        nltk.data.find('vader_lexicon')
+    except LookupError:
+        nltk.download('vader_lexicon')
+    
+    _nltk_ready = True
 
 class ForexModel:
     def __init__(self, symbol, timeframe, features, risk_settings):
@@ -32,42 +94,31 @@ class ForexModel:
         self.timeframe = timeframe
         self.features = features
         self.risk_settings = risk_settings
+        self.indicator_params = indicator_params(features)
+        
+        # Streaming indicator state, created on the first update()
+        self.indicator_engine = None
         
         # Initialize components based on features
         self.initialize_components()
-        
+    
+    @property
+    def dl_model(self):
+        """The deep learning model (or dict of ensemble members) of this configuration, or None"""
+        return self.dl_models.models if self.dl_models else None
+    
     def initialize_components(self):
-        # Initialize deep learning models if enabled
+        # Deep learning models are shared with every model of the same configuration
         if self.features.get('Deep Learning', {}).get('enabled', False):
-            dl_params = self.features.get('Deep Learning', {}).get('parameters', {})
-            model_type = dl_params.get('modelType', 'LSTM')
-            
-            if model_type == 'LSTM':
-                self.dl_model = LSTMModel(
-                    lookback=int(dl_params.get('lookbackPeriod', 60)),
-                    features=['open', 'high', 'low', 'close', 'volume']
-                )
-            elif model_type == 'Transformer':
-                self.dl_model = TransformerModel(
-                    lookback=int(dl_params.get('lookbackPeriod', 60)),
-                    features=['open', 'high', 'low', 'close', 'volume']
-                )
-            else:  # Ensemble
-                self.dl_model = {
-                    'lstm': LSTMModel(
-                        lookback=int(dl_params.get('lookbackPeriod', 60)),
-                        features=['open', 'high', 'low', 'close', 'volume']
-                    ),
-                    'transformer': TransformerModel(
-                        lookback=int(dl_params.get('lookbackPeriod', 60)),
-                        features=['open', 'high', 'low', 'close', 'volume']
-                    )
-                }
+            self.dl_models = get_dl_model_set(self.features['Deep Learning'], self.build_dl_model)
         else:
-            self.dl_model = None
+            self.dl_models = None
         
         # Initialize sentiment analyzer if enabled
         if self.features.get('Sentiment Analysis', {}).get('enabled', False):
+            from models.sentiment_analyzer import MarketSentimentAnalyzer
+            ensure_nltk_resources()
+            
             sentiment_params = self.features.get('Sentiment Analysis', {}).get('parameters', {})
             self.sentiment_analyzer = MarketSentimentAnalyzer(
                 include_social=sentiment_params.get('includeSocialMedia', True),
@@ -79,6 +130,8 @@ class ForexModel:
         
         # Initialize risk manager if enabled
         if self.features.get('Advanced Risk Management', {}).get('enabled', False):
+            from models.advanced_risk import RiskManager
+            
             risk_params = self.features.get('Advanced Risk Management', {}).get('parameters', {})
             self.risk_manager = RiskManager(
                 use_kelly=risk_params.get('useKellyCriterion', True),
@@ -92,6 +145,8 @@ class ForexModel:
         
         # Initialize adaptive parameters if enabled
         if self.features.get('Adaptive Parameters', {}).get('enabled', False):
+            from models.adaptive_parameters import AdaptiveParameterManager
+            
             adaptive_params = self.features.get('Adaptive Parameters', {}).get('parameters', {})
             self.adaptive_manager = AdaptiveParameterManager(
                 detect_regime=adaptive_params.get('marketRegimeDetection', True),
@@ -101,35 +156,132 @@ class ForexModel:
         else:
             self.adaptive_manager = None
     
-    def preprocess_data(self, data):
-        """Preprocess market data for model input"""
-        # Convert to DataFrame if it's a list of dictionaries
-        if isinstance(data, list):
+    def prepare_frame(self, data):
+        """Convert market data to a DataFrame sorted by time"""
+        # Convert to DataFrame if it's a list of dictionaries or columnar dict
+        if isinstance(data, (list, dict)):
             df = pd.DataFrame(data)
             # Convert time strings to datetime
             df['time'] = pd.to_datetime(df['time'])
+        elif isinstance(data, np.ndarray):
+            # MT5 rates array: epoch seconds, no string parsing needed
+            df = pd.DataFrame({name: data[name] for name in data.dtype.names})
+            df['time'] = data['time'].astype('datetime64[s]')
         else:
             df = data.copy()
         
         # Sort by time
-        df = df.sort_values('time')
+        return df.sort_values('time')
+    
+    def preprocess_data(self, data):
+        """Preprocess market data for model input"""
+        return self.calculate_features(self.prepare_frame(data))
+    
+    def calculate_features(self, df):
+        """Add the indicator columns to a prepared frame and drop the warm-up rows"""
+        params = self.indicator_params
         
         # Calculate additional features
         df['returns'] = df['close'].pct_change()
         df['log_returns'] = np.log(df['close'] / df['close'].shift(1))
         
-        # Add technical indicators
-        df['sma_20'] = df['close'].rolling(window=20).mean()
-        df['sma_50'] = df['close'].rolling(window=50).mean()
-        df['rsi'] = self.calculate_rsi(df['close'])
-        df['atr'] = self.calculate_atr(df)
-        df['bollinger_upper'], df['bollinger_lower'] = self.calculate_bollinger_bands(df['close'])
-        df['macd'], df['macd_signal'] = self.calculate_macd(df['close'])
+        # Add technical indicators (column names keep the default periods)
+        df['sma_20'] = df['close'].rolling(window=params['sma_fast']).mean()
+        df['sma_50'] = df['close'].rolling(window=params['sma_slow']).mean()
+        df['rsi'] = self.calculate_rsi(df['close'], params['rsi_period'])
+        
+        # ATR and ADX share one true range kernel call
+        ranges = self.calculate_true_range(df, params['atr_period'], params['adx_period'])
+        df['atr'] = ranges['atr']
+        
+        df['bollinger_upper'], df['bollinger_lower'] = self.calculate_bollinger_bands(
+            df['close'], params['bollinger_period'], params['bollinger_std']
+        )
+        df['macd'], df['macd_signal'] = self.calculate_macd(
+            df['close'], params['macd_fast'], params['macd_slow'], params['macd_signal']
+        )
         
         # Drop NaN values
-        df = df.dropna()
+        valid = df.notna().all(axis=1).to_numpy()
+        
+        # ADX is kept for regime detection without changing which rows are dropped
+        return df[valid].assign(adx=ranges['adx'][valid])
+    
+    def preprocess_cached(self, data, symbol=None, timeframe=None):
+        """Preprocess market data, reusing the shared feature cache when the bars are unchanged"""
+        df = self.prepare_frame(data)
+        key = FEATURE_CACHE.make_key(symbol or self.symbol, timeframe or self.timeframe, self.indicator_params, df)
+        
+        features = FEATURE_CACHE.get(key)
+        if features is None:
+            features = self.extend_cached(key, df)
+        if features is None:
+            features = self.calculate_features(df)
+            FEATURE_CACHE.put(key, features)
+        
+        return features
+    
+    def extend_cached(self, key, df):
+        """Compute only the bars a cached frame of the same series lacks, or return None"""
+        prefix = FEATURE_CACHE.get_prefix(key, df)
+        if prefix is None:
+            return None
+        features, length, engine = prefix
+        
+        if engine is None:
+            # Replay the cached bars once; later extensions continue from the stored state
+            engine = IncrementalIndicators(**self.indicator_params)
+            for bar in df.iloc[:length].to_dict('records'):
+                engine.update(bar)
+        else:
+            engine = engine.copy()
+        
+        new_bars = df.iloc[length:]
+        rows = pd.DataFrame([engine.update(bar) for bar in new_bars.to_dict('records')], index=new_bars.index)
+        rows = rows[features.columns]
+        
+        # Same row selection as preprocess_data
+        valid = rows.drop(columns='adx').notna().all(axis=1).to_numpy()
+        features = pd.concat([features, rows[valid]])
+        
+        FEATURE_CACHE.put(key, features, engine)
+        return features
+    
+    def preprocess_batch(self, datas):
+        """Preprocess many series at once on stacked (series x bars) arrays"""
+        return self.batch_features([self.prepare_frame(data) for data in datas])
+    
+    def batch_features(self, frames):
+        """Add the indicator columns to many prepared frames on stacked (series x bars) arrays"""
+        length = max(len(df) for df in frames)
+        
+        # Stack columns, left-padding shorter series with NaN
+        def stack(column):
+            values = np.full((len(frames), length), np.nan)
+            for i, df in enumerate(frames):
+                values[i, length - len(df):] = df[column].to_numpy(dtype=float)
+            return values
         
-        return df
+        columns = batch_indicators(stack('high'), stack('low'), stack('close'), **self.indicator_params)
+        adx = columns.pop('adx')
+        
+        results = []
+        for i, df in enumerate(frames):
+            offset = length - len(df)
+            for name, values in columns.items():
+                df[name] = values[i, offset:]
+            
+            # Same row selection as preprocess_data
+            valid = df.notna().all(axis=1).to_numpy()
+            results.append(df[valid].assign(adx=adx[i, offset:][valid]))
+        
+        return results
+    
+    def update(self, bar):
+        """Append one bar to the streaming indicators and return the latest feature row"""
+        if self.indicator_engine is None:
+            self.indicator_engine = IncrementalIndicators(**self.indicator_params)
+        return self.indicator_engine.update(bar)
     
     def calculate_rsi(self, prices, period=14):
         """Calculate RSI indicator"""
@@ -141,19 +293,20 @@ class ForexModel:
         rsi = 100 - (100 / (1 + rs))
         return rsi
     
+    def calculate_true_range(self, df, atr_period=14, adx_period=14):
+        """Calculate TR, ATR, +DM/-DM, +DI/-DI, DX and ADX arrays in one kernel call"""
+        return true_range_kernel(
+            df['high'].to_numpy(dtype=float),
+            df['low'].to_numpy(dtype=float),
+            df['close'].to_numpy(dtype=float),
+            atr_period,
+            adx_period
+        )
+    
     def calculate_atr(self, df, period=14):
         """Calculate Average True Range"""
-        high = df['high']
-        low = df['low']
-        close = df['close']
-        
-        tr1 = high - low
-        tr2 = abs(high - close.shift())
-        tr3 = abs(low - close.shift())
-        
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-        atr = tr.rolling(window=period).mean()
-        return atr
+        atr = self.calculate_true_range(df, atr_period=period)['atr']
+        return pd.Series(atr, index=df.index)
     
     def calculate_bollinger_bands(self, prices, period=20, std_dev=2):
         """Calculate Bollinger Bands"""
@@ -173,8 +326,8 @@ class ForexModel:
     
     def detect_market_regime(self, df):
         """Detect market regime (trending, ranging, volatile)"""
-        # Calculate directional movement
-        adx = self.calculate_adx(df)
+        # Calculate directional movement (reuse preprocess_data's ADX if present)
+        adx = df['adx'] if 'adx' in df.columns else self.calculate_adx(df)
         
         # Calculate volatility
         volatility = df['atr'] / df['close'] * 100
@@ -191,49 +344,111 @@ class ForexModel:
     
     def calculate_adx(self, df, period=14):
         """Calculate Average Directional Index"""
-        high = df['high']
-        low = df['low']
-        close = df['close']
+        adx = self.calculate_true_range(df, adx_period=period)['adx']
+        return pd.Series(adx, index=df.index)
+    
+    def get_sentiment_score(self, symbol=None):
+        """Get sentiment score for the symbol"""
+        if self.sentiment_analyzer:
+            return self.sentiment_analyzer.get_sentiment(symbol or self.symbol)
+        return 0.0
+    
+    def generate_prediction(self, data, timer=None):
+        """Generate trading prediction based on market data"""
+        timer = timer or StageTimer()
         
-        # Calculate +DM and -DM
-        plus_dm = high.diff()
-        minus_dm = low.diff()
+        # Preprocess data
+        df = self.preprocess_cached(data)
+        timer.lap("preprocess")
         
-        # Adjust +DM and -DM
-        plus_dm = plus_dm.where((plus_dm > 0) & (plus_dm > minus_dm.abs()), 0)
-        minus_dm = minus_dm.abs().where((minus_dm < 0) & (minus_dm.abs() > plus_dm), 0)
+        # Generate prediction from deep learning model if enabled
+        dl_prediction, dl_confidence = self.deep_learning_predictions([df])[0]
+        timer.lap("dl_inference")
         
-        # Calculate TR
-        tr1 = high - low
-        tr2 = (high - close.shift()).abs()
-        tr3 = (low - close.shift()).abs()
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+        return self.build_prediction(df, dl_prediction, dl_confidence, timer=timer)
+    
+    def generate_batch_prediction(self, items, timer=None):
+        """Generate predictions for many (symbol, timeframe, data) items in one call"""
+        timer = timer or StageTimer()
+        frames = [self.prepare_frame(data) for _, _, data in items]
+        keys = [
+            FEATURE_CACHE.make_key(symbol, timeframe, self.indicator_params, df)
+            for (symbol, timeframe, _), df in zip(items, frames)
+        ]
+        dfs = [FEATURE_CACHE.get(key) for key in keys]
         
-        # Calculate smoothed values
-        smoothed_tr = tr.rolling(window=period).sum()
-        smoothed_plus_dm = plus_dm.rolling(window=period).sum()
-        smoothed_minus_dm = minus_dm.rolling(window=period).sum()
+        # Extend cached frames of the same series by their new bars
+        for i, df in enumerate(dfs):
+            if df is None:
+                dfs[i] = self.extend_cached(keys[i], frames[i])
         
-        # Calculate +DI and -DI
-        plus_di = 100 * smoothed_plus_dm / smoothed_tr
-        minus_di = 100 * smoothed_minus_dm / smoothed_tr
+        # Compute indicators for the remaining misses together
+        missing = [i for i, df in enumerate(dfs) if df is None]
+        if missing:
+            for i, df in zip(missing, self.batch_features([frames[i] for i in missing])):
+                FEATURE_CACHE.put(keys[i], df)
+                dfs[i] = df
+        timer.lap("preprocess")
         
-        # Calculate DX and ADX
-        dx = 100 * (plus_di - minus_di).abs() / (plus_di + minus_di)
-        adx = dx.rolling(window=period).mean()
+        # Run the deep learning model(s) over all frames at once
+        dl_outputs = self.deep_learning_predictions(dfs)
+        timer.lap("dl_inference")
         
-        return adx
+        # Each result reports the shared stages of the whole batch
+        return [
+            self.build_prediction(df, dl_prediction, dl_confidence, symbol, timeframe, timer.copy())
+            for (symbol, timeframe, _), df, (dl_prediction, dl_confidence) in zip(items, dfs, dl_outputs)
+        ]
     
-    def get_sentiment_score(self):
-        """Get sentiment score for the symbol"""
-        if self.sentiment_analyzer:
-            return self.sentiment_analyzer.get_sentiment(self.symbol)
-        return 0.0
+    def build_dl_model(self):
+        """Create the deep learning model, or dict of ensemble members, of this configuration"""
+        from models.deep_learning import LSTMModel, TransformerModel
+        
+        dl_params = self.features['Deep Learning'].get('parameters', {})
+        model_type = dl_params.get('modelType', 'LSTM')
+        
+        if model_type == 'LSTM':
+            dl_model = LSTMModel(
+                lookback=int(dl_params.get('lookbackPeriod', 60)),
+                features=['open', 'high', 'low', 'close', 'volume']
+            )
+        elif model_type == 'Transformer':
+            dl_model = TransformerModel(
+                lookback=int(dl_params.get('lookbackPeriod', 60)),
+                features=['open', 'high', 'low', 'close', 'volume']
+            )
+        else:  # Ensemble
+            dl_model = {
+                'lstm': LSTMModel(
+                    lookback=int(dl_params.get('lookbackPeriod', 60)),
+                    features=['open', 'high', 'low', 'close', 'volume']
+                ),
+                'transformer': TransformerModel(
+                    lookback=int(dl_params.get('lookbackPeriod', 60)),
+                    features=['open', 'high', 'low', 'close', 'volume']
+                )
+            }
+        
+        # Run on an exported CPU runtime (TFLite/ONNX) when DL_EXPORT_DIR holds one
+        members = dl_model if isinstance(dl_model, dict) else {model_type.lower(): dl_model}
+        for name, member in members.items():
+            use_exported(member, name, int(dl_params.get('lookbackPeriod', 60)))
+        
+        return dl_model
     
-    def generate_prediction(self, data):
-        """Generate trading prediction based on market data"""
-        # Preprocess data
-        df = self.preprocess_data(data)
+    def deep_learning_predictions(self, dfs):
+        """Get (prediction, confidence) from the deep learning model(s) for each frame"""
+        if not self.dl_models:
+            return [(0.0, 0.0)] * len(dfs)
+        
+        # Frames of requests running concurrently go through the models together
+        return self.dl_models.predict(dfs)
+    
+    def build_prediction(self, df, dl_prediction, dl_confidence, symbol=None, timeframe=None, timer=None):
+        """Combine regime, sentiment, deep learning and technical signals into a result"""
+        timer = timer or StageTimer()
+        symbol = symbol or self.symbol
+        timeframe = timeframe or self.timeframe
         
         # Detect market regime if adaptive parameters are enabled
         market_regime = "UNKNOWN"
@@ -241,33 +456,17 @@ class ForexModel:
             market_regime = self.detect_market_regime(df)
             # Adjust parameters based on regime
             self.adaptive_manager.adjust_parameters(market_regime, df)
+        timer.lap("regime")
         
         # Get sentiment score if sentiment analysis is enabled
         sentiment_score = 0.0
         if self.sentiment_analyzer:
-            sentiment_score = self.get_sentiment_score()
-        
-        # Generate prediction from deep learning model if enabled
-        dl_prediction = 0.0
-        dl_confidence = 0.0
-        if self.dl_model:
-            if isinstance(self.dl_model, dict):  # Ensemble
-                lstm_pred, lstm_conf = self.dl_model['lstm'].predict(df)
-                transformer_pred, transformer_conf = self.dl_model['transformer'].predict(df)
-                
-                # Weighted average based on confidence
-                total_conf = lstm_conf + transformer_conf
-                if total_conf > 0:
-                    dl_prediction = (lstm_pred * lstm_conf + transformer_pred * transformer_conf) / total_conf
-                    dl_confidence = max(lstm_conf, transformer_conf)
-                else:
-                    dl_prediction = 0.0
-                    dl_confidence = 0.0
-            else:
-                dl_prediction, dl_confidence = self.dl_model.predict(df)
+            sentiment_score = self.get_sentiment_score(symbol)
+        timer.lap("sentiment")
         
         # Generate prediction from technical indicators
         tech_prediction, tech_confidence = self.technical_prediction(df)
+        timer.lap("technical")
         
         # Combine predictions
         dl_weight = 0.6 if self.dl_model else 0.0
@@ -338,12 +537,13 @@ class ForexModel:
             if risk_reward < self.risk_manager.min_rr:
                 direction = "NEUTRAL"
                 confidence = 0
+        timer.lap("risk")
         
         # Prepare result
         result = {
             "success": True,
-            "symbol": self.symbol,
-            "timeframe": self.timeframe,
+            "symbol": symbol,
+            "timeframe": timeframe,
             "direction": direction,
             "confidence": float(confidence),
             "entryPrice": float(entry_price),
@@ -357,7 +557,8 @@ class ForexModel:
                 "dl_confidence": float(dl_confidence),
                 "tech_prediction": float(tech_prediction),
                 "tech_confidence": float(tech_confidence),
-                "atr": float(atr)
+                "atr": float(atr),
+                "timings_ms": timer.milliseconds()
             }
         }
         
@@ -410,77 +611,548 @@ class ForexModel:
         else:
             return 0.0, 0.0
 
-# Function to run model prediction
-def run_prediction(symbol, timeframe, features_json, risk_settings_json):
-    try:
-        # Parse JSON inputs
-        features = json.loads(features_json)
-        risk_settings = json.loads(risk_settings_json)
+# Maximum number of warm ForexModel instances kept by a worker process
+MAX_CACHED_MODELS = 64
+
+# Warm model instances keyed by symbol, timeframe and configuration
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+# Deep learning model sets keyed by their Deep Learning configuration
+_dl_model_sets = {}
+_dl_model_sets_lock = threading.Lock()
+
+# Function to get the deep learning models shared by a configuration
+def get_dl_model_set(dl_features, build):
+    """Return the ModelSet of a Deep Learning configuration, calling build() for its models once"""
+    key = json.dumps(dl_features, sort_keys=True)
+    
+    with _dl_model_sets_lock:
+        model_set = _dl_model_sets.get(key)
+        if model_set is None:
+            model_set = ModelSet(build())
+            _dl_model_sets[key] = model_set
+    
+    return model_set
+
+# Function to get a warm model instance
+def get_model(symbol, timeframe, features, risk_settings):
+    """Return a cached ForexModel for this configuration, creating it if needed"""
+    key = (
+        symbol,
+        timeframe,
+        json.dumps(features, sort_keys=True),
+        json.dumps(risk_settings, sort_keys=True)
+    )
+    
+    with _model_cache_lock:
+        model = _model_cache.get(key)
+        if model is None:
+            model = ForexModel(symbol, timeframe, features, risk_settings)
+            _model_cache[key] = model
+            if len(_model_cache) > MAX_CACHED_MODELS:
+                _model_cache.popitem(last=False)
+        else:
+            _model_cache.move_to_end(key)
+    
+    return model
+
+# Number of stored bars a prediction reads from the bar store
+MODEL_HISTORY_BARS = 500
+
+# Bars fetched from data sources, shared by every model of this process
+BAR_FETCHER = BarFetcher()
+
+# Environment variable allowing generated sample bars when no source has data (tests and demos only)
+SAMPLE_DATA_ENV = "MODEL_SAMPLE_DATA"
+
+class MarketDataUnavailable(ValueError):
+    """No data source returned bars for a request; ``error`` holds the sources' errors"""
+    
+    def __init__(self, message, error):
+        super().__init__(message)
+        self.error = error
+
+# Function to check whether sample bars may stand in for missing market data
+def sample_data_enabled():
+    return os.environ.get(SAMPLE_DATA_ENV, "").lower() in ("1", "true", "yes")
+
+# Function to get the market data for a request
+def load_data(symbol, data=None, data_path=None, timeframe=None, bars=MODEL_HISTORY_BARS, data_source=None, sample_data=None):
+    """Return the bars for a request (all of them if bars is None).
+    
+    Inline data and npy paths win; otherwise the bars come from
+    ``data_source`` (see data_sources), or the bar store configured by the
+    environment, through the shared BAR_FETCHER. When no source has the bars
+    MarketDataUnavailable is raised, unless ``sample_data`` (default: the
+    MODEL_SAMPLE_DATA environment variable) allows generated sample bars.
+    """
+    # Inline bars (rows or columnar)
+    if data is not None:
+        return data
+    
+    # Memory-map bars written by mt5_connection.py (npy layout)
+    if data_path:
+        return load_rates(data_path)
+    
+    # MT5 session, bar store or inline series, fetched once per symbol/timeframe
+    errors = []
+    if timeframe:
+        sources = data_sources(data_source)
+        rates = BAR_FETCHER.fetch(symbol, timeframe, bars, sources)
+        if rates is not None:
+            return rates
         
-        # Create model instance
-        model = ForexModel(symbol, timeframe, features, risk_settings)
+        errors = [source.error["message"] for source in sources if getattr(source, 'error', None)]
+    
+    # Generated bars only when explicitly enabled: live predictions must not run on fake prices
+    if sample_data if sample_data is not None else sample_data_enabled():
+        return generate_sample_data(symbol, 100)
+    
+    raise MarketDataUnavailable(
+        f"No market data for {symbol} {timeframe}",
+        "; ".join(errors) or "No data source returned bars"
+    )
+
+# Function to generate a prediction as a result dict
+def predict(symbol, timeframe, features, risk_settings, data_path=None, data=None, data_source=None):
+    try:
+        timer = StageTimer()
         
-        # Generate sample data for testing
-        # In a real implementation, this would come from MT5
-        data = generate_sample_data(symbol, 100)
+        # Reuse a warm model instance
+        model = get_model(symbol, timeframe, features, risk_settings)
+        data = load_data(symbol, data, data_path, timeframe, data_source=data_source)
+        timer.lap("load_data")
         
         # Generate prediction
-        prediction = model.generate_prediction(data)
+        return model.generate_prediction(data, timer)
+    
+    except MarketDataUnavailable as e:
+        return {
+            "success": False,
+            "message": f"Model prediction failed: {str(e)}",
+            "error": e.error
+        }
+    
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Model prediction failed: {str(e)}"
+        }
+
+# Function to generate predictions for many symbols/timeframes in one call
+def predict_batch(items, features, risk_settings, data_source=None):
+    try:
+        timer = StageTimer()
+        
+        # One warm model serves every item sharing this configuration
+        model = get_model(None, None, features, risk_settings)
+        
+        batch = []
+        errors = {}
+        for index, item in enumerate(items):
+            try:
+                data = load_data(
+                    item["symbol"],
+                    item.get("data"),
+                    item.get("dataPath"),
+                    item["timeframe"],
+                    data_source=item.get("dataSource", data_source)
+                )
+            except MarketDataUnavailable as e:
+                # Items without market data fail on their own
+                errors[index] = {
+                    "success": False,
+                    "symbol": item["symbol"],
+                    "timeframe": item["timeframe"],
+                    "message": f"Model prediction failed: {str(e)}",
+                    "error": e.error
+                }
+                continue
+            batch.append((item["symbol"], item["timeframe"], data))
+        timer.lap("load_data")
         
-        return json.dumps(prediction)
+        predictions = iter(model.generate_batch_prediction(batch, timer) if batch else [])
+        return {
+            "success": True,
+            "predictions": [errors[i] if i in errors else next(predictions) for i in range(len(items))]
+        }
     
     except Exception as e:
+        return {
+            "success": False,
+            "message": f"Batch prediction failed: {str(e)}"
+        }
+
+# Per-process configuration of a prediction pool worker
+_pool_config = None
+
+# Shared prediction pool and the configuration it was started with
+_prediction_pool = None
+_prediction_pool_key = None
+
+# Function to initialize a prediction pool worker
+def _init_pool_worker(features, risk_settings, cpus, worker_counter):
+    global _pool_config
+    
+    # Pin each worker to one of the configured CPUs
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        with worker_counter.get_lock():
+            index = worker_counter.value
+            worker_counter.value += 1
+        os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+    
+    # Load the models once per worker
+    _pool_config = (features, risk_settings)
+    get_model(None, None, features, risk_settings)
+
+# Function to run one prediction job inside a pool worker
+def _run_pool_job(job):
+    features, risk_settings = _pool_config
+    result = predict_batch([job], features, risk_settings)
+    
+    if not result["success"]:
+        return dict(result, symbol=job.get("symbol"), timeframe=job.get("timeframe"))
+    
+    return result["predictions"][0]
+
+# Function to get a process pool for a model configuration
+def get_prediction_pool(features, risk_settings, workers=None, cpus=None):
+    """Return a warm process pool, restarting it if the configuration changed"""
+    global _prediction_pool, _prediction_pool_key
+    
+    key = (
+        json.dumps(features, sort_keys=True),
+        json.dumps(risk_settings, sort_keys=True),
+        workers,
+        tuple(cpus or ())
+    )
+    
+    if _prediction_pool is not None and _prediction_pool_key == key:
+        return _prediction_pool
+    
+    shutdown_prediction_pool()
+    
+    # Avoid forking a process that may already hold TensorFlow state
+    start_methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in start_methods else "spawn")
+    
+    _prediction_pool = ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=context,
+        initializer=_init_pool_worker,
+        initargs=(features, risk_settings, list(cpus or []), context.Value('i', 0))
+    )
+    _prediction_pool_key = key
+    
+    return _prediction_pool
+
+# Function to stop the shared process pool
+def shutdown_prediction_pool():
+    global _prediction_pool, _prediction_pool_key
+    
+    if _prediction_pool is not None:
+        _prediction_pool.shutdown()
+    
+    _prediction_pool = None
+    _prediction_pool_key = None
+
+# Function to fetch the bars of pool jobs once in the parent process
+def share_job_data(jobs, data_source=None):
+    """Fetch each symbol/timeframe once and hand it to every job that needs it.
+    
+    Fetched rates are written as npy files (dataPath), so workers memory-map
+    them instead of each fetching or unpickling their own copy.
+    """
+    paths = {}
+    shared = []
+    
+    for job in jobs:
+        if job.get("data") is not None or job.get("dataPath"):
+            shared.append(job)
+            continue
+        
+        source = job.get("dataSource", data_source)
+        key = (job["symbol"], job["timeframe"], json.dumps(source, sort_keys=True))
+        if key not in paths:
+            try:
+                rates = BAR_FETCHER.fetch(job["symbol"], job["timeframe"], MODEL_HISTORY_BARS, data_sources(source))
+                if isinstance(rates, np.ndarray):
+                    paths[key] = {"dataPath": save_rates(rates, job["symbol"], job["timeframe"])}
+                else:
+                    paths[key] = {} if rates is None else {"data": rates}
+            except Exception:
+                # The worker loads the data itself and reports the failure for its own item
+                paths[key] = {}
+        
+        shared.append(dict(job, **paths[key]))
+    
+    return shared
+
+# Function to check a pool job before it is sent to a worker
+def _job_error(job):
+    if not isinstance(job, dict):
+        return {
+            "success": False,
+            "message": "Invalid item: expected an object"
+        }
+    
+    missing = [name for name in ("symbol", "timeframe") if not isinstance(job.get(name), str) or not job[name]]
+    if missing:
+        return {
+            "success": False,
+            "symbol": job.get("symbol"),
+            "timeframe": job.get("timeframe"),
+            "message": f"Missing arguments. Required: {', '.join(missing)}"
+        }
+    
+    return None
+
+# Function to run predictions across CPU cores
+def run_parallel_predictions(jobs, features, risk_settings, workers=None, cpus=None, data_source=None):
+    """Yield prediction results in completion order, so slow symbols don't hold up others.
+    
+    Invalid items and failed predictions are yielded as failure results;
+    ValueError (bad workers) and BrokenProcessPool end the whole request.
+    """
+    if workers is not None and (isinstance(workers, bool) or not isinstance(workers, int) or workers < 1):
+        raise ValueError(f"Invalid workers: {workers!r}")
+    
+    valid = []
+    for job in jobs:
+        error = _job_error(job)
+        if error:
+            yield error
+        else:
+            valid.append(job)
+    
+    if not valid:
+        return
+    
+    pool = get_prediction_pool(features, risk_settings, workers, cpus)
+    jobs = share_job_data(valid, data_source)
+    try:
+        futures = {pool.submit(_run_pool_job, job): job for job in jobs}
+    except BrokenProcessPool:
+        # Start a fresh pool on the next request
+        shutdown_prediction_pool()
+        raise
+    
+    for future in as_completed(futures):
+        job = futures[future]
+        try:
+            yield future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                shutdown_prediction_pool()
+            yield {
+                "success": False,
+                "symbol": job.get("symbol"),
+                "timeframe": job.get("timeframe"),
+                "message": f"Model prediction failed: {str(e)}"
+            }
+
+# Function to run model prediction
+def run_prediction(symbol, timeframe, features_json, risk_settings_json, data_path=None, data_source_json=None):
+    try:
+        # Parse JSON inputs
+        features = json.loads(features_json)
+        risk_settings = json.loads(risk_settings_json)
+        data_source = json.loads(data_source_json) if data_source_json else None
+    except ValueError as e:
         return json.dumps({
             "success": False,
             "message": f"Model prediction failed: {str(e)}"
         })
+    
+    return dumps(predict(symbol, timeframe, features, risk_settings, data_path or None, data_source=data_source))
 
-# Function to generate sample data for testing
-def generate_sample_data(symbol, bars=100):
-    """Generate sample OHLCV data for testing"""
-    np.random.seed(42)  # For reproducibility
-    
-    # Start with a base price
-    base_price = 1.2000 if symbol.startswith("EUR") else 1.5000
-    
-    # Generate random price movements
-    returns = np.random.normal(0, 0.001, bars)
-    prices = base_price * np.exp(np.cumsum(returns))
-    
-    # Generate OHLCV data
-    data = []
-    for i in range(bars):
-        close_price = prices[i]
-        high_price = close_price * (1 + abs(np.random.normal(0, 0.0005)))
-        low_price = close_price * (1 - abs(np.random.normal(0, 0.0005)))
-        open_price = close_price * (1 + np.random.normal(0, 0.0003))
-        volume = int(np.random.normal(1000, 200))
-        
-        # Ensure high is highest and low is lowest
-        high_price = max(high_price, open_price, close_price)
-        low_price = min(low_price, open_price, close_price)
-        
-        # Create timestamp
-        timestamp = datetime.now() - timedelta(minutes=i)
-        
-        data.append({
-            "time": timestamp.isoformat(),
-            "open": float(open_price),
-            "high": float(high_price),
-            "low": float(low_price),
-            "close": float(close_price),
-            "tick_volume": volume,
-            "spread": 2,
-            "real_volume": volume * 10
-        })
+# Function to run a worker command, under a profiler if the request asks for it
+def _run_profiled(request, func, *args):
+    if not request.get("profile"):
+        return func(*args)
     
-    # Reverse to get chronological order
-    data.reverse()
+    try:
+        response, report = profile_call(func, *args, profiler=request.get("profiler", "cprofile"))
+    except ImportError as e:
+        return {
+            "success": False,
+            "message": f"Profiler unavailable: {str(e)}"
+        }
     
-    return data
+    return dict(response, profile=report)
+
+# Function to record the stage timings of prediction results
+def _observe_latency(predictions):
+    for prediction in predictions:
+        if prediction.get("success"):
+            LATENCY.observe_timings(prediction["parameters"]["timings_ms"])
+
+# Function to handle a single worker request
+def handle_worker_request(request, emit=None):
+    """Handle one worker request; streamed results are passed to emit() when given"""
+    command = request.get("command", "PREDICT")
+    
+    if command == "PING":
+        response = {"success": True, "message": "pong"}
+    elif command == "CACHE_STATS":
+        response = {"success": True, "featureCache": FEATURE_CACHE.stats(), "barFetcher": BAR_FETCHER.stats()}
+    elif command == "METRICS":
+        response = {"success": True, "metrics": LATENCY.render(), "stages": LATENCY.snapshot()}
+    elif command == "PREDICT":
+        if "symbol" not in request or "timeframe" not in request:
+            response = {
+                "success": False,
+                "message": "Missing arguments. Required: symbol, timeframe"
+            }
+        else:
+            response = _run_profiled(
+                request,
+                predict,
+                request["symbol"],
+                request["timeframe"],
+                request.get("features", {}),
+                request.get("riskSettings", {}),
+                request.get("dataPath"),
+                request.get("data"),
+                request.get("dataSource")
+            )
+            _observe_latency([response])
+    elif command == "PREDICT_BATCH":
+        if not request.get("items"):
+            response = {
+                "success": False,
+                "message": "Missing arguments. Required: items"
+            }
+        else:
+            response = _run_profiled(
+                request,
+                predict_batch,
+                request["items"],
+                request.get("features", {}),
+                request.get("riskSettings", {}),
+                request.get("dataSource")
+            )
+            _observe_latency(response.get("predictions", []))
+    elif command == "PREDICT_PARALLEL":
+        if not request.get("items"):
+            response = {
+                "success": False,
+                "message": "Missing arguments. Required: items"
+            }
+        else:
+            results = run_parallel_predictions(
+                request["items"],
+                request.get("features", {}),
+                request.get("riskSettings", {}),
+                request.get("workers"),
+                request.get("cpus"),
+                request.get("dataSource")
+            )
+            
+            count = 0
+            predictions = []
+            try:
+                for result in results:
+                    count += 1
+                    if emit:
+                        emit({"id": request.get("id"), "partial": True, "result": result})
+                    else:
+                        predictions.append(result)
+                
+                response = {"success": True, "count": count}
+            except Exception as e:
+                # Results already streamed stand; the request as a whole failed
+                response = {
+                    "success": False,
+                    "count": count,
+                    "message": f"Parallel prediction failed: {str(e)}"
+                }
+            if not emit:
+                response["predictions"] = predictions
+    else:
+        response = {
+            "success": False,
+            "message": f"Unknown command: {command}"
+        }
+    
+    # Echo the request id so the caller can match responses
+    if "id" in request:
+        response = dict(response, id=request["id"])
+    
+    return response
+
+# Prediction requests a worker runs at once; concurrent requests share deep learning micro-batches
+WORKER_THREADS = int(os.environ.get("MODEL_WORKER_THREADS", 1))
+
+# Commands a threaded worker runs concurrently (the others run in arrival order)
+CONCURRENT_COMMANDS = ("PREDICT", "PREDICT_BATCH")
+
+# Function to run as a resident prediction worker
+def run_worker(input_stream, output_stream, framed=False, threads=WORKER_THREADS):
+    """Serve requests (newline-delimited JSON, or length-prefixed frames when framed), keeping models warm between calls.
+    
+    A request may ask for its responses in another encoding ("orjson",
+    "msgpack"); unavailable encodings fall back to JSON. With ``threads`` > 1
+    prediction requests run concurrently and may be answered out of order,
+    so callers match responses by id.
+    """
+    channel = open_channel(input_stream, output_stream, framed)
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="predict") if threads > 1 else None
+    
+    def respond(request):
+        # Streamed results use the encoding the request negotiated
+        encoding = request.get("encoding")
+        try:
+            response = handle_worker_request(request, lambda message: channel.send(message, encoding))
+        except Exception as e:
+            # A failing request must not take the worker (and the requests queued on it) down
+            response = {
+                "success": False,
+                "message": f"Worker request failed: {str(e)}"
+            }
+            if "id" in request:
+                response["id"] = request["id"]
+        channel.send(response, encoding)
+    
+    try:
+        for payload in channel:
+            try:
+                request = channel.decode(payload)
+                if not isinstance(request, dict):
+                    raise ValueError(f"expected an object, got {type(request).__name__}")
+            except ValueError as e:
+                channel.send({
+                    "success": False,
+                    "message": f"Invalid request: {str(e)}"
+                })
+                continue
+            
+            if executor is not None and request.get("command", "PREDICT") in CONCURRENT_COMMANDS:
+                executor.submit(respond, request)
+            else:
+                respond(request)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+# Function to generate sample data for testing
+def generate_sample_data(symbol, bars=100, timeframe="1m", seed=42):
+    """Generate sample OHLCV data for testing (bars ending now, oldest first)"""
+    # Seeded generator, so the global NumPy random state is left alone
+    return serialize_rates(generate_rates(bars, symbol, timeframe, seed=seed), "rows")
 
 # Main function
 if __name__ == "__main__":
+    # Resident worker mode
+    if len(sys.argv) > 1 and sys.argv[1] == "WORKER":
+        framed = "--framed" in sys.argv[2:]
+        try:
+            run_worker(*stdio_streams(framed), framed)
+        finally:
+            shutdown_prediction_pool()
+        sys.exit(0)
+    
     # Check arguments
     if len(sys.argv) < 5:
         print(json.dumps({
@@ -494,7 +1166,9 @@ if __name__ == "__main__":
     timeframe = sys.argv[2]
     features_json = sys.argv[3]
     risk_settings_json = sys.argv[4]
+    data_path = sys.argv[5] if len(sys.argv) > 5 else None
+    data_source_json = sys.argv[6] if len(sys.argv) > 6 else None
     
     # Run prediction
-    result = run_prediction(symbol, timeframe, features_json, risk_settings_json)
+    result = run_prediction(symbol, timeframe, features_json, risk_settings_json, data_path, data_source_json)
     print(result)
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.market_data import RATES_DTYPE
+from scripts.bar_store import TIMEFRAME_SECONDS
+from scripts.indicators import ewm_2d
+
+# Market regimes of the synthetic feed, in regime code order
+REGIMES = ["TRENDING", "VOLATILE", "RANGING"]
+
+# Per-regime volatility multiplier and trend drift (in volatilities per bar)
+REGIME_VOLATILITY = np.array([1.0, 2.5, 0.6])
+REGIME_DRIFT = np.array([0.3, 0.0, 0.0])
+
+# AR(1) coefficient of the price deviation while ranging
+RANGE_PERSISTENCE = 0.5
+
+# Probability that a trend heads back towards the starting price
+TREND_REVERSION = 0.75
+
+# Starting prices of known symbols (others start at 1.0)
+BASE_PRICES = {
+    "EURUSD": 1.2000,
+    "GBPUSD": 1.5000,
+    "USDJPY": 110.00,
+    "AUDUSD": 0.7500,
+    "USDCAD": 1.2500,
+    "USDCHF": 0.9200,
+    "NZDUSD": 0.7000
+}
+
+# Annualized volatility of the synthetic prices
+ANNUAL_VOLATILITY = 0.08
+
+# Function to draw a regime-switching path
+def regime_path(bars, rng, mean_length=500):
+    """Return one regime code per bar; regimes last ``mean_length`` bars on average"""
+    lengths = rng.geometric(1.0 / mean_length, size=bars // mean_length + 16)
+    while lengths.sum() < bars:
+        lengths = np.concatenate([lengths, rng.geometric(1.0 / mean_length, size=len(lengths))])
+    
+    codes = rng.integers(0, len(REGIMES), size=len(lengths))
+    return np.repeat(codes, lengths)[:bars].astype(np.int8)
+
+# Function to run an AR(1) recursion over a shock series
+def ar1(shocks, persistence):
+    """Return x with x[0] = shocks[0] and x[t] = persistence * x[t-1] + shocks[t].
+    
+    The recursion is an exponential moving average of scaled shocks, so it
+    is evaluated with the blocked ewm_2d scan instead of a per-bar loop.
+    """
+    alpha = 1.0 - persistence
+    scaled = np.asarray(shocks, dtype=float) / alpha
+    scaled[0] = shocks[0]
+    return ewm_2d(scaled[np.newaxis, :], 2.0 / alpha - 1.0)[0]
+
+# Function to draw a stochastic volatility multiplier
+def stochastic_volatility(bars, rng, persistence=0.98, vol_of_vol=0.05):
+    """Return exp(h) for a log-volatility AR(1) h, giving GARCH-like volatility clustering"""
+    shocks = vol_of_vol * rng.standard_normal(bars)
+    shocks[0] = 0.0
+    return np.exp(ar1(shocks, persistence))
+
+# Function to generate synthetic bars for one symbol
+def generate_rates(bars, symbol="EURUSD", timeframe="5m", seed=None, end=None, regimes=None,
+                   mean_regime_length=500, rng=None, return_regimes=False):
+    """Generate ``bars`` synthetic bars as an MT5 rates array.
+    
+    Prices follow a log random walk whose volatility clusters (see
+    stochastic_volatility) and switches between trending (drift), volatile
+    (larger moves) and ranging (smaller moves around a level) regimes.
+    ``regimes`` may fix the path: a regime name or one code per bar. The
+    last bar opens at ``end`` (epoch seconds, now by default).
+    """
+    rng = rng if rng is not None else np.random.default_rng(seed)
+    step = TIMEFRAME_SECONDS[timeframe]
+    
+    # Regime of every bar
+    if regimes is None:
+        codes = regime_path(bars, rng, mean_regime_length)
+    elif isinstance(regimes, str):
+        codes = np.full(bars, REGIMES.index(regimes), dtype=np.int8)
+    else:
+        codes = np.asarray(regimes, dtype=np.int8)
+    
+    # Per-bar volatility
+    base_volatility = ANNUAL_VOLATILITY * np.sqrt(step / (365 * 86400))
+    volatility = base_volatility * REGIME_VOLATILITY[codes] * stochastic_volatility(bars, rng)
+    
+    # Ranging bars follow the increments of a mean-reverting deviation, so ranges stay bounded
+    z = rng.standard_normal(bars)
+    deviation = ar1(z, RANGE_PERSISTENCE)
+    ranging = codes == REGIMES.index("RANGING")
+    returns = volatility * np.where(ranging, np.diff(deviation, prepend=0.0), z)
+    
+    # One trend direction per regime run, usually back towards the starting price
+    runs = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1))
+    run_drift = np.add.reduceat(REGIME_DRIFT[codes] * volatility, runs)
+    run_level = np.concatenate(([0.0], np.cumsum(returns)))[runs]
+    reverting = rng.random(len(runs)) < TREND_REVERSION
+    
+    offset = 0.0
+    directions = np.empty(len(runs))
+    for i in range(len(runs)):
+        towards_start = -1.0 if run_level[i] + offset > 0 else 1.0
+        directions[i] = towards_start if reverting[i] else -towards_start
+        offset += directions[i] * run_drift[i]
+    
+    returns += REGIME_DRIFT[codes] * volatility * np.repeat(directions, np.diff(np.append(runs, bars)))
+    
+    base_price = BASE_PRICES.get(symbol, 1.0)
+    close = base_price * np.exp(np.cumsum(returns))
+    open_price = np.concatenate(([base_price], close[:-1]))
+    
+    # Wicks scale with the bar's volatility
+    upper = np.abs(rng.standard_normal(bars)) * volatility * close * 0.5
+    lower = np.abs(rng.standard_normal(bars)) * volatility * close * 0.5
+    
+    end = int(time.time()) if end is None else int(end)
+    end -= end % step
+    
+    rates = np.empty(bars, dtype=RATES_DTYPE)
+    rates['time'] = end - np.arange(bars - 1, -1, -1, dtype=np.int64) * step
+    rates['open'] = open_price
+    rates['close'] = close
+    rates['high'] = np.maximum(open_price, close) + upper
+    rates['low'] = np.minimum(open_price, close) - lower
+    rates['tick_volume'] = 1 + (500 * volatility / base_volatility * rng.lognormal(0.0, 0.3, bars)).astype(np.uint64)
+    rates['spread'] = np.where(codes == REGIMES.index("VOLATILE"), 5, 2)
+    rates['real_volume'] = rates['tick_volume'] * 10
+    
+    if return_regimes:
+        return rates, codes
+    return rates
+
+# Function to generate synthetic bars for several symbols
+def generate_market_data(symbols, bars, timeframe="5m", seed=None, end=None, frame=False, **kwargs):
+    """Return {symbol: rates} (or DataFrames) with an independent random stream per symbol"""
+    end = int(time.time()) if end is None else end
+    streams = np.random.SeedSequence(seed).spawn(len(symbols))
+    
+    data = {}
+    for symbol, stream in zip(symbols, streams):
+        rates = generate_rates(bars, symbol, timeframe, end=end, rng=np.random.default_rng(stream), **kwargs)
+        data[symbol] = rates_frame(rates) if frame else rates
+    return data
+
+# Function to convert a rates array to a DataFrame
+def rates_frame(rates):
+    df = pd.DataFrame({name: rates[name] for name in rates.dtype.names})
+    df['time'] = rates['time'].astype('datetime64[s]')
+    return df
@@ -0,0 +1,176 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.market_data import RATES_DTYPE
+from scripts.bar_store import TIMEFRAME_SECONDS
+from scripts.indicators import IncrementalIndicators
+
+# Timeframes built by default (the keys of MT5_TIMEFRAMES in mt5_connection)
+TIMEFRAMES = tuple(TIMEFRAME_SECONDS)
+
+# Positions of the bar fields in a forming bar list
+TIME, OPEN, HIGH, LOW, CLOSE, TICK_VOLUME, SPREAD, REAL_VOLUME = range(8)
+
+class TickAggregator:
+    """Builds bars of several timeframes for many symbols from one tick stream.
+    
+    Every (symbol, timeframe) keeps its forming bar. A tick inside the forming
+    bar's period updates it; a later tick closes it and starts the next bar.
+    Ticks older than the forming bar are ignored, and periods without ticks
+    produce no bar, as in MT5. Bars use the RATES_DTYPE fields, with
+    tick_volume counting ticks, real_volume summing tick volumes and spread
+    holding the lowest spread seen.
+    
+    With ``indicator_params`` each series also keeps an IncrementalIndicators
+    engine fed with its closed bars, so ``features`` returns the indicators of
+    the forming bar (or of the last closed one) without re-reading history.
+    """
+    
+    def __init__(self, timeframes=TIMEFRAMES, indicator_params=None):
+        self.steps = [(timeframe, TIMEFRAME_SECONDS[timeframe]) for timeframe in timeframes]
+        self.indicator_params = indicator_params
+        self.bars = {}
+        self.engines = {}
+        self.rows = {}
+    
+    def seed(self, symbol, timeframe, rates):
+        """Start a series from history; the last bar is taken as still forming"""
+        rates = np.sort(np.asarray(rates), order='time')
+        key = (symbol, timeframe)
+        self.bars.pop(key, None)
+        
+        if self.indicator_params is not None:
+            engine = IncrementalIndicators(**self.indicator_params)
+            self.rows.pop(key, None)
+            for bar in rates[:-1]:
+                self.rows[key] = engine.update(_rates_row(bar))
+            self.engines[key] = engine
+        
+        if len(rates):
+            self.bars[key] = [_rates_row(rates[-1])[field] for field in RATES_DTYPE.names]
+    
+    def add_tick(self, symbol, time, price, volume=0, spread=0):
+        """Add one tick and return the (timeframe, bar, closed) updates it caused.
+        
+        Each changed series reports its forming bar with closed=False, preceded
+        by the bar it closed (closed=True) when the tick started a new period.
+        """
+        updates = []
+        time = int(time)
+        price = float(price)
+        
+        for timeframe, step in self.steps:
+            key = (symbol, timeframe)
+            bar = self.bars.get(key)
+            start = time - time % step
+            
+            if bar is not None and start == bar[TIME]:
+                if price > bar[HIGH]:
+                    bar[HIGH] = price
+                elif price < bar[LOW]:
+                    bar[LOW] = price
+                bar[CLOSE] = price
+                bar[TICK_VOLUME] += 1
+                bar[REAL_VOLUME] += volume
+                if spread < bar[SPREAD]:
+                    bar[SPREAD] = spread
+            elif bar is None or start > bar[TIME]:
+                if bar is not None:
+                    updates.append((timeframe, self._close(key, bar), True))
+                bar = self.bars[key] = [start, price, price, price, price, 1, spread, volume]
+            else:
+                continue
+            
+            updates.append((timeframe, _bar_dict(bar), False))
+        
+        return updates
+    
+    def add_ticks(self, symbol, times, prices, volumes=None, spreads=None):
+        """Add a time-ordered batch of ticks of one symbol at once.
+        
+        Returns the closed bars and the final forming bar of every changed
+        series as (timeframe, bar, closed) updates, like add_tick would
+        report them without the intermediate forming bars.
+        """
+        times = np.asarray(times, dtype=np.int64)
+        prices = np.asarray(prices, dtype=float)
+        volumes = np.zeros(len(times), dtype=np.int64) if volumes is None else np.asarray(volumes, dtype=np.int64)
+        spreads = np.zeros(len(times), dtype=np.int64) if spreads is None else np.asarray(spreads, dtype=np.int64)
+        updates = []
+        
+        for timeframe, step in self.steps:
+            key = (symbol, timeframe)
+            bar = self.bars.get(key)
+            
+            # Drop ticks older than the forming bar
+            first = 0 if bar is None else int(np.searchsorted(times, bar[TIME], side='left'))
+            if first == len(times):
+                continue
+            
+            # One group of ticks per bar period
+            buckets = times[first:] - times[first:] % step
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+            ends = np.append(starts[1:], len(buckets))
+            group_prices = prices[first:]
+            
+            groups = zip(
+                buckets[starts].tolist(),
+                group_prices[starts].tolist(),
+                np.maximum.reduceat(group_prices, starts).tolist(),
+                np.minimum.reduceat(group_prices, starts).tolist(),
+                group_prices[ends - 1].tolist(),
+                (ends - starts).tolist(),
+                np.minimum.reduceat(spreads[first:], starts).tolist(),
+                np.add.reduceat(volumes[first:], starts).tolist()
+            )
+            
+            for group in groups:
+                if bar is not None and group[TIME] == bar[TIME]:
+                    bar[HIGH] = max(bar[HIGH], group[HIGH])
+                    bar[LOW] = min(bar[LOW], group[LOW])
+                    bar[CLOSE] = group[CLOSE]
+                    bar[TICK_VOLUME] += group[TICK_VOLUME]
+                    bar[SPREAD] = min(bar[SPREAD], group[SPREAD])
+                    bar[REAL_VOLUME] += group[REAL_VOLUME]
+                else:
+                    if bar is not None:
+                        updates.append((timeframe, self._close(key, bar), True))
+                    bar = self.bars[key] = list(group)
+            
+            updates.append((timeframe, _bar_dict(bar), False))
+        
+        return updates
+    
+    def bar(self, symbol, timeframe):
+        """Return the forming bar of a series, or None"""
+        bar = self.bars.get((symbol, timeframe))
+        return None if bar is None else _bar_dict(bar)
+    
+    def features(self, symbol, timeframe, closed=False):
+        """Return the indicator row of the forming bar (or the last closed one), or None"""
+        if closed:
+            return self.rows.get((symbol, timeframe))
+        
+        engine = self.engines.get((symbol, timeframe))
+        bar = self.bars.get((symbol, timeframe))
+        if engine is None or bar is None:
+            return None
+        return engine.peek(_bar_dict(bar))
+    
+    def _close(self, key, bar):
+        closed = _bar_dict(bar)
+        if self.indicator_params is not None:
+            if key not in self.engines:
+                self.engines[key] = IncrementalIndicators(**self.indicator_params)
+            self.rows[key] = self.engines[key].update(closed)
+        return closed
+
+# Function to convert a forming bar list to a dict
+def _bar_dict(bar):
+    return dict(zip(RATES_DTYPE.names, bar))
+
+# Function to convert a rates record to plain Python values
+def _rates_row(record):
+    return {field: record[field].item() for field in RATES_DTYPE.names}
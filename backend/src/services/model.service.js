@@ -1,6 +1,7 @@
 const { PythonShell } = require('python-shell');
 const path = require('path');
 const socketService = require('./socket.service');
+const { createFramedShell, sendFrame } = require('../utils/framing');
 const ModelPrediction = require('../models/modelPrediction.model');
 
 // Path to the Python script for model operations
@@ -9,6 +10,91 @@ const MODEL_SCRIPT = path.join(__dirname, '../../scripts/run_model.py');
 // Store active model instances
 const activeModels = new Map();
 
+// Resident prediction worker keeping models warm between requests
+let predictionWorker = null;
+const pendingPredictions = new Map();
+let nextPredictionId = 1;
+
+/**
+ * Reject all pending predictions and drop the worker so it is restarted
+ * @param {string} message - Failure message
+ */
+const resetPredictionWorker = (message) => {
+  predictionWorker = null;
+  for (const { reject } of pendingPredictions.values()) {
+    reject({
+      success: false,
+      message
+    });
+  }
+  pendingPredictions.clear();
+};
+
+/**
+ * Get the resident prediction worker, starting it if needed
+ * @returns {PythonShell} Prediction worker
+ */
+const getPredictionWorker = () => {
+  if (predictionWorker) {
+    return predictionWorker;
+  }
+  
+  // Length-prefixed frames carry bulk requests (bar history, many symbols) without line scanning
+  const worker = createFramedShell(MODEL_SCRIPT, ['WORKER']);
+  
+  worker.on('message', (message) => {
+    const pending = pendingPredictions.get(message.id);
+    if (!pending) {
+      return;
+    }
+    
+    // Streamed results arrive before the final response
+    if (message.partial) {
+      if (pending.onPartial) {
+        pending.onPartial(message.result);
+      }
+      return;
+    }
+    
+    pendingPredictions.delete(message.id);
+    pending.resolve(message);
+  });
+  
+  worker.on('stderr', (line) => {
+    console.error('Prediction worker:', line);
+  });
+  
+  worker.on('error', (err) => {
+    console.error('Prediction worker error:', err);
+    if (predictionWorker === worker) {
+      resetPredictionWorker('Model prediction failed. Execution error.');
+    }
+  });
+  
+  worker.on('close', () => {
+    if (predictionWorker === worker) {
+      resetPredictionWorker('Model prediction failed. Worker exited.');
+    }
+  });
+  
+  predictionWorker = worker;
+  return worker;
+};
+
+/**
+ * Send a request to the resident prediction worker
+ * @param {Object} request - Worker request
+ * @param {Function} onPartial - Called with each streamed result
+ * @returns {Promise<Object>} Worker response
+ */
+const requestPrediction = (request, onPartial) => {
+  return new Promise((resolve, reject) => {
+    const id = nextPredictionId++;
+    pendingPredictions.set(id, { resolve, reject, onPartial });
+    sendFrame(getPredictionWorker(), { id, ...request });
+  });
+};
+
 /**
  * Initialize model service
  */
@@ -16,83 +102,209 @@ exports.init = () => {
   console.log('Initializing model service...');
 };
 
+/**
+ * Store a prediction result and emit it to subscribed clients
+ * @param {string} symbol - Symbol
+ * @param {string} timeframe - Timeframe
+ * @param {Object} features - Model features configuration
+ * @param {Object} predictionResult - Result from the prediction worker
+ * @returns {Promise<Object>} Saved prediction
+ */
+const savePrediction = async (symbol, timeframe, features, predictionResult) => {
+  // Create prediction record in database
+  const prediction = new ModelPrediction({
+    symbol,
+    timeframe,
+    predictionTime: new Date(),
+    direction: predictionResult.direction,
+    confidence: predictionResult.confidence,
+    entryPrice: predictionResult.entryPrice,
+    stopLoss: predictionResult.stopLoss,
+    takeProfit: predictionResult.takeProfit,
+    riskReward: predictionResult.riskReward,
+    parameters: predictionResult.parameters,
+    marketRegime: predictionResult.marketRegime,
+    sentimentScore: predictionResult.sentimentScore,
+    features: {
+      deepLearning: features['Deep Learning']?.enabled || false,
+      sentiment: features['Sentiment Analysis']?.enabled || false,
+      advancedRisk: features['Advanced Risk Management']?.enabled || false,
+      adaptiveParameters: features['Adaptive Parameters']?.enabled || false
+    }
+  });
+  
+  await prediction.save();
+  
+  // Emit prediction to subscribed clients
+  socketService.emitPrediction(symbol, prediction);
+  
+  return prediction;
+};
+
 /**
  * Run model prediction
  * @param {string} symbol - Symbol
  * @param {string} timeframe - Timeframe
  * @param {Object} features - Model features configuration
  * @param {Object} riskSettings - Risk management settings
+ * @param {Object|Array<Object>} [dataSource] - Where the bars come from, e.g. { type: 'mt5', server, login },
+ *   { type: 'store', directory } or { type: 'inline', series: { 'EURUSD/5m': data } }; defaults to the bar store
  * @returns {Promise<Object>} Prediction result
  */
-exports.runPrediction = (symbol, timeframe, features, riskSettings) => {
-  return new Promise((resolve, reject) => {
-    // Execute model prediction using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MODEL_SCRIPT),
-      args: [
-        symbol,
-        timeframe,
-        JSON.stringify(features),
-        JSON.stringify(riskSettings)
-      ]
+exports.runPrediction = async (symbol, timeframe, features, riskSettings, dataSource) => {
+  // Execute model prediction on the resident worker
+  let predictionResult;
+  try {
+    predictionResult = await requestPrediction({
+      command: 'PREDICT',
+      symbol,
+      timeframe,
+      features,
+      riskSettings,
+      dataSource
+    });
+  } catch (err) {
+    console.error('Model prediction error:', err);
+    throw {
+      success: false,
+      message: 'Model prediction failed. Execution error.'
     };
+  }
+  
+  if (!predictionResult.success) {
+    throw {
+      success: false,
+      message: predictionResult.message || 'Model prediction failed'
+    };
+  }
+  
+  const prediction = await savePrediction(symbol, timeframe, features, predictionResult);
+  
+  // Return prediction
+  return {
+    success: true,
+    prediction
+  };
+};
+
+/**
+ * Run model predictions for many symbols/timeframes in one worker call
+ * @param {Array<Object>} items - Items with symbol, timeframe and optional data/dataPath/dataSource
+ * @param {Object} features - Model features configuration
+ * @param {Object} riskSettings - Risk management settings
+ * @param {Object|Array<Object>} [dataSource] - Data source of items without their own (see runPrediction)
+ * @returns {Promise<Object>} Stored predictions, and the items that failed (symbol, timeframe, message)
+ */
+exports.runBatchPrediction = async (items, features, riskSettings, dataSource) => {
+  let batchResult;
+  try {
+    batchResult = await requestPrediction({
+      command: 'PREDICT_BATCH',
+      items,
+      features,
+      riskSettings,
+      dataSource
+    });
+  } catch (err) {
+    console.error('Batch prediction error:', err);
+    throw {
+      success: false,
+      message: 'Batch prediction failed. Execution error.'
+    };
+  }
+  
+  if (!batchResult.success) {
+    throw {
+      success: false,
+      message: batchResult.message || 'Batch prediction failed'
+    };
+  }
+  
+  // Only successful items are stored; the others are reported back
+  const failures = batchResult.predictions
+    .filter(predictionResult => !predictionResult.success)
+    .map(({ symbol, timeframe, message }) => ({ symbol, timeframe, message }));
+  
+  const predictions = await Promise.all(batchResult.predictions
+    .filter(predictionResult => predictionResult.success)
+    .map(predictionResult =>
+      savePrediction(predictionResult.symbol, predictionResult.timeframe, features, predictionResult)
+    ));
+  
+  return {
+    success: true,
+    predictions,
+    failures
+  };
+};
+
+/**
+ * Get the prediction stage latency histograms of the resident worker
+ * @returns {Promise<Object>} Prometheus text (metrics) and per-stage histograms (stages)
+ */
+exports.getPredictionMetrics = async () => {
+  const metricsResult = await requestPrediction({ command: 'METRICS' });
+  
+  return {
+    success: true,
+    metrics: metricsResult.metrics,
+    stages: metricsResult.stages
+  };
+};
+
+/**
+ * Run model predictions across a process pool, handling results as they complete
+ * @param {Array<Object>} items - Items with symbol, timeframe and optional data/dataPath/dataSource
+ * @param {Object} features - Model features configuration
+ * @param {Object} riskSettings - Risk management settings
+ * @param {Object} options - Pool options (workers, cpus), dataSource (see runPrediction) and onPrediction callback
+ * @returns {Promise<Object>} Completion result
+ */
+exports.runParallelPrediction = async (items, features, riskSettings, options = {}) => {
+  const saves = [];
+  
+  // Store and emit each prediction as soon as its job completes
+  const onPartial = (predictionResult) => {
+    if (!predictionResult.success) {
+      console.error('Parallel prediction error:', predictionResult.message);
+      return;
+    }
     
-    PythonShell.run(path.basename(MODEL_SCRIPT), options, async (err, results) => {
-      if (err) {
-        console.error('Model prediction error:', err);
-        return reject({
-          success: false,
-          message: 'Model prediction failed. Execution error.'
-        });
-      }
-      
-      // Parse the result from the Python script
-      const predictionResult = JSON.parse(results[0]);
-      
-      if (!predictionResult.success) {
-        return reject({
-          success: false,
-          message: predictionResult.message || 'Model prediction failed'
-        });
-      }
-      
-      // Create prediction record in database
-      const prediction = new ModelPrediction({
-        symbol,
-        timeframe,
-        predictionTime: new Date(),
-        direction: predictionResult.direction,
-        confidence: predictionResult.confidence,
-        entryPrice: predictionResult.entryPrice,
-        stopLoss: predictionResult.stopLoss,
-        takeProfit: predictionResult.takeProfit,
-        riskReward: predictionResult.riskReward,
-        parameters: predictionResult.parameters,
-        marketRegime: predictionResult.marketRegime,
-        sentimentScore: predictionResult.sentimentScore,
-        features: {
-          deepLearning: features['Deep Learning']?.enabled || false,
-          sentiment: features['Sentiment Analysis']?.enabled || false,
-          advancedRisk: features['Advanced Risk Management']?.enabled || false,
-          adaptiveParameters: features['Adaptive Parameters']?.enabled || false
+    saves.push(savePrediction(predictionResult.symbol, predictionResult.timeframe, features, predictionResult)
+      .then((prediction) => {
+        if (options.onPrediction) {
+          options.onPrediction(prediction);
         }
-      });
-      
-      await prediction.save();
-      
-      // Emit prediction to subscribed clients
-      socketService.emitPrediction(symbol, prediction);
-      
-      // Return prediction
-      resolve({
-        success: true,
-        prediction
-      });
-    });
-  });
+        return prediction;
+      }));
+  };
+  
+  let parallelResult;
+  try {
+    parallelResult = await requestPrediction({
+      command: 'PREDICT_PARALLEL',
+      items,
+      features,
+      riskSettings,
+      workers: options.workers,
+      cpus: options.cpus,
+      dataSource: options.dataSource
+    }, onPartial);
+  } catch (err) {
+    console.error('Parallel prediction error:', err);
+    throw {
+      success: false,
+      message: 'Parallel prediction failed. Execution error.'
+    };
+  }
+  
+  const predictions = await Promise.all(saves);
+  
+  return {
+    success: parallelResult.success,
+    count: parallelResult.count,
+    predictions
+  };
 };
 
 /**
@@ -268,6 +480,13 @@ exports.getModelStatus = (userId) => {
 exports.shutdown = () => {
   console.log('Shutting down model service...');
   
+  // Stop the resident prediction worker
+  if (predictionWorker) {
+    const worker = predictionWorker;
+    resetPredictionWorker('Model service shutting down');
+    worker.kill();
+  }
+  
   // Stop all active models
   for (const userId of activeModels.keys()) {
     this.stopAutomatedTrading(userId).catch(err => {
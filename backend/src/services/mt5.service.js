@@ -1,6 +1,7 @@
 const { PythonShell } = require('python-shell');
 const path = require('path');
 const socketService = require('./socket.service');
+const { createFramedShell, sendFrame } = require('../utils/framing');
 
 // Path to the Python script for MT5 connection
 const MT5_CONNECTION_SCRIPT = path.join(__dirname, '../../scripts/mt5_connection.py');
@@ -8,6 +9,99 @@ const MT5_CONNECTION_SCRIPT = path.join(__dirname, '../../scripts/mt5_connection
 // Store active connections
 const activeConnections = new Map();
 
+// Resident MT5 session daemons, one per connection
+const sessionDaemons = new Map();
+let nextCommandId = 1;
+
+// Tick stream processes, one per connection
+const tickStreams = new Map();
+
+/**
+ * Get the session daemon for a connection, starting it if needed
+ * @param {string} connectionId - Connection ID
+ * @returns {Object} Session daemon
+ */
+const getSessionDaemon = (connectionId) => {
+  if (sessionDaemons.has(connectionId)) {
+    return sessionDaemons.get(connectionId);
+  }
+  
+  const shell = createFramedShell(MT5_CONNECTION_SCRIPT, ['SERVE']);
+  
+  const daemon = {
+    shell,
+    pending: new Map()
+  };
+  
+  // Fail pending commands and forget the daemon so it is restarted
+  const fail = (message) => {
+    if (sessionDaemons.get(connectionId) === daemon) {
+      sessionDaemons.delete(connectionId);
+    }
+    for (const callback of daemon.pending.values()) {
+      callback(new Error(message));
+    }
+    daemon.pending.clear();
+  };
+  
+  shell.on('message', (message) => {
+    const callback = daemon.pending.get(message.id);
+    if (callback) {
+      daemon.pending.delete(message.id);
+      callback(null, message);
+    }
+  });
+  
+  shell.on('stderr', (line) => {
+    console.error('MT5 session daemon:', line);
+  });
+  
+  shell.on('error', (err) => {
+    console.error('MT5 session daemon error:', err);
+    fail(err.message);
+  });
+  
+  shell.on('close', () => {
+    fail('MT5 session daemon exited');
+  });
+  
+  sessionDaemons.set(connectionId, daemon);
+  return daemon;
+};
+
+/**
+ * Send a command to the session daemon of a connection
+ * @param {string} connectionId - Connection ID
+ * @param {Object} connection - Connection with server and login
+ * @param {string} command - Command name
+ * @param {Array} args - Command arguments
+ * @param {Function} callback - Called with (err, result)
+ */
+const sendSessionCommand = (connectionId, connection, command, args, callback) => {
+  const daemon = getSessionDaemon(connectionId);
+  const id = nextCommandId++;
+  daemon.pending.set(id, callback);
+  sendFrame(daemon.shell, {
+    id,
+    command,
+    server: connection.server,
+    login: connection.login,
+    args
+  });
+};
+
+/**
+ * Stop the session daemon of a connection
+ * @param {string} connectionId - Connection ID
+ */
+const stopSessionDaemon = (connectionId) => {
+  const daemon = sessionDaemons.get(connectionId);
+  if (daemon) {
+    sessionDaemons.delete(connectionId);
+    daemon.shell.end(() => {});
+  }
+};
+
 /**
  * Initialize MT5 service
  */
@@ -35,33 +129,19 @@ exports.connect = (server, login, password, userId) => {
       });
     }
     
-    // Execute MT5 connection using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
-      args: [
-        'CONNECT',
-        server,
-        login,
-        password
-      ]
-    };
-    
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
+    // Execute MT5 connection on a new session daemon
+    sendSessionCommand(connectionKey, { server, login }, 'CONNECT', [password], (err, connectionResult) => {
       if (err) {
         console.error('MT5 connection error:', err);
+        stopSessionDaemon(connectionKey);
         return reject({
           success: false,
           message: 'MT5 connection failed. Execution error.'
         });
       }
       
-      // Parse the result from the Python script
-      const connectionResult = JSON.parse(results[0]);
-      
       if (!connectionResult.success) {
+        stopSessionDaemon(connectionKey);
         return reject({
           success: false,
           message: connectionResult.message || 'MT5 connection failed'
@@ -105,20 +185,8 @@ exports.disconnect = (connectionId) => {
     
     const connection = activeConnections.get(connectionId);
     
-    // Execute MT5 disconnection using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
-      args: [
-        'DISCONNECT',
-        connection.server,
-        connection.login
-      ]
-    };
-    
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
+    // Execute MT5 disconnection on the session daemon
+    sendSessionCommand(connectionId, connection, 'DISCONNECT', [], (err) => {
       if (err) {
         console.error('MT5 disconnection error:', err);
         return reject({
@@ -127,8 +195,10 @@ exports.disconnect = (connectionId) => {
         });
       }
       
-      // Remove connection
+      // Remove connection and stop its session daemon and tick stream
       activeConnections.delete(connectionId);
+      stopSessionDaemon(connectionId);
+      stopTickStream(connectionId);
       
       // Return success
       resolve({
@@ -156,20 +226,8 @@ exports.getAccountInfo = (connectionId) => {
     
     const connection = activeConnections.get(connectionId);
     
-    // Execute MT5 account info using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
-      args: [
-        'ACCOUNT_INFO',
-        connection.server,
-        connection.login
-      ]
-    };
-    
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
+    // Execute MT5 account info on the session daemon
+    sendSessionCommand(connectionId, connection, 'ACCOUNT_INFO', [], (err, accountResult) => {
       if (err) {
         console.error('MT5 account info error:', err);
         return reject({
@@ -178,9 +236,6 @@ exports.getAccountInfo = (connectionId) => {
         });
       }
       
-      // Parse the result from the Python script
-      const accountResult = JSON.parse(results[0]);
-      
       if (!accountResult.success) {
         return reject({
           success: false,
@@ -207,9 +262,10 @@ exports.getAccountInfo = (connectionId) => {
  * @param {string} symbol - Symbol
  * @param {string} timeframe - Timeframe
  * @param {number} bars - Number of bars
+ * @param {string} layout - 'rows' (list of bars), 'columnar' (list per field) or 'npy' (path to a .npy rates file)
  * @returns {Promise<Object>} Market data
  */
-exports.getMarketData = (connectionId, symbol, timeframe, bars = 100) => {
+exports.getMarketData = (connectionId, symbol, timeframe, bars = 100, layout = 'rows') => {
   return new Promise((resolve, reject) => {
     // Check if connection exists
     if (!activeConnections.has(connectionId)) {
@@ -221,23 +277,15 @@ exports.getMarketData = (connectionId, symbol, timeframe, bars = 100) => {
     
     const connection = activeConnections.get(connectionId);
     
-    // Execute MT5 market data using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
-      args: [
-        'MARKET_DATA',
-        connection.server,
-        connection.login,
-        symbol,
-        timeframe,
-        bars.toString()
-      ]
-    };
+    // Execute MT5 market data on the session daemon
+    const args = [
+      symbol,
+      timeframe,
+      bars.toString(),
+      layout
+    ];
     
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
+    sendSessionCommand(connectionId, connection, 'MARKET_DATA', args, (err, dataResult) => {
       if (err) {
         console.error('MT5 market data error:', err);
         return reject({
@@ -246,9 +294,6 @@ exports.getMarketData = (connectionId, symbol, timeframe, bars = 100) => {
         });
       }
       
-      // Parse the result from the Python script
-      const dataResult = JSON.parse(results[0]);
-      
       if (!dataResult.success) {
         return reject({
           success: false,
@@ -265,7 +310,9 @@ exports.getMarketData = (connectionId, symbol, timeframe, bars = 100) => {
         success: true,
         symbol,
         timeframe,
-        data: dataResult.data
+        layout: dataResult.layout,
+        data: dataResult.data,
+        path: dataResult.path
       });
     });
   });
@@ -288,20 +335,8 @@ exports.getOpenPositions = (connectionId) => {
     
     const connection = activeConnections.get(connectionId);
     
-    // Execute MT5 positions using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
-      args: [
-        'POSITIONS',
-        connection.server,
-        connection.login
-      ]
-    };
-    
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
+    // Execute MT5 positions on the session daemon
+    sendSessionCommand(connectionId, connection, 'POSITIONS', [], (err, positionsResult) => {
       if (err) {
         console.error('MT5 positions error:', err);
         return reject({
@@ -310,9 +345,6 @@ exports.getOpenPositions = (connectionId) => {
         });
       }
       
-      // Parse the result from the Python script
-      const positionsResult = JSON.parse(results[0]);
-      
       if (!positionsResult.success) {
         return reject({
           success: false,
@@ -351,26 +383,17 @@ exports.placeTrade = (connectionId, tradeParams) => {
     
     const connection = activeConnections.get(connectionId);
     
-    // Execute MT5 trade using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
-      args: [
-        'TRADE',
-        connection.server,
-        connection.login,
-        tradeParams.symbol,
-        tradeParams.type,
-        tradeParams.volume.toString(),
-        tradeParams.price ? tradeParams.price.toString() : '0',
-        tradeParams.stopLoss ? tradeParams.stopLoss.toString() : '0',
-        tradeParams.takeProfit ? tradeParams.takeProfit.toString() : '0'
-      ]
-    };
+    // Execute MT5 trade on the session daemon
+    const args = [
+      tradeParams.symbol,
+      tradeParams.type,
+      tradeParams.volume.toString(),
+      tradeParams.price ? tradeParams.price.toString() : '0',
+      tradeParams.stopLoss ? tradeParams.stopLoss.toString() : '0',
+      tradeParams.takeProfit ? tradeParams.takeProfit.toString() : '0'
+    ];
     
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
+    sendSessionCommand(connectionId, connection, 'TRADE', args, (err, tradeResult) => {
       if (err) {
         console.error('MT5 trade error:', err);
         return reject({
@@ -379,9 +402,6 @@ exports.placeTrade = (connectionId, tradeParams) => {
         });
       }
       
-      // Parse the result from the Python script
-      const tradeResult = JSON.parse(results[0]);
-      
       if (!tradeResult.success) {
         return reject({
           success: false,
@@ -426,21 +446,12 @@ exports.closeTrade = (connectionId, ticket) => {
     
     const connection = activeConnections.get(connectionId);
     
-    // Execute MT5 close trade using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
-      args: [
-        'CLOSE',
-        connection.server,
-        connection.login,
-        ticket
-      ]
-    };
+    // Execute MT5 close trade on the session daemon
+    const args = [
+      ticket
+    ];
     
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
+    sendSessionCommand(connectionId, connection, 'CLOSE', args, (err, closeResult) => {
       if (err) {
         console.error('MT5 close trade error:', err);
         return reject({
@@ -449,9 +460,6 @@ exports.closeTrade = (connectionId, ticket) => {
         });
       }
       
-      // Parse the result from the Python script
-      const closeResult = JSON.parse(results[0]);
-      
       if (!closeResult.success) {
         return reject({
           success: false,
@@ -499,23 +507,14 @@ exports.modifyTrade = (connectionId, ticket, stopLoss, takeProfit) => {
     
     const connection = activeConnections.get(connectionId);
     
-    // Execute MT5 modify trade using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
-      args: [
-        'MODIFY',
-        connection.server,
-        connection.login,
-        ticket,
-        stopLoss.toString(),
-        takeProfit.toString()
-      ]
-    };
+    // Execute MT5 modify trade on the session daemon
+    const args = [
+      ticket,
+      stopLoss.toString(),
+      takeProfit.toString()
+    ];
     
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
+    sendSessionCommand(connectionId, connection, 'MODIFY', args, (err, modifyResult) => {
       if (err) {
         console.error('MT5 modify trade error:', err);
         return reject({
@@ -524,9 +523,6 @@ exports.modifyTrade = (connectionId, ticket, stopLoss, takeProfit) => {
         });
       }
       
-      // Parse the result from the Python script
-      const modifyResult = JSON.parse(results[0]);
-      
       if (!modifyResult.success) {
         return reject({
           success: false,
@@ -556,12 +552,12 @@ exports.modifyTrade = (connectionId, ticket, stopLoss, takeProfit) => {
 };
 
 /**
- * Start market data streaming
+ * Run several trade, close and modify requests in one MT5 session
  * @param {string} connectionId - Connection ID
- * @param {string} symbol - Symbol
- * @returns {Promise<Object>} Stream result
+ * @param {Array} items - Requests such as { action: 'CLOSE', ticket: '*' } or { action: 'MODIFY', ticket, sl: 'breakeven' }
+ * @returns {Promise<Object>} Per-item results with timings
  */
-exports.startMarketDataStream = (connectionId, symbol) => {
+exports.executeBatch = (connectionId, items) => {
   return new Promise((resolve, reject) => {
     // Check if connection exists
     if (!activeConnections.has(connectionId)) {
@@ -573,36 +569,20 @@ exports.startMarketDataStream = (connectionId, symbol) => {
     
     const connection = activeConnections.get(connectionId);
     
-    // Execute MT5 stream using Python script
-    const options = {
-      mode: 'text',
-      pythonPath: 'python3',
-      pythonOptions: ['-u'], // unbuffered output
-      scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
-      args: [
-        'STREAM_START',
-        connection.server,
-        connection.login,
-        symbol
-      ]
-    };
-    
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
+    // Execute MT5 batch on the session daemon
+    sendSessionCommand(connectionId, connection, 'BATCH', [items], (err, batchResult) => {
       if (err) {
-        console.error('MT5 stream error:', err);
+        console.error('MT5 batch error:', err);
         return reject({
           success: false,
-          message: 'MT5 stream failed. Execution error.'
+          message: 'MT5 batch failed. Execution error.'
         });
       }
       
-      // Parse the result from the Python script
-      const streamResult = JSON.parse(results[0]);
-      
-      if (!streamResult.success) {
+      if (!batchResult.success) {
         return reject({
           success: false,
-          message: streamResult.message || 'MT5 stream failed'
+          message: batchResult.message || 'MT5 batch failed'
         });
       }
       
@@ -610,22 +590,45 @@ exports.startMarketDataStream = (connectionId, symbol) => {
       connection.lastActivity = new Date();
       activeConnections.set(connectionId, connection);
       
-      // Return stream result
+      // Emit batch event to connected clients
+      socketService.emitToUser(connection.userId, 'trades_batch', {
+        success: true,
+        results: batchResult.results
+      });
+      
+      // Return batch results
       resolve({
         success: true,
-        message: 'Market data stream started'
+        message: batchResult.message,
+        failed: batchResult.failed,
+        results: batchResult.results,
+        elapsedMs: batchResult.elapsed_ms
       });
     });
   });
 };
 
 /**
- * Stop market data streaming
+ * Stop the tick stream of a connection
+ * @param {string} connectionId - Connection ID
+ */
+const stopTickStream = (connectionId) => {
+  const stream = tickStreams.get(connectionId);
+  if (stream) {
+    tickStreams.delete(connectionId);
+    stream.shell.end(() => {});
+  }
+};
+
+/**
+ * Start market data streaming
  * @param {string} connectionId - Connection ID
  * @param {string} symbol - Symbol
+ * @param {Array} timeframes - Timeframes to build live bars for (set when the stream process starts)
+ * @param {Object} indicatorParams - Indicator periods for the features of live bars ({} for the defaults, null for none)
  * @returns {Promise<Object>} Stream result
  */
-exports.stopMarketDataStream = (connectionId, symbol) => {
+exports.startMarketDataStream = (connectionId, symbol, timeframes = [], indicatorParams = null) => {
   return new Promise((resolve, reject) => {
     // Check if connection exists
     if (!activeConnections.has(connectionId)) {
@@ -637,36 +640,66 @@ exports.stopMarketDataStream = (connectionId, symbol) => {
     
     const connection = activeConnections.get(connectionId);
     
-    // Execute MT5 stream stop using Python script
-    const options = {
-      mode: 'text',
+    // Add the symbol to the running stream of this connection
+    const running = tickStreams.get(connectionId);
+    if (running) {
+      if (!running.symbols.has(symbol)) {
+        running.symbols.add(symbol);
+        running.shell.send({ command: 'SUBSCRIBE', symbols: [symbol] });
+      }
+      
+      return resolve({
+        success: true,
+        message: 'Market data stream started'
+      });
+    }
+    
+    // Start one resident stream process for all symbols of the connection
+    const shell = new PythonShell(path.basename(MT5_CONNECTION_SCRIPT), {
+      mode: 'json',
       pythonPath: 'python3',
       pythonOptions: ['-u'], // unbuffered output
       scriptPath: path.dirname(MT5_CONNECTION_SCRIPT),
       args: [
-        'STREAM_STOP',
+        'STREAM',
         connection.server,
         connection.login,
-        symbol
+        symbol,
+        '0.1',
+        timeframes.join(','),
+        indicatorParams ? JSON.stringify(indicatorParams) : ''
       ]
+    });
+    
+    const stream = {
+      shell,
+      symbols: new Set([symbol])
     };
+    tickStreams.set(connectionId, stream);
     
-    PythonShell.run(path.basename(MT5_CONNECTION_SCRIPT), options, (err, results) => {
-      if (err) {
-        console.error('MT5 stream stop error:', err);
-        return reject({
-          success: false,
-          message: 'MT5 stream stop failed. Execution error.'
-        });
+    let started = false;
+    
+    shell.on('message', (message) => {
+      // Forward ticks and live bars to subscribed clients
+      if (message.type === 'tick' || message.type === 'bar') {
+        socketService.emitMarketData(message.symbol, message);
+        return;
+      }
+      
+      if (started) {
+        if (!message.success) {
+          console.error('MT5 stream error:', message.message);
+        }
+        return;
       }
       
-      // Parse the result from the Python script
-      const streamResult = JSON.parse(results[0]);
+      started = true;
       
-      if (!streamResult.success) {
+      if (!message.success) {
+        stopTickStream(connectionId);
         return reject({
           success: false,
-          message: streamResult.message || 'MT5 stream stop failed'
+          message: message.message || 'MT5 stream failed'
         });
       }
       
@@ -677,8 +710,72 @@ exports.stopMarketDataStream = (connectionId, symbol) => {
       // Return stream result
       resolve({
         success: true,
-        message: 'Market data stream stopped'
+        message: 'Market data stream started'
+      });
+    });
+    
+    shell.on('stderr', (line) => {
+      console.error('MT5 stream:', line);
+    });
+    
+    shell.on('error', (err) => {
+      console.error('MT5 stream error:', err);
+    });
+    
+    shell.on('close', () => {
+      if (tickStreams.get(connectionId) === stream) {
+        tickStreams.delete(connectionId);
+      }
+      
+      if (!started) {
+        started = true;
+        reject({
+          success: false,
+          message: 'MT5 stream failed. Execution error.'
+        });
+      }
+    });
+  });
+};
+
+/**
+ * Stop market data streaming
+ * @param {string} connectionId - Connection ID
+ * @param {string} symbol - Symbol
+ * @returns {Promise<Object>} Stream result
+ */
+exports.stopMarketDataStream = (connectionId, symbol) => {
+  return new Promise((resolve, reject) => {
+    // Check if connection exists
+    if (!activeConnections.has(connectionId)) {
+      return reject({
+        success: false,
+        message: 'Not connected'
       });
+    }
+    
+    const connection = activeConnections.get(connectionId);
+    const stream = tickStreams.get(connectionId);
+    
+    if (stream && stream.symbols.has(symbol)) {
+      stream.symbols.delete(symbol);
+      
+      // Stop the stream process with its last symbol
+      if (stream.symbols.size === 0) {
+        stopTickStream(connectionId);
+      } else {
+        stream.shell.send({ command: 'UNSUBSCRIBE', symbols: [symbol] });
+      }
+    }
+    
+    // Update last activity
+    connection.lastActivity = new Date();
+    activeConnections.set(connectionId, connection);
+    
+    // Return stream result
+    resolve({
+      success: true,
+      message: 'Market data stream stopped'
     });
   });
 };
@@ -0,0 +1,125 @@
+const { PythonShell } = require('python-shell');
+const path = require('path');
+
+// Frame header: payload length as an unsigned 32-bit big-endian integer (see scripts/protocol.py)
+const FRAME_HEADER_SIZE = 4;
+
+// Wire format tags: the first payload byte of every frame
+const JSON_TAG = 0x4a; // 'J'
+const MSGPACK_TAG = 0x4d; // 'M'
+
+// msgpack is optional; responses are requested as JSON without it
+let msgpack = null;
+try {
+  msgpack = require('@msgpack/msgpack');
+} catch (err) {
+  msgpack = null;
+}
+
+// Encoding asked of the Python scripts for their responses
+const RESPONSE_ENCODING = process.env.PYTHON_RESPONSE_ENCODING || (msgpack ? 'msgpack' : 'json');
+
+/**
+ * Encode a message as a length-prefixed JSON frame
+ * @param {Object} message - Message
+ * @returns {Buffer} Frame
+ */
+const encodeFrame = (message) => {
+  const body = Buffer.from(JSON.stringify(message), 'utf8');
+  const header = Buffer.alloc(FRAME_HEADER_SIZE + 1);
+  header.writeUInt32BE(body.length + 1, 0);
+  header[FRAME_HEADER_SIZE] = JSON_TAG;
+  return Buffer.concat([header, body]);
+};
+
+/**
+ * Decode a frame payload according to its format tag
+ * @param {Buffer} payload - Frame payload including the tag byte
+ * @returns {Object} Message
+ */
+const decodePayload = (payload) => {
+  if (payload[0] === JSON_TAG) {
+    return JSON.parse(payload.toString('utf8', 1));
+  }
+  if (payload[0] === MSGPACK_TAG && msgpack) {
+    return msgpack.decode(payload.subarray(1));
+  }
+  throw new Error(`Unsupported frame format: ${payload[0]}`);
+};
+
+/**
+ * Create a decoder that collects stdout chunks into messages
+ * @param {Function} onMessage - Called with each decoded message
+ * @returns {Function} Push function taking a Buffer chunk
+ */
+const createFrameDecoder = (onMessage) => {
+  let buffered = Buffer.alloc(0);
+  
+  return (chunk) => {
+    buffered = buffered.length ? Buffer.concat([buffered, chunk]) : chunk;
+    
+    // Emit every complete frame, keeping a partial one for the next chunk
+    let offset = 0;
+    while (buffered.length - offset >= FRAME_HEADER_SIZE) {
+      const size = buffered.readUInt32BE(offset);
+      const end = offset + FRAME_HEADER_SIZE + size;
+      if (buffered.length < end) {
+        break;
+      }
+      
+      onMessage(decodePayload(buffered.subarray(offset + FRAME_HEADER_SIZE, end)));
+      offset = end;
+    }
+    
+    buffered = buffered.subarray(offset);
+  };
+};
+
+/**
+ * Start a Python script speaking the framed protocol on stdin/stdout
+ * @param {string} script - Script path
+ * @param {Array<string>} args - Script arguments (the script is given --framed)
+ * @returns {PythonShell} Shell emitting a 'message' event per decoded frame
+ */
+const createFramedShell = (script, args) => {
+  const shell = new PythonShell(path.basename(script), {
+    mode: 'binary',
+    pythonPath: 'python3',
+    pythonOptions: ['-u'], // unbuffered output
+    scriptPath: path.dirname(script),
+    args: [...args, '--framed']
+  });
+  
+  const push = createFrameDecoder((message) => shell.emit('message', message));
+  
+  shell.stdout.on('data', (chunk) => {
+    try {
+      push(chunk);
+    } catch (err) {
+      // A broken frame leaves the stream unrecoverable
+      shell.emit('error', err);
+      shell.kill();
+    }
+  });
+  
+  return shell;
+};
+
+/**
+ * Send a request to a framed shell, negotiating the encoding of its responses
+ * @param {PythonShell} shell - Shell started by createFramedShell
+ * @param {Object} message - Request
+ */
+const sendFrame = (shell, message) => {
+  shell.send(encodeFrame({ encoding: RESPONSE_ENCODING, ...message }));
+};
+
+module.exports = {
+  FRAME_HEADER_SIZE,
+  RESPONSE_ENCODING,
+  encodeFrame,
+  decodePayload,
+  createFrameDecoder,
+  createFramedShell,
+  sendFrame
+};
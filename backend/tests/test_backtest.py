@@ -0,0 +1,189 @@
+import pytest
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.backtest import (
+    technical_signals, settings_from_features, find_exits, indicator_columns, trade_levels,
+    simulate_trades, run_backtest, run_backtest_command,
+    EXIT_STOP_LOSS, EXIT_TAKE_PROFIT, EXIT_TIMEOUT, EXIT_END
+)
+from scripts.indicators import batch_indicators
+from scripts.market_data import RATES_DTYPE, save_rates
+from scripts.run_model import ForexModel
+
+
+@pytest.fixture
+def prices():
+    rng = np.random.default_rng(7)
+    bars = 5000
+    close = 1.2 + np.cumsum(rng.normal(0, 0.0005, bars))
+    high = close + np.abs(rng.normal(0, 0.0004, bars))
+    low = close - np.abs(rng.normal(0, 0.0004, bars))
+    return high, low, close
+
+
+def test_signals_match_technical_prediction(prices):
+    high, low, close = prices
+    bars = 300
+    model = ForexModel("EURUSD", "5m", {}, {})
+    
+    df = pd.DataFrame({
+        'time': pd.date_range('2021-04-01', periods=bars, freq='5min'),
+        'open': close[:bars],
+        'high': high[:bars],
+        'low': low[:bars],
+        'close': close[:bars]
+    })
+    processed = model.preprocess_data(df)
+    
+    columns = {
+        name: values[0]
+        for name, values in batch_indicators(high[None, :bars], low[None, :bars], close[None, :bars]).items()
+    }
+    prediction, confidence = technical_signals(close[:bars], columns)
+    
+    for i in processed.index[-40:]:
+        expected, expected_confidence = model.technical_prediction(processed.loc[:i])
+        assert prediction[i] == pytest.approx(expected)
+        assert confidence[i] == pytest.approx(expected_confidence)
+
+
+def test_find_exits():
+    high = np.array([1.0, 1.01, 1.02, 1.05, 1.0])
+    low = np.array([1.0, 0.99, 0.99, 0.99, 0.9])
+    entries = np.array([0, 0, 0, 0])
+    ends = np.array([5, 5, 5, 3])
+    stop_loss = np.array([0.95, 0.995, 0.5, 0.5])
+    take_profit = np.array([1.04, 2.0, 2.0, 2.0])
+    
+    index, reason = find_exits(low, high, entries, ends, stop_loss, take_profit)
+    
+    # Take profit on bar 3; stop loss on bar 1; nothing hit before the end
+    assert index.tolist() == [3, 1, -1, -1]
+    assert reason[:2].tolist() == [EXIT_TAKE_PROFIT, EXIT_STOP_LOSS]
+
+
+def reference_trades(high, low, close, spread, direction, sl_distance, tp_distance, max_bars_held=None):
+    """Bar-by-bar reference simulation"""
+    trades = []
+    bars = len(close)
+    i = 0
+    while i < bars:
+        side = direction[i]
+        if side == 0:
+            i += 1
+            continue
+        
+        entry_price = close[i] + (spread[i] if side > 0 else 0.0)
+        stop_loss = entry_price - side * sl_distance[i]
+        take_profit = entry_price + side * tp_distance[i]
+        end = bars if max_bars_held is None else min(bars, i + 1 + max_bars_held)
+        
+        exit_index, exit_price, reason = end - 1, None, EXIT_END if end == bars else EXIT_TIMEOUT
+        for j in range(i + 1, end):
+            worst = low[j] if side > 0 else high[j] + spread[j]
+            best = high[j] if side > 0 else low[j] + spread[j]
+            if (worst - stop_loss) * side <= 0:
+                exit_index, exit_price, reason = j, stop_loss, EXIT_STOP_LOSS
+                break
+            if (best - take_profit) * side >= 0:
+                exit_index, exit_price, reason = j, take_profit, EXIT_TAKE_PROFIT
+                break
+        
+        if exit_price is None:
+            exit_price = close[exit_index] + (spread[exit_index] if side < 0 else 0.0)
+        
+        trades.append((i, exit_index, side, entry_price, exit_price, reason))
+        i = exit_index + 1
+    
+    return trades
+
+
+@pytest.mark.parametrize("max_bars_held", [None, 5])
+def test_simulate_trades_matches_reference(prices, max_bars_held):
+    high, low, close = prices
+    spread = np.full(len(close), 0.0002)
+    columns = indicator_columns(high, low, close)
+    _, direction, sl_distance, tp_distance = trade_levels(close, columns, confidence_threshold=0.5)
+    
+    trades = simulate_trades(high, low, close, spread, direction, sl_distance, tp_distance, max_bars_held=max_bars_held)
+    expected = reference_trades(high, low, close, spread, direction, sl_distance, tp_distance, max_bars_held)
+    
+    assert len(trades) == len(expected)
+    assert trades['entry_index'].tolist() == [t[0] for t in expected]
+    assert trades['exit_index'].tolist() == [t[1] for t in expected]
+    assert trades['reason'].tolist() == [t[5] for t in expected]
+    assert np.allclose(trades['exit_price'], [t[4] for t in expected])
+    
+    # A window only trades inside it
+    window = simulate_trades(high, low, close, spread, direction, sl_distance, tp_distance, 1000, 2000)
+    assert window['entry_index'].min() >= 1000
+    assert window['exit_index'].max() < 2000
+
+
+def test_run_backtest(prices):
+    high, low, close = prices
+    result = run_backtest(high, low, close, confidence_threshold=0.5, initial_balance=10000.0)
+    stats = result["stats"]
+    trades = result["trades"]
+    
+    assert stats["trades"] == len(trades) > 0
+    assert stats["wins"] + stats["losses"] == stats["trades"]
+    assert 0.0 <= stats["hitRate"] <= 1.0
+    
+    # One position at a time
+    assert np.all(trades['exit_index'] > trades['entry_index'])
+    assert np.all(trades['entry_index'][1:] > trades['exit_index'][:-1])
+    
+    # Equity curve ends at the realized balance
+    assert len(result["equity"]) == len(close)
+    assert result["equity"][-1] == pytest.approx(10000.0 + result["pnl"].sum())
+    assert stats["maxDrawdown"] == pytest.approx(result["drawdown"].max())
+    
+    # Commission doesn't change fills, it lowers profit per trade
+    charged = run_backtest(high, low, close, confidence_threshold=0.5, commission=5.0)
+    assert charged["stats"]["trades"] == stats["trades"]
+    assert charged["stats"]["netProfit"] == pytest.approx(stats["netProfit"] - 5.0 * stats["trades"])
+    
+    # No trades when the fixed risk-reward is below the minimum
+    assert run_backtest(high, low, close, risk_reward_minimum=2.0)["stats"]["trades"] == 0
+
+
+def test_settings_from_features():
+    features = {
+        "Deep Learning": {"enabled": True, "parameters": {"confidenceThreshold": 0.6}},
+        "Advanced Risk Management": {"enabled": True, "parameters": {"riskRewardMinimum": 1.2, "dynamicStopLoss": False}},
+        "Technical Indicators": {"enabled": True, "parameters": {"rsiPeriod": 21, "bollingerStd": 2.5}}
+    }
+    
+    settings = settings_from_features(features)
+    assert settings["confidence_threshold"] == 0.6
+    assert settings["risk_reward_minimum"] == 1.2
+    assert settings["dynamic_stop_loss"] is False
+    assert settings["indicator_params"]["rsi_period"] == 21
+    assert settings["indicator_params"]["bollinger_std"] == 2.5
+    assert settings["indicator_params"]["sma_fast"] == 20
+    assert settings_from_features({})["risk_reward_minimum"] is None
+
+
+def test_run_backtest_command(prices, tmp_path):
+    high, low, close = prices
+    rates = np.zeros(len(close), dtype=RATES_DTYPE)
+    rates['time'] = 1617235200 + np.arange(len(close)) * 300
+    rates['open'] = close
+    rates['high'] = high
+    rates['low'] = low
+    rates['close'] = close
+    path = save_rates(rates, "EURUSD", "5m", str(tmp_path))
+    
+    result = json.loads(run_backtest_command("EURUSD", "5m", "{}", json.dumps({"spread": 0.0001}), path, max_points=100))
+    
+    assert result["success"] is True
+    assert result["stats"]["bars"] == len(close)
+    assert len(result["equityCurve"]["equity"]) == len(result["equityCurve"]["time"]) <= 101
+    assert result["equityCurve"]["time"][0] == "2021-04-01T00:00:00"
@@ -0,0 +1,196 @@
+import pytest
+import os
+import sys
+import numpy as np
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.bar_store import BarStore, sync_bars
+from scripts.market_data import RATES_DTYPE
+
+START = 1617235200  # Thursday 2021-04-01 00:00 UTC
+
+
+def make_rates(times):
+    rates = np.zeros(len(times), dtype=RATES_DTYPE)
+    rates['time'] = times
+    rates['close'] = 1.2 + np.arange(len(times)) * 0.0001
+    rates['open'] = rates['close']
+    rates['high'] = rates['close'] + 0.0002
+    rates['low'] = rates['close'] - 0.0002
+    rates['tick_volume'] = 100
+    return rates
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BarStore(str(tmp_path))
+
+
+def test_append_and_range_queries(store):
+    times = START + np.arange(100) * 300
+    assert store.append("EURUSD", "5m", make_rates(times)) == 100
+    
+    # Overlapping bars are not appended twice
+    assert store.append("EURUSD", "5m", make_rates(START + np.arange(90, 110) * 300)) == 10
+    assert store.count("EURUSD", "5m") == 110
+    
+    tail = store.tail("EURUSD", "5m", 5)
+    assert tail['time'].tolist() == (START + np.arange(105, 110) * 300).tolist()
+    assert tail.dtype == RATES_DTYPE
+    
+    window = store.read("EURUSD", "5m", START + 10 * 300, START + 20 * 300)
+    assert window['time'][0] == START + 10 * 300
+    assert len(window) == 10
+    
+    assert store.count("GBPUSD", "5m") == 0
+    assert len(store.read("GBPUSD", "5m")) == 0
+
+
+def test_forming_bar_is_updated(store):
+    rates = make_rates(START + np.arange(3) * 300)
+    store.append("EURUSD", "5m", rates)
+    
+    # The last bar was still forming: same time, new close
+    update = make_rates(START + np.arange(2, 4) * 300)
+    update['close'] = [1.5, 1.6]
+    assert store.append("EURUSD", "5m", update) == 1
+    
+    assert store.tail("EURUSD", "5m", 2)['close'].tolist() == [1.5, 1.6]
+
+
+def test_interrupted_append_is_ignored(store):
+    store.append("EURUSD", "5m", make_rates(START + np.arange(3) * 300))
+    
+    # Simulate a crash after writing only the close column
+    with open(os.path.join(store.path("EURUSD", "5m"), "close.bin"), "ab") as f:
+        f.write(np.array([9.9]).tobytes())
+    assert store.count("EURUSD", "5m") == 3
+    
+    store.append("EURUSD", "5m", make_rates(START + np.arange(3, 5) * 300))
+    assert store.tail("EURUSD", "5m", 5)['close'].tolist() == pytest.approx([1.2, 1.2001, 1.2002, 1.2, 1.2001])
+
+
+def test_gaps(store):
+    step = 3600
+    # Hourly bars Thursday-Friday 20:00, Sunday 22:00 onwards, with a hole on Monday
+    friday = START + np.arange(24 + 21) * step
+    sunday = START + (3 * 24 + 22) * step + np.arange(10) * step
+    monday = sunday[-1] + np.arange(5, 10) * step
+    store.append("EURUSD", "1h", make_rates(np.concatenate([friday, sunday, monday])))
+    
+    gaps = store.gaps("EURUSD", "1h")
+    assert gaps == [(int(sunday[-1]), int(monday[0]), 4)]
+    
+    # The weekend closure is reported when asked for
+    assert len(store.gaps("EURUSD", "1h", skip_weekends=False)) == 2
+
+
+def test_sync_bars(store):
+    broker = make_rates(START + np.arange(200) * 300)
+    calls = []
+    
+    def fetch_latest(count):
+        calls.append(("latest", count))
+        return broker[-count:]
+    
+    def fetch_since(timestamp):
+        calls.append(("since", timestamp))
+        return broker[broker['time'] >= timestamp]
+    
+    first = sync_bars(store, "EURUSD", "5m", 100, fetch_latest, fetch_since)
+    assert first['time'].tolist() == broker['time'][-100:].tolist()
+    
+    # New bars arrive: only those after the last stored one are requested
+    broker = make_rates(START + np.arange(205) * 300)
+    second = sync_bars(store, "EURUSD", "5m", 100, fetch_latest, fetch_since)
+    assert second['time'][-1] == broker['time'][-1]
+    assert calls == [("latest", 100), ("since", int(START + 199 * 300))]
+    
+    # Asking for more history than stored rewrites it once
+    third = sync_bars(store, "EURUSD", "5m", 150, fetch_latest, fetch_since)
+    assert len(third) == 150
+    assert store.count("EURUSD", "5m") == 150
+    assert calls[-1] == ("latest", 150)
+
+
+def test_sync_bars_short_history(store):
+    # The broker only has 60 bars of a new symbol
+    broker = make_rates(START + np.arange(60) * 300)
+    calls = []
+    
+    def fetch_latest(count):
+        calls.append(("latest", count))
+        return broker[-count:]
+    
+    def fetch_since(timestamp):
+        calls.append(("since", timestamp))
+        return broker[broker['time'] >= timestamp]
+    
+    assert len(sync_bars(store, "EURUSD", "5m", 100, fetch_latest, fetch_since)) == 60
+    assert store.is_complete("EURUSD", "5m")
+    
+    # Later syncs fetch only the new bars instead of the whole history again
+    broker = make_rates(START + np.arange(62) * 300)
+    assert len(sync_bars(store, "EURUSD", "5m", 100, fetch_latest, fetch_since)) == 62
+    assert calls == [("latest", 100), ("since", int(START + 59 * 300))]
+
+
+def test_replace_switches_versions(store):
+    store.append("EURUSD", "5m", make_rates(START + np.arange(10) * 300))
+    store.replace("EURUSD", "5m", make_rates(START + np.arange(20) * 300))
+    first = store.path("EURUSD", "5m")
+    
+    # Readers still on the replaced version keep a complete history
+    store.replace("EURUSD", "5m", make_rates(START + np.arange(30) * 300))
+    assert store.path("EURUSD", "5m") != first
+    assert len(np.fromfile(os.path.join(first, "time.bin"), dtype=np.int64)) == 20
+    assert store.count("EURUSD", "5m") == 30
+    
+    # Only the current and the previous version are kept
+    store.replace("EURUSD", "5m", make_rates(START + np.arange(40) * 300))
+    assert not os.path.exists(first)
+    assert len(os.listdir(store.series_path("EURUSD", "5m"))) == 3
+
+
+def test_retention(tmp_path):
+    store = BarStore(str(tmp_path), max_bars=100)
+    store.append("EURUSD", "5m", make_rates(START + np.arange(120) * 300))
+    assert store.count("EURUSD", "5m") == 120
+    
+    # Past a quarter over the limit the history is trimmed to the newest bars
+    store.append("EURUSD", "5m", make_rates(START + np.arange(120, 130) * 300))
+    assert store.count("EURUSD", "5m") == 100
+    assert store.tail("EURUSD", "5m", 1)['time'][0] == START + 129 * 300
+    assert store.is_complete("EURUSD", "5m")
+
+
+@pytest.mark.parametrize("symbol,timeframe", [("../EURUSD", "5m"), ("EURUSD", ".."), ("EURUSD", "5m/../../x")])
+def test_series_path_rejects_path_names(store, symbol, timeframe):
+    with pytest.raises(ValueError):
+        store.append(symbol, timeframe, make_rates(START + np.arange(10) * 300))
+
+
+def test_writers_wait_for_the_series_lock(store):
+    import threading
+    
+    done = threading.Event()
+    writer = threading.Thread(target=lambda: (store.append("EURUSD", "5m", make_rates(START + np.arange(10) * 300)), done.set()))
+    
+    # An append waits while another writer holds the series
+    with store.lock("EURUSD", "5m"):
+        writer.start()
+        assert not done.wait(0.2)
+        assert store.count("EURUSD", "5m") == 0
+        
+        # The holder itself can keep writing
+        store.append("EURUSD", "5m", make_rates(START + np.arange(5) * 300))
+    
+    writer.join(5)
+    assert done.is_set()
+    assert store.count("EURUSD", "5m") == 10
+    
+    # Other series are not held up
+    with store.lock("EURUSD", "5m"):
+        store.append("GBPUSD", "5m", make_rates(START + np.arange(3) * 300))
+    assert store.count("GBPUSD", "5m") == 3
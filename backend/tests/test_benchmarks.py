@@ -0,0 +1,112 @@
+"""Benchmarks of the model and connection hot paths (requires pytest-benchmark).
+
+Sizes above BENCHMARK_MAX_BARS (default 10000) are skipped; set it to
+1000000 for the full 1k/10k/100k/1M run. Save a baseline and compare
+later runs against it, failing on mean regressions above 15%:
+
+    python -m pytest tests/test_benchmarks.py --benchmark-only --benchmark-save=baseline
+    python -m pytest tests/test_benchmarks.py --benchmark-only --benchmark-compare --benchmark-compare-fail=mean:15%
+
+Baselines are JSON files under .benchmarks/.
+"""
+import pytest
+import os
+import sys
+from unittest.mock import patch
+
+pytest.importorskip("pytest_benchmark")
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import run_model, mt5_connection
+from scripts.run_model import ForexModel
+from scripts.synthetic_data import generate_rates
+from scripts.mt5_connection import MT5Session, get_market_data
+from test_mt5_connection import MockMT5
+
+# Bar counts to benchmark
+BENCHMARK_BARS = [1000, 10000, 100000, 1000000]
+
+# Largest bar count run unless overridden
+BENCHMARK_MAX_BARS = int(os.environ.get("BENCHMARK_MAX_BARS", 10000))
+
+TECHNICAL_FEATURES = {
+    "Deep Learning": {"enabled": False},
+    "Sentiment Analysis": {"enabled": False},
+    "Advanced Risk Management": {"enabled": False},
+    "Adaptive Parameters": {"enabled": True}
+}
+
+bars_params = pytest.mark.parametrize("bars", [
+    pytest.param(bars, marks=pytest.mark.skipif(bars > BENCHMARK_MAX_BARS, reason=f"BENCHMARK_MAX_BARS={BENCHMARK_MAX_BARS}"))
+    for bars in BENCHMARK_BARS
+])
+
+
+def make_rates(bars, seed=42):
+    return generate_rates(bars, "EURUSD", "5m", seed=seed, end=1617235200)
+
+
+@pytest.fixture
+def model():
+    return ForexModel("EURUSD", "5m", TECHNICAL_FEATURES, {})
+
+
+@bars_params
+def test_preprocess_data(benchmark, model, bars):
+    rates = make_rates(bars)
+    df = benchmark(model.preprocess_data, rates)
+    assert len(df) > 0
+
+
+@bars_params
+@pytest.mark.parametrize("indicator", ["rsi", "atr", "bollinger_bands", "macd", "adx", "true_range"])
+def test_calculate_indicator(benchmark, model, bars, indicator):
+    df = model.prepare_frame(make_rates(bars))
+    
+    # Price-series indicators take the close column, the others the frame
+    argument = df['close'] if indicator in ("rsi", "bollinger_bands", "macd") else df
+    benchmark.group = f"calculate_{indicator}"
+    benchmark(getattr(model, f"calculate_{indicator}"), argument)
+
+
+@bars_params
+def test_detect_market_regime(benchmark, model, bars):
+    df = model.preprocess_data(make_rates(bars))
+    assert benchmark(model.detect_market_regime, df) in ("TRENDING", "VOLATILE", "RANGING")
+
+
+@bars_params
+def test_generate_prediction(benchmark, model, bars):
+    rates = make_rates(bars)
+    
+    # Time the full path, not feature cache hits
+    result = benchmark.pedantic(
+        model.generate_prediction,
+        args=(rates,),
+        setup=run_model.FEATURE_CACHE.clear,
+        rounds=5 if bars < 100000 else 2
+    )
+    assert result["success"] is True
+
+
+@bars_params
+@pytest.mark.parametrize("layout", ["rows", "columnar", "npy"])
+def test_get_market_data(benchmark, bars, layout):
+    rates = make_rates(bars)
+    mock = MockMT5()
+    mock.copy_rates_from_pos = lambda symbol, timeframe, start_pos, count: rates[:count]
+    
+    def login(login=None, password=None, server=None):
+        mock.authorized = mock.initialized
+        return mock.authorized
+    
+    mock.login = login
+    
+    with patch.object(mt5_connection, 'mt5', mock), \
+         patch.object(mt5_connection, '_session', MT5Session(persistent=True)), \
+         patch.dict(os.environ, {"BAR_STORE_DIR": ""}):
+        benchmark.group = f"get_market_data_{layout}"
+        result = benchmark(get_market_data, "MetaQuotes-Demo", "12345678", "EURUSD", "5m", str(bars), layout)
+    
+    assert '"success": true' in result
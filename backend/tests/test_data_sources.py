@@ -0,0 +1,218 @@
+import pytest
+import os
+import sys
+import threading
+from unittest.mock import patch
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import run_model
+from scripts.bar_store import BarStore
+from scripts.data_sources import BarFetcher, BarStoreSource, InlineSource, MT5Source, data_sources
+from scripts.market_data import load_rates, serialize_rates
+from scripts.synthetic_data import generate_rates
+
+FEATURES = {
+    "Deep Learning": {"enabled": False},
+    "Sentiment Analysis": {"enabled": False},
+    "Advanced Risk Management": {"enabled": False},
+    "Adaptive Parameters": {"enabled": False}
+}
+
+
+class CountingSource:
+    def __init__(self, rates, key=("counting",)):
+        self.rates = rates
+        self.key = key
+        self.calls = []
+    
+    def fetch(self, symbol, timeframe, bars):
+        self.calls.append((symbol, timeframe, bars))
+        return self.rates
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.append("EURUSD", "5m", generate_rates(600, "EURUSD", "5m", seed=1, end=1617235200))
+    return store
+
+
+def test_data_sources_spec(store):
+    with patch.dict(os.environ, {"BAR_STORE_DIR": ""}):
+        assert data_sources(None) == []
+    
+    sources = data_sources([
+        {"type": "mt5", "server": "MetaQuotes-Demo", "login": 12345678},
+        {"type": "store", "directory": store.directory},
+        {"type": "inline", "series": {}}
+    ])
+    assert [type(source) for source in sources] == [MT5Source, BarStoreSource, InlineSource]
+    assert sources[0].key == ("mt5", "MetaQuotes-Demo", "12345678")
+    
+    with patch.dict(os.environ, {"BAR_STORE_DIR": store.directory}):
+        assert [source.key for source in data_sources(None)] == [("store", store.directory)]
+    
+    with pytest.raises(ValueError):
+        data_sources({"type": "csv"})
+
+
+def test_sources_fetch(store):
+    source = BarStoreSource(store)
+    assert len(source.fetch("EURUSD", "5m", 100)) == 100
+    assert len(source.fetch("EURUSD", "5m", None)) == 600
+    assert source.fetch("GBPUSD", "5m", 100) is None
+    
+    payload = {"close": [1.2, 1.3]}
+    assert InlineSource({"EURUSD/5m": payload}).fetch("EURUSD", "5m", 100) is payload
+    assert InlineSource({}).fetch("EURUSD", "5m", 100) is None
+
+
+def test_bar_fetcher_shares_fetches():
+    now = [0.0]
+    fetcher = BarFetcher(ttl=1.0, clock=lambda: now[0])
+    rates = generate_rates(50, seed=2)
+    empty = CountingSource(None, ("empty",))
+    source = CountingSource(rates)
+    
+    # Sources are tried in order; repeated requests share the first fetch
+    assert fetcher.fetch("EURUSD", "5m", 50, [empty, source]) is rates
+    assert fetcher.fetch("EURUSD", "5m", 50, [empty, source]) is rates
+    assert len(source.calls) == 1
+    assert fetcher.stats() == {"fetches": 1, "shared": 1, "series": 1}
+    
+    # Other bars, and expired series, are fetched again
+    fetcher.fetch("EURUSD", "1h", 50, [empty, source])
+    now[0] = 1.5
+    fetcher.fetch("EURUSD", "5m", 50, [empty, source])
+    assert len(source.calls) == 3
+    assert fetcher.stats()["series"] == 1
+    
+    # Missing bars and inline sources are not cached
+    assert fetcher.fetch("GBPUSD", "5m", 50, [empty]) is None
+    assert fetcher.fetch("GBPUSD", "5m", 50, [empty]) is None
+    assert len(empty.calls) == 5
+    inline = InlineSource({"EURUSD/5m": rates})
+    assert fetcher.fetch("EURUSD", "5m", 50, [inline]) is rates
+    assert fetcher.stats()["fetches"] == 5
+
+
+def test_bar_fetcher_concurrent_requests():
+    fetcher = BarFetcher(ttl=60.0)
+    rates = generate_rates(50, seed=3)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    
+    class SlowSource:
+        key = ("slow",)
+        
+        def fetch(self, symbol, timeframe, bars):
+            calls.append(symbol)
+            started.set()
+            release.wait(5)
+            return rates
+    
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(fetcher.fetch("EURUSD", "5m", 50, [SlowSource()])))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    
+    # Requests arriving during the fetch wait for it instead of fetching again
+    assert calls == ["EURUSD"]
+    assert len(results) == 4 and all(result is rates for result in results)
+
+
+def test_load_data_sources(store):
+    run_model.BAR_FETCHER.clear()
+    
+    with patch.dict(os.environ, {"BAR_STORE_DIR": ""}):
+        # Explicit source
+        rates = run_model.load_data("EURUSD", timeframe="5m", data_source={"type": "store", "directory": store.directory})
+        assert len(rates) == run_model.MODEL_HISTORY_BARS
+        
+        # No bars is an error, unless sample data is explicitly enabled
+        with pytest.raises(run_model.MarketDataUnavailable):
+            run_model.load_data("GBPUSD", timeframe="5m", data_source={"type": "store", "directory": store.directory})
+        sample = run_model.load_data("GBPUSD", timeframe="5m", data_source={"type": "store", "directory": store.directory}, sample_data=True)
+        assert isinstance(sample, list) and len(sample) == 100
+        
+        # Inline series through the worker
+        inline = generate_rates(200, "USDJPY", "1h", seed=4)
+        response = run_model.handle_worker_request({
+            "symbol": "USDJPY",
+            "timeframe": "1h",
+            "features": FEATURES,
+            "dataSource": {"type": "inline", "series": {"USDJPY/1h": serialize_rates(inline, "columnar")}}
+        })
+        assert response["success"] is True
+        assert response["entryPrice"] == pytest.approx(inline['close'][-1])
+
+
+def test_predict_without_market_data(store, tmp_path):
+    run_model.BAR_FETCHER.clear()
+    
+    with patch.dict(os.environ, {"BAR_STORE_DIR": "", "MODEL_SAMPLE_DATA": ""}):
+        # A missing store or an empty inline series fails instead of predicting on sample bars
+        for source in [{"type": "store", "directory": str(tmp_path / "missing")}, {"type": "inline", "series": {"EURUSD/5m": []}}]:
+            result = run_model.predict("EURUSD", "5m", FEATURES, {}, data_source=source)
+            assert result["success"] is False
+            assert result["error"] == "No data source returned bars"
+        
+        # Items of a batch fail on their own
+        result = run_model.predict_batch(
+            [{"symbol": "GBPUSD", "timeframe": "5m"}, {"symbol": "EURUSD", "timeframe": "5m"}],
+            FEATURES,
+            {},
+            {"type": "store", "directory": store.directory}
+        )
+        assert [prediction["success"] for prediction in result["predictions"]] == [False, True]
+        assert result["predictions"][0]["symbol"] == "GBPUSD"
+
+
+def test_predict_batch_shares_fetch(store):
+    run_model.BAR_FETCHER.clear()
+    source = {"type": "store", "directory": store.directory}
+    
+    with patch.object(BarStore, 'tail', autospec=True, side_effect=BarStore.tail) as tail:
+        result = run_model.predict_batch(
+            [{"symbol": "EURUSD", "timeframe": "5m"}, {"symbol": "EURUSD", "timeframe": "5m"}],
+            FEATURES,
+            {},
+            source
+        )
+        run_model.predict("EURUSD", "5m", FEATURES, {}, data_source=source)
+    
+    assert result["success"] is True
+    assert len(result["predictions"]) == 2
+    assert tail.call_count == 1
+
+
+def test_share_job_data(store, tmp_path):
+    run_model.BAR_FETCHER.clear()
+    source = {"type": "store", "directory": store.directory}
+    jobs = [
+        {"symbol": "EURUSD", "timeframe": "5m"},
+        {"symbol": "EURUSD", "timeframe": "5m"},
+        {"symbol": "GBPUSD", "timeframe": "5m"},
+        {"symbol": "EURUSD", "timeframe": "1h", "data": [{"close": 1.2}]}
+    ]
+    
+    fetches = run_model.BAR_FETCHER.stats()["fetches"]
+    
+    with patch('scripts.market_data.RATES_DIR', str(tmp_path / "rates")):
+        shared = run_model.share_job_data(jobs, source)
+    
+    # One npy file per fetched series; jobs with their own data and missing series are left alone
+    assert shared[0]["dataPath"] == shared[1]["dataPath"]
+    assert len(load_rates(shared[0]["dataPath"])) == run_model.MODEL_HISTORY_BARS
+    assert "dataPath" not in shared[2] and "data" not in shared[2]
+    assert shared[3] == jobs[3]
+    assert run_model.BAR_FETCHER.stats()["fetches"] == fetches + 2
@@ -0,0 +1,68 @@
+import pytest
+import os
+import sys
+import json
+import numpy as np
+from datetime import datetime
+from unittest.mock import patch
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import encoding
+from scripts.encoding import available_encodings, decode, dumps, encode, json_response, negotiate
+from scripts.market_data import serialize_rates
+from scripts.synthetic_data import generate_rates
+
+
+def bar_payload():
+    rates = generate_rates(1000, "EURUSD", "5m", seed=6, end=1617235200)
+    return {
+        "success": True,
+        "data": serialize_rates(rates, "columnar"),
+        "last": {"close": rates['close'][-1], "tick_volume": rates['tick_volume'][-1], "time": datetime(2021, 4, 1)}
+    }
+
+
+def test_dumps_numpy_values():
+    message = {"price": np.float64(1.2), "volume": np.uint64(3), "closes": np.array([1.0, 2.0]), "time": datetime(2021, 4, 1)}
+    assert json.loads(dumps(message)) == {"price": 1.2, "volume": 3, "closes": [1.0, 2.0], "time": "2021-04-01T00:00:00"}
+    
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+
+@pytest.mark.parametrize("name", ["json", "orjson", "msgpack"])
+def test_encodings_round_trip(name):
+    if name not in available_encodings():
+        pytest.skip(f"{name} is not installed")
+    
+    message = bar_payload()
+    wire_format, payload = encode(message, name)
+    assert wire_format == ("msgpack" if name == "msgpack" else "json")
+    
+    decoded = decode(payload, wire_format)
+    assert decoded == json.loads(dumps(message))
+    
+    # Fast encoders are no larger than the default
+    assert len(payload) <= len(encode(message)[1])
+
+
+def test_negotiate_falls_back_to_json():
+    assert negotiate(None) == "json"
+    assert negotiate("xml") == "json"
+    
+    with patch.object(encoding, 'msgpack', None), patch.object(encoding, 'orjson', None):
+        assert available_encodings() == ["json"]
+        assert encode({"a": 1}, "msgpack") == ("json", b'{"a": 1}')
+        with pytest.raises(ValueError):
+            decode(b"\x81\xa1a\x01", "msgpack")
+
+
+def test_json_response():
+    @json_response
+    def command(value):
+        return {"success": True, "value": np.int32(value)}
+    
+    assert command(3) == '{"success": true, "value": 3}'
+    assert command.response(3) == {"success": True, "value": 3}
+    assert command.__name__ == "command"
@@ -0,0 +1,135 @@
+import pytest
+import os
+import sys
+import time
+import threading
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.ensemble import MicroBatcher, EnsembleRunner, ModelSet, combine_outputs, predict_frames
+from scripts.run_model import ForexModel, get_dl_model_set
+
+FEATURES = {
+    "Deep Learning": {"enabled": False},
+    "Sentiment Analysis": {"enabled": False},
+    "Advanced Risk Management": {"enabled": False},
+    "Adaptive Parameters": {"enabled": False}
+}
+
+
+class SlowModel:
+    """Stands in for a deep learning model whose inference releases the GIL"""
+    
+    def __init__(self, prediction, confidence, delay=0.1):
+        self.output = (prediction, confidence)
+        self.delay = delay
+    
+    def predict(self, df):
+        time.sleep(self.delay)
+        return self.output
+
+
+def run_threads(count, target):
+    results = [None] * count
+    
+    def call(i):
+        results[i] = target(i)
+    
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_micro_batcher_coalesces_concurrent_callers():
+    batches = []
+    
+    def double(items):
+        batches.append(list(items))
+        time.sleep(0.02)
+        return [item * 2 for item in items]
+    
+    batcher = MicroBatcher(double, max_batch=16, max_wait=0.05)
+    results = run_threads(8, lambda i: batcher.submit([i, i + 100]))
+    
+    # Every caller gets its own results, computed in fewer calls than callers
+    assert results == [[i * 2, (i + 100) * 2] for i in range(8)]
+    assert len(batches) < 8
+    assert max(len(batch) for batch in batches) <= 16
+    assert batcher.stats() == {"batches": len(batches), "items": 16, "pending": 0}
+
+
+def test_micro_batcher_lone_caller_and_errors():
+    batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_wait=0)
+    started = time.perf_counter()
+    assert batcher.submit([1, 2]) == [2, 3]
+    assert time.perf_counter() - started < 0.05
+    
+    def fail(items):
+        raise RuntimeError("model failed")
+    
+    batcher = MicroBatcher(fail)
+    with pytest.raises(RuntimeError):
+        batcher.submit([1])
+    
+    # The batcher is usable after a failed batch
+    batcher.func = lambda items: items
+    assert batcher.submit([5]) == [5]
+
+
+def test_ensemble_runs_members_concurrently():
+    members = {"lstm": SlowModel(0.8, 0.75), "transformer": SlowModel(0.2, 0.25)}
+    runner = EnsembleRunner()
+    
+    started = time.perf_counter()
+    outputs = runner.run(members, ["df1", "df2"])
+    elapsed = time.perf_counter() - started
+    runner.shutdown()
+    
+    assert outputs == {"lstm": [(0.8, 0.75)] * 2, "transformer": [(0.2, 0.25)] * 2}
+    
+    # Both members ran at the same time instead of one after the other
+    assert elapsed < 0.35
+
+
+def test_combine_outputs():
+    combined = combine_outputs({"lstm": [(0.8, 0.75), (0.5, 0.0)], "transformer": [(0.2, 0.25), (0.1, 0.0)]})
+    assert combined[0] == (pytest.approx((0.8 * 0.75 + 0.2 * 0.25) / 1.0), 0.75)
+    assert combined[1] == (0.0, 0.0)
+    assert predict_frames(SlowModel(0.1, 0.2, delay=0), ["df"]) == [(0.1, 0.2)]
+
+
+def test_model_ensemble_predictions():
+    model_set = ModelSet({"lstm": SlowModel(0.8, 0.75, delay=0.05), "transformer": SlowModel(0.2, 0.25, delay=0.05)}, max_wait=0.05)
+    models = [ForexModel(symbol, "5m", FEATURES, {}) for symbol in ("EURUSD", "GBPUSD")]
+    for model in models:
+        model.dl_models = model_set
+    
+    # Concurrent requests of different models share one batch through each member
+    results = run_threads(4, lambda i: models[i % 2].deep_learning_predictions([f"df{i}"]))
+    assert all(result == [(pytest.approx(0.65), 0.75)] for result in results)
+    assert model_set.batcher.stats()["items"] == 4
+    assert model_set.batcher.stats()["batches"] < 4
+    assert models[0].dl_model is model_set.models
+
+
+def test_dl_model_set_shared_per_configuration():
+    built = []
+    
+    def build():
+        built.append(SlowModel(0.1, 0.2, delay=0))
+        return built[-1]
+    
+    config = {"enabled": True, "parameters": {"modelType": "LSTM", "lookbackPeriod": 17}}
+    model_set = get_dl_model_set(config, build)
+    
+    # Models of the same configuration are built once and share a batcher
+    assert get_dl_model_set(dict(config), build) is model_set
+    assert model_set.models is built[0]
+    assert model_set.predict(["df1", "df2"]) == [(0.1, 0.2)] * 2
+    
+    other = get_dl_model_set({"enabled": True, "parameters": {"modelType": "LSTM", "lookbackPeriod": 18}}, build)
+    assert other is not model_set
+    assert len(built) == 2
@@ -0,0 +1,121 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.feature_cache import FeatureCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def make_frame(bars, start=0):
+    return pd.DataFrame({
+        'time': pd.date_range('2021-04-01', periods=bars, freq='5min') + pd.Timedelta(minutes=5 * start),
+        'close': 1.2 + np.arange(start, start + bars) * 0.0001
+    })
+
+
+def test_key_changes_with_bars():
+    df = make_frame(50)
+    params = {"sma_fast": 20}
+    key = FeatureCache.make_key("EURUSD", "5m", params, df)
+    
+    assert key == FeatureCache.make_key("EURUSD", "5m", params, df.copy())
+    assert key != FeatureCache.make_key("EURUSD", "1h", params, df)
+    assert key != FeatureCache.make_key("EURUSD", "5m", {"sma_fast": 10}, df)
+    assert key != FeatureCache.make_key("EURUSD", "5m", params, make_frame(50, start=1))
+    
+    # A revised last bar with the same timestamp is a different key
+    revised = df.copy()
+    revised.loc[49, 'close'] += 0.001
+    assert key != FeatureCache.make_key("EURUSD", "5m", params, revised)
+    
+    # So is a correction to a bar in the middle of the history
+    corrected = df.copy()
+    corrected.loc[10, 'close'] += 0.001
+    assert key != FeatureCache.make_key("EURUSD", "5m", params, corrected)
+
+
+def test_hits_misses_and_ttl():
+    clock = FakeClock()
+    cache = FeatureCache(ttl=10, clock=clock)
+    df = make_frame(50)
+    
+    assert cache.get("a") is None
+    cache.put("a", df)
+    
+    cached = cache.get("a")
+    assert cached.equals(df)
+    
+    # Callers adding columns don't change the cached frame
+    cached['extra'] = 1.0
+    assert 'extra' not in cache.get("a").columns
+    
+    clock.now = 11
+    assert cache.get("a") is None
+    
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["expirations"] == 1
+    assert stats["extensions"] == 0
+    assert stats["entries"] == 0
+    assert stats["bytes"] == 0
+
+
+def test_lru_eviction_by_count_and_memory():
+    cache = FeatureCache(max_entries=2)
+    cache.put("a", make_frame(10))
+    cache.put("b", make_frame(10))
+    cache.get("a")
+    cache.put("c", make_frame(10))
+    
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+    
+    size = int(make_frame(10).memory_usage(index=True, deep=False).sum())
+    cache = FeatureCache(max_bytes=2 * size)
+    for key in "abc":
+        cache.put(key, make_frame(10))
+    
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= 2 * size
+    
+    # Frames larger than the whole budget are not stored
+    cache.put("big", make_frame(1000))
+    assert cache.get("big") is None
+
+
+def test_get_prefix():
+    cache = FeatureCache()
+    params = {"sma_fast": 20}
+    df = make_frame(100)
+    
+    key = FeatureCache.make_key("EURUSD", "5m", params, df.iloc[:90])
+    cache.put(key, df.iloc[:90], state="engine")
+    
+    # Bars appended to the cached ones extend them
+    features, length, state = cache.get_prefix(FeatureCache.make_key("EURUSD", "5m", params, df), df)
+    assert length == 90
+    assert state == "engine"
+    assert features.equals(df.iloc[:90])
+    assert cache.stats()["extensions"] == 1
+    
+    # A revised cached bar, another series or a shorter frame does not
+    revised = df.copy()
+    revised.loc[89, 'close'] += 0.001
+    assert cache.get_prefix(FeatureCache.make_key("EURUSD", "5m", params, revised), revised) is None
+    corrected = df.copy()
+    corrected.loc[10, 'close'] += 0.001
+    assert cache.get_prefix(FeatureCache.make_key("EURUSD", "5m", params, corrected), corrected) is None
+    assert cache.get_prefix(FeatureCache.make_key("EURUSD", "1h", params, df), df) is None
+    assert cache.get_prefix(key, df.iloc[:80]) is None
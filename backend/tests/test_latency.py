@@ -0,0 +1,50 @@
+import pytest
+import os
+import sys
+import time
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.latency import StageTimer, LatencyHistograms, profile_call
+
+
+def test_stage_timer_laps():
+    timer = StageTimer()
+    time.sleep(0.01)
+    timer.lap("first")
+    timer.lap("second")
+    time.sleep(0.01)
+    timer.lap("first")
+    
+    timings = timer.milliseconds()
+    assert list(timings) == ["first", "second"]
+    assert timings["first"] >= 20
+    assert timings["second"] < 5
+    
+    # A copy keeps the stages so far and times from its creation
+    copy = timer.copy()
+    copy.lap("third")
+    assert list(copy.milliseconds()) == ["first", "second", "third"]
+    assert list(timer.milliseconds()) == ["first", "second"]
+
+
+def test_latency_histograms():
+    histograms = LatencyHistograms(buckets=(0.001, 0.01))
+    histograms.observe_timings({"preprocess": 0.5, "technical": 0.2})
+    histograms.observe_timings({"preprocess": 5.0, "technical": 50.0})
+    
+    snapshot = histograms.snapshot()
+    assert snapshot["preprocess"]["buckets"] == {"0.001": 1, "0.01": 2, "+Inf": 2}
+    assert snapshot["technical"]["buckets"] == {"0.001": 1, "0.01": 1, "+Inf": 2}
+    assert snapshot["technical"]["sum"] == pytest.approx(0.0502)
+    
+    text = histograms.render()
+    assert "# TYPE prediction_stage_seconds histogram" in text
+    assert 'prediction_stage_seconds_bucket{stage="preprocess",le="0.01"} 2' in text
+    assert 'prediction_stage_seconds_count{stage="technical"} 2' in text
+
+
+def test_profile_call():
+    result, report = profile_call(sorted, [3, 1, 2])
+    assert result == [1, 2, 3]
+    assert "function calls" in report
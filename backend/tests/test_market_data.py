@@ -0,0 +1,79 @@
+import pytest
+import json
+import os
+import sys
+import numpy as np
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.market_data import RATES_DTYPE, serialize_rates, save_rates, load_rates
+
+
+@pytest.fixture
+def rates():
+    bars = 50
+    rates = np.zeros(bars, dtype=RATES_DTYPE)
+    rates['time'] = 1617235200 + np.arange(bars) * 300
+    rates['close'] = 1.2 + np.linspace(0, 0.01, bars)
+    rates['open'] = rates['close'] - 0.0001
+    rates['high'] = rates['close'] + 0.0002
+    rates['low'] = rates['close'] - 0.0003
+    rates['tick_volume'] = 1000
+    rates['spread'] = 2
+    rates['real_volume'] = 10000
+    return rates
+
+
+def test_save_and_load_rates(rates, tmp_path):
+    path = save_rates(rates, "EURUSD", "5m", str(tmp_path))
+    
+    loaded = load_rates(path)
+    
+    assert os.path.basename(path) == "EURUSD_5m.npy"
+    assert isinstance(loaded, np.memmap)
+    assert loaded.dtype == RATES_DTYPE
+    assert np.array_equal(loaded, rates)
+    
+    # Rewriting replaces the file without disturbing existing readers
+    save_rates(rates[:10], "EURUSD", "5m", str(tmp_path))
+    assert len(load_rates(path)) == 10
+    assert np.array_equal(loaded, rates)
+
+
+def test_save_rates_concurrently(rates, tmp_path):
+    # Threads of one process write the same file without clobbering each other's temporary file
+    from concurrent.futures import ThreadPoolExecutor
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        paths = list(executor.map(lambda _: save_rates(rates, "EURUSD", "5m", str(tmp_path)), range(32)))
+    
+    assert len(set(paths)) == 1
+    assert np.array_equal(load_rates(paths[0]), rates)
+    assert os.listdir(tmp_path) == ["EURUSD_5m.npy"]
+
+
+@pytest.mark.parametrize("symbol,timeframe", [("../EURUSD", "5m"), ("EURUSD", "a/b"), ("..", "5m"), ("", "5m"), ("EUR\\USD", "5m")])
+def test_save_rates_rejects_path_names(rates, tmp_path, symbol, timeframe):
+    # Symbols and timeframes arrive from requests and must not leave the rates directory
+    with pytest.raises(ValueError):
+        save_rates(rates, symbol, timeframe, str(tmp_path / "rates"))
+    
+    assert not os.path.exists(tmp_path / "EURUSD_5m.npy")
+
+
+def test_load_rates_rejects_plain_arrays(tmp_path):
+    path = str(tmp_path / "plain.npy")
+    np.save(path, np.arange(10))
+    
+    with pytest.raises(ValueError):
+        load_rates(path)
+
+
+def test_serialize_rates_json(rates):
+    rows = serialize_rates(rates)
+    columns = serialize_rates(rates, "columnar")
+    
+    assert len(rows) == len(rates)
+    assert rows[0]["time"] == "2021-04-01T00:00:00"
+    assert columns["close"] == rates['close'].tolist()
+    assert json.loads(json.dumps(columns)) == columns
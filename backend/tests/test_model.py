@@ -1,14 +1,51 @@
 import pytest
+import io
 import json
+import subprocess
+import numpy as np
+import pandas as pd
 import os
 import sys
 from unittest.mock import patch, MagicMock
 
 # Add the scripts directory to the path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from scripts.run_model import ForexModel, run_prediction
+from scripts import run_model
+from scripts.market_data import RATES_DTYPE, save_rates, load_rates
+from scripts.run_model import ForexModel, run_prediction, run_worker, handle_worker_request, shutdown_prediction_pool
+
+# Maximum time to import run_model and produce a purely technical prediction,
+# on top of importing numpy and pandas (which alone take ~0.35s on slow hosts)
+STARTUP_BUDGET_SECONDS = 0.5
+
+# Modules only needed by optional model components
+HEAVY_MODULES = ["tensorflow", "lightgbm", "sklearn", "nltk", "bs4", "requests"]
+
+STARTUP_SCRIPT = """
+import json, sys, time
+import numpy, pandas
+start = time.perf_counter()
+from scripts.run_model import run_prediction
+features = {
+    "Deep Learning": {"enabled": False},
+    "Sentiment Analysis": {"enabled": False},
+    "Advanced Risk Management": {"enabled": False},
+    "Adaptive Parameters": {"enabled": False}
+}
+result = json.loads(run_prediction("EURUSD", "5m", json.dumps(features), "{}"))
+print(json.dumps({
+    "success": result["success"],
+    "elapsed": time.perf_counter() - start,
+    "imported": [name for name in %r if name in sys.modules]
+}))
+""" % HEAVY_MODULES
 
 class TestForexModel:
+    @pytest.fixture(autouse=True)
+    def sample_data(self, monkeypatch):
+        # Requests without market data run on generated sample bars
+        monkeypatch.setenv("MODEL_SAMPLE_DATA", "1")
+    
     @pytest.fixture
     def model_instance(self):
         # Create test features and risk settings
@@ -137,6 +174,82 @@ class TestForexModel:
         assert not df['macd'].isnull().any()
         assert not df['macd_signal'].isnull().any()
     
+    def test_preprocess_columnar_data(self, model_instance):
+        model, data = model_instance
+        
+        # Columnar payloads should produce the same frame as row payloads
+        columnar = {key: [bar[key] for bar in data] for key in data[0]}
+        
+        df_rows = model.preprocess_data(data)
+        df_columnar = model.preprocess_data(columnar)
+        
+        assert df_rows.equals(df_columnar)
+    
+    def test_preprocess_rates_array(self, model_instance, tmp_path):
+        model, data = model_instance
+        
+        # Binary rates files should produce the same indicators as JSON rows
+        rates = np.array(
+            [
+                (int(pd.Timestamp(bar["time"]).timestamp()), bar["open"], bar["high"], bar["low"],
+                 bar["close"], bar["tick_volume"], bar["spread"], bar["real_volume"])
+                for bar in data
+            ],
+            dtype=RATES_DTYPE
+        )
+        path = save_rates(rates, "EURUSD", "5m", str(tmp_path))
+        
+        df_rows = model.preprocess_data(data)
+        df_rates = model.preprocess_data(load_rates(path))
+        
+        assert list(df_rates['time']) == list(df_rows['time'])
+        assert np.allclose(df_rates['rsi'], df_rows['rsi'])
+        assert np.allclose(df_rates['macd'], df_rows['macd'])
+    
+    def test_incremental_indicators_match_batch(self, model_instance):
+        model, data = model_instance
+        
+        # Feed bars one at a time and compare with the batch computation
+        rows = [model.update(bar) for bar in data]
+        streamed = pd.DataFrame(rows).dropna().reset_index(drop=True)
+        batch = model.preprocess_data(data).reset_index(drop=True)
+        
+        columns = [
+            'returns', 'log_returns', 'sma_20', 'sma_50', 'rsi', 'atr',
+            'bollinger_upper', 'bollinger_lower', 'macd', 'macd_signal'
+        ]
+        assert len(streamed) == len(batch)
+        assert np.allclose(streamed[columns].values, batch[columns].values, rtol=1e-9, atol=1e-12)
+        
+        # ADX should match calculate_adx over the same history
+        adx = model.calculate_adx(pd.DataFrame(data))
+        assert np.allclose(pd.DataFrame(rows)['adx'], adx, rtol=1e-9, atol=1e-12, equal_nan=True)
+    
+    def test_true_range_kernel_matches_pandas(self, model_instance):
+        model, data = model_instance
+        df = pd.DataFrame(data)
+        high, low, close = df['high'], df['low'], df['close']
+        
+        # Reference rolling-window ATR/ADX computed with pandas
+        tr = pd.concat([high - low, (high - close.shift()).abs(), (low - close.shift()).abs()], axis=1).max(axis=1)
+        plus_dm = high.diff()
+        minus_dm = low.diff()
+        plus_dm = plus_dm.where((plus_dm > 0) & (plus_dm > minus_dm.abs()), 0)
+        minus_dm = minus_dm.abs().where((minus_dm < 0) & (minus_dm.abs() > plus_dm), 0)
+        plus_di = 100 * plus_dm.rolling(window=14).sum() / tr.rolling(window=14).sum()
+        minus_di = 100 * minus_dm.rolling(window=14).sum() / tr.rolling(window=14).sum()
+        dx = 100 * (plus_di - minus_di).abs() / (plus_di + minus_di)
+        
+        ranges = model.calculate_true_range(df)
+        
+        assert np.allclose(ranges['atr'], tr.rolling(window=14).mean(), equal_nan=True)
+        assert np.allclose(ranges['adx'], dx.rolling(window=14).mean(), equal_nan=True)
+        assert np.allclose(model.calculate_atr(df), ranges['atr'], equal_nan=True)
+        
+        # preprocess_data keeps the kernel's ADX for regime detection
+        processed = model.preprocess_data(data)
+        assert np.allclose(processed['adx'], model.calculate_adx(df).iloc[-len(processed):])
+    
     def test_detect_market_regime(self, model_instance):
         model, data = model_instance
         
@@ -189,6 +302,75 @@ class TestForexModel:
         assert "tech_prediction" in result["parameters"]
         assert "tech_confidence" in result["parameters"]
         assert "atr" in result["parameters"]
+        
+        # Check stage timings
+        timings = result["parameters"]["timings_ms"]
+        assert list(timings) == ["preprocess", "dl_inference", "regime", "sentiment", "technical", "risk"]
+        assert all(value >= 0 for value in timings.values())
+    
+    def test_generate_batch_prediction(self, model_instance):
+        model, data = model_instance
+        
+        # Series of different lengths share one stacked computation
+        datasets = [data, data[20:], data[:90]]
+        frames = model.preprocess_batch(datasets)
+        
+        for dataset, df in zip(datasets, frames):
+            expected = model.preprocess_data(dataset)
+            assert list(df.columns) == list(expected.columns)
+            assert np.allclose(df.drop(columns='time').values, expected.drop(columns='time').values)
+        
+        # Batch predictions should match one-by-one predictions
+        items = [("EURUSD", "5m", data), ("GBPUSD", "1h", data[20:])]
+        results = model.generate_batch_prediction(items)
+        
+        assert [r["symbol"] for r in results] == ["EURUSD", "GBPUSD"]
+        assert [r["timeframe"] for r in results] == ["5m", "1h"]
+        
+        single = model.generate_prediction(data[20:])
+        assert results[1]["direction"] == single["direction"]
+        assert results[1]["parameters"]["tech_prediction"] == single["parameters"]["tech_prediction"]
+        assert np.isclose(results[1]["parameters"]["atr"], single["parameters"]["atr"])
+    
+    def test_feature_cache_reuse(self, model_instance):
+        model, data = model_instance
+        run_model.FEATURE_CACHE.clear()
+        
+        first = model.generate_prediction(data)
+        stats = run_model.FEATURE_CACHE.stats()
+        
+        # Unchanged bars skip preprocessing, even from another model instance
+        other = ForexModel(model.symbol, model.timeframe, model.features, model.risk_settings)
+        second = other.generate_prediction(data)
+        
+        assert run_model.FEATURE_CACHE.stats()["hits"] == stats["hits"] + 1
+        assert second["parameters"]["tech_prediction"] == first["parameters"]["tech_prediction"]
+        
+        # A new bar is a miss
+        model.generate_prediction(data[1:])
+        assert run_model.FEATURE_CACHE.stats()["misses"] == stats["misses"] + 1
+    
+    def test_feature_cache_extends_new_bars(self, model_instance):
+        model, data = model_instance
+        run_model.FEATURE_CACHE.clear()
+        
+        model.preprocess_cached(data[:-5])
+        extensions = run_model.FEATURE_CACHE.stats()["extensions"]
+        
+        # Each new bar only adds its own rows to the cached frame, matching a full pass
+        for end in range(len(data) - 4, len(data) + 1):
+            extended = model.preprocess_cached(data[:end])
+            expected = model.preprocess_data(data[:end])
+            
+            assert list(extended.columns) == list(expected.columns)
+            assert len(extended) == len(expected)
+            np.testing.assert_allclose(
+                extended.drop(columns='time').to_numpy(dtype=float),
+                expected.drop(columns='time').to_numpy(dtype=float),
+                rtol=1e-7, atol=1e-9
+            )
+        
+        assert run_model.FEATURE_CACHE.stats()["extensions"] == extensions + 5
     
     def test_run_prediction_function(self):
         # Create test features and risk settings
@@ -261,3 +443,236 @@ class TestForexModel:
             assert result_dict["symbol"] == "EURUSD"
             assert result_dict["direction"] == "BUY"
             assert result_dict["confidence"] == 0.85
+    
+    def test_run_worker(self):
+        features = {
+            "Deep Learning": {"enabled": False},
+            "Sentiment Analysis": {"enabled": False},
+            "Advanced Risk Management": {"enabled": False},
+            "Adaptive Parameters": {"enabled": False}
+        }
+        
+        requests = [
+            {"id": 1, "symbol": "EURUSD", "timeframe": "5m", "features": features, "riskSettings": {}},
+            {"id": 2, "command": "PING"},
+            {"id": 3, "symbol": "GBPUSD", "timeframe": "1h", "features": features, "riskSettings": {}}
+        ]
+        input_stream = io.StringIO("\n".join(json.dumps(r) for r in requests) + "\nnot json\n")
+        output_stream = io.StringIO()
+        
+        # Model instances should be created once per configuration
+        run_model._model_cache.clear()
+        run_worker(input_stream, output_stream)
+        cached_models = list(run_model._model_cache.values())
+        input_stream.seek(0)
+        run_worker(input_stream, io.StringIO())
+        assert len(cached_models) == 2
+        assert list(run_model._model_cache.values()) == cached_models
+        
+        responses = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+        
+        # Check responses are returned in order with matching ids
+        assert [r.get("id") for r in responses] == [1, 2, 3, None]
+        assert responses[0]["success"] is True
+        assert responses[0]["symbol"] == "EURUSD"
+        assert responses[1]["message"] == "pong"
+        assert responses[2]["symbol"] == "GBPUSD"
+        assert responses[3]["success"] is False
+    
+    def test_run_worker_framed(self):
+        from scripts.protocol import FrameChannel, write_frame
+        from scripts.synthetic_data import generate_rates
+        from scripts.market_data import serialize_rates
+        
+        features = {
+            "Deep Learning": {"enabled": False},
+            "Sentiment Analysis": {"enabled": False},
+            "Advanced Risk Management": {"enabled": False},
+            "Adaptive Parameters": {"enabled": False}
+        }
+        
+        # 50k bars in one request, well past what argv or a comfortable line would carry
+        rates = generate_rates(50000, "EURUSD", "5m", seed=5)
+        requests = [
+            {"id": 1, "symbol": "EURUSD", "timeframe": "5m", "features": features, "data": serialize_rates(rates, "columnar")},
+            {"id": 2, "command": "PING", "encoding": "orjson"}
+        ]
+        input_stream = io.BytesIO()
+        for request in requests:
+            FrameChannel(None, input_stream).send(request)
+        write_frame(input_stream, b"Jnot json")
+        input_stream.seek(0)
+        output_stream = io.BytesIO()
+        
+        run_worker(input_stream, output_stream, framed=True)
+        
+        output_stream.seek(0)
+        channel = FrameChannel(output_stream, None)
+        responses = [channel.decode(payload) for payload in channel]
+        assert [r.get("id") for r in responses] == [1, 2, None]
+        assert responses[0]["success"] is True
+        assert responses[0]["entryPrice"] == pytest.approx(rates['close'][-1])
+        assert responses[1]["message"] == "pong"
+        assert responses[2]["success"] is False
+    
+    def test_run_worker_survives_bad_requests(self, monkeypatch):
+        # Valid JSON that isn't an object is rejected, and the worker goes on
+        output_stream = io.StringIO()
+        run_worker(io.StringIO('[1]\n{"command": "PING", "id": 2}\n'), output_stream)
+        responses = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+        assert responses[0]["success"] is False
+        assert responses[0]["message"].startswith("Invalid request")
+        assert responses[1] == {"success": True, "message": "pong", "id": 2}
+        
+        # Unexpected failures are answered with the request id, also from worker threads
+        def failing_predict(*args):
+            raise RuntimeError("model crashed")
+        
+        monkeypatch.setattr(run_model, "predict", failing_predict)
+        for threads in (1, 2):
+            output_stream = io.StringIO()
+            run_worker(io.StringIO('{"id": 1, "symbol": "EURUSD", "timeframe": "5m"}\n{"command": "PING", "id": 2}\n'), output_stream, threads=threads)
+            responses = sorted((json.loads(line) for line in output_stream.getvalue().splitlines()), key=lambda r: r["id"])
+            assert responses[0] == {"success": False, "message": "Worker request failed: model crashed", "id": 1}
+            assert responses[1]["message"] == "pong"
+    
+    def test_run_worker_broken_frames(self):
+        from scripts.protocol import FrameChannel, write_frame
+        
+        # A bad format tag is answered and skipped; a truncated frame ends the worker cleanly
+        input_stream = io.BytesIO()
+        write_frame(input_stream, b"X{}")
+        FrameChannel(None, input_stream).send({"id": 1, "command": "PING"})
+        input_stream.write(b"\x00\x00\x01\x00J{")
+        input_stream.seek(0)
+        output_stream = io.BytesIO()
+        
+        run_worker(input_stream, output_stream, framed=True)
+        
+        output_stream.seek(0)
+        channel = FrameChannel(output_stream, None)
+        responses = [channel.decode(payload) for payload in channel]
+        assert responses[0]["success"] is False
+        assert responses[0]["message"].startswith("Invalid request")
+        assert responses[1] == {"success": True, "message": "pong", "id": 1}
+        assert len(responses) == 2
+    
+    def test_run_worker_threads(self):
+        features = {
+            "Deep Learning": {"enabled": False},
+            "Sentiment Analysis": {"enabled": False},
+            "Advanced Risk Management": {"enabled": False},
+            "Adaptive Parameters": {"enabled": False}
+        }
+        
+        requests = [
+            {"id": i, "symbol": symbol, "timeframe": "5m", "features": features}
+            for i, symbol in enumerate(["EURUSD", "GBPUSD", "USDJPY", "EURUSD"])
+        ] + [{"id": 4, "command": "PING"}]
+        input_stream = io.StringIO("\n".join(json.dumps(r) for r in requests) + "\n")
+        output_stream = io.StringIO()
+        
+        run_worker(input_stream, output_stream, threads=3)
+        
+        # Predictions may complete out of order; every request gets its response
+        responses = {r["id"]: r for r in map(json.loads, output_stream.getvalue().splitlines())}
+        assert sorted(responses) == [0, 1, 2, 3, 4]
+        assert all(responses[i]["success"] for i in range(4))
+        assert responses[1]["symbol"] == "GBPUSD"
+    
+    def test_worker_metrics_and_profile(self):
+        features = {
+            "Deep Learning": {"enabled": False},
+            "Sentiment Analysis": {"enabled": False},
+            "Advanced Risk Management": {"enabled": False},
+            "Adaptive Parameters": {"enabled": False}
+        }
+        run_model.LATENCY.counts.clear()
+        
+        plain = handle_worker_request({"symbol": "EURUSD", "timeframe": "5m", "features": features})
+        profiled = handle_worker_request({"symbol": "EURUSD", "timeframe": "5m", "features": features, "profile": True})
+        assert "profile" not in plain
+        assert "generate_prediction" in profiled["profile"]
+        assert plain["parameters"]["timings_ms"]["load_data"] >= 0
+        
+        metrics = handle_worker_request({"command": "METRICS"})
+        assert metrics["stages"]["preprocess"]["count"] == 2
+        assert metrics["stages"]["technical"]["buckets"]["+Inf"] == 2
+        assert 'prediction_stage_seconds_count{stage="load_data"} 2' in metrics["metrics"]
+    
+    def test_parallel_predictions(self):
+        features = {
+            "Deep Learning": {"enabled": False},
+            "Sentiment Analysis": {"enabled": False},
+            "Advanced Risk Management": {"enabled": False},
+            "Adaptive Parameters": {"enabled": False}
+        }
+        
+        request = {
+            "id": 7,
+            "command": "PREDICT_PARALLEL",
+            "items": [
+                {"symbol": "EURUSD", "timeframe": "5m"},
+                {"symbol": "GBPUSD", "timeframe": "5m"},
+                {"symbol": "EURUSD", "timeframe": "1h"}
+            ],
+            "features": features,
+            "riskSettings": {},
+            "workers": 2
+        }
+        
+        # Each result is streamed as soon as its job completes
+        streamed = []
+        try:
+            response = handle_worker_request(request, streamed.append)
+        finally:
+            shutdown_prediction_pool()
+        
+        assert response["success"] is True
+        assert response["count"] == 3
+        assert all(message["id"] == 7 and message["partial"] for message in streamed)
+        
+        results = sorted((m["result"]["symbol"], m["result"]["timeframe"]) for m in streamed)
+        assert results == [("EURUSD", "1h"), ("EURUSD", "5m"), ("GBPUSD", "5m")]
+        assert all(m["result"]["success"] for m in streamed)
+    
+    def test_parallel_predictions_invalid_requests(self):
+        # Malformed items fail on their own, without starting a pool
+        response = handle_worker_request({
+            "command": "PREDICT_PARALLEL",
+            "items": [{"symbol": "EURUSD"}, "EURUSD", {"timeframe": "5m", "symbol": ""}]
+        })
+        assert response["success"] is True
+        assert response["count"] == 3
+        assert [p["success"] for p in response["predictions"]] == [False, False, False]
+        assert response["predictions"][0]["message"] == "Missing arguments. Required: timeframe"
+        assert response["predictions"][1]["message"] == "Invalid item: expected an object"
+        assert response["predictions"][2]["symbol"] == ""
+        
+        # A bad worker count fails the whole request
+        for workers in (0, "2", -1):
+            response = handle_worker_request({
+                "id": 3,
+                "command": "PREDICT_PARALLEL",
+                "items": [{"symbol": "EURUSD", "timeframe": "5m"}],
+                "workers": workers
+            })
+            assert response["success"] is False
+            assert response["id"] == 3
+            assert response["message"].startswith("Parallel prediction failed: Invalid workers")
+    
+    def test_technical_prediction_startup_budget(self):
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            cwd=backend_dir,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        startup = json.loads(output.splitlines()[-1])
+        
+        # Disabled components must not pull in their dependencies
+        assert startup["success"] is True
+        assert startup["imported"] == []
+        assert startup["elapsed"] < STARTUP_BUDGET_SECONDS
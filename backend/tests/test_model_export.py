@@ -0,0 +1,166 @@
+import pytest
+import os
+import sys
+import numpy as np
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import model_export
+from scripts.model_export import (
+    CompiledModel, RuntimeModel, export_model, export_models, export_path, use_exported, compare_outputs
+)
+
+LOOKBACK = 20
+FEATURES = 5
+
+
+class Wrapper:
+    """Stands in for LSTMModel/TransformerModel, which keep their Keras model in .model"""
+    
+    def __init__(self, model):
+        self.model = model
+
+
+class FakeCompiled:
+    def __init__(self):
+        self.calls = []
+    
+    def run(self, inputs):
+        self.calls.append(inputs)
+        return np.zeros((len(inputs), 1), dtype=np.float32)
+
+
+class FakeKeras:
+    """A trained model whose output is the mean of its inputs, plus ``bias``"""
+    
+    def __init__(self, bias=0.0):
+        self.bias = bias
+    
+    def predict(self, inputs, verbose=0):
+        return np.asarray(inputs).mean(axis=(1, 2))[:, np.newaxis] + self.bias
+
+
+@pytest.fixture(scope="module")
+def keras_lstm():
+    """A small LSTM with the input layout of the forecasting models"""
+    tf = pytest.importorskip("tensorflow")
+    tf.random.set_seed(0)
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=(LOOKBACK, FEATURES)),
+        tf.keras.layers.LSTM(16),
+        tf.keras.layers.Dense(1)
+    ])
+    return model
+
+
+@pytest.fixture(scope="module")
+def samples():
+    return np.random.default_rng(0).random((8, LOOKBACK, FEATURES)).astype(np.float32)
+
+
+def test_export_path():
+    """Test exported file naming"""
+    assert export_path("out", "lstm", 60) == os.path.join("out", "lstm_60.tflite")
+    assert export_path("out", "transformer", 30, "onnx", "int8") == os.path.join("out", "transformer_30_int8.onnx")
+
+
+def test_export_rejects_unknown_options(tmp_path):
+    """Test that unknown quantization modes and runtimes raise ValueError"""
+    with pytest.raises(ValueError):
+        export_model(Wrapper(None), str(tmp_path / "m.tflite"), quantization="int4")
+    with pytest.raises(ValueError):
+        export_model(Wrapper(None), str(tmp_path / "m.bin"), runtime="coreml")
+
+
+def test_use_exported_without_export(tmp_path, monkeypatch):
+    """Test that models stay unchanged when no export is configured or found"""
+    monkeypatch.delenv("DL_EXPORT_DIR", raising=False)
+    wrapper = Wrapper("keras")
+    
+    assert not use_exported(wrapper, "lstm", LOOKBACK)
+    assert not use_exported(wrapper, "lstm", LOOKBACK, directory=str(tmp_path))
+    assert wrapper.model == "keras"
+
+
+def test_runtime_model_delegates():
+    """Test that RuntimeModel answers predict() and calls with the compiled model"""
+    compiled = FakeCompiled()
+    model = RuntimeModel(compiled, original="keras")
+    inputs = np.ones((3, LOOKBACK, FEATURES))
+    
+    assert model.predict(inputs, verbose=0).shape == (3, 1)
+    assert model(inputs).shape == (3, 1)
+    assert len(compiled.calls) == 2
+    assert model.original == "keras"
+
+
+@pytest.mark.parametrize("quantization,tolerance", [(None, 1e-4), ("fp16", 1e-2), ("int8", 5e-2)])
+def test_tflite_accuracy(keras_lstm, samples, tmp_path, quantization, tolerance):
+    """Test that TFLite exports stay within tolerance of the Keras model"""
+    path = export_model(
+        Wrapper(keras_lstm), export_path(str(tmp_path), "lstm", LOOKBACK, "tflite", quantization),
+        "tflite", quantization, representative_data=samples
+    )
+    
+    assert compare_outputs(keras_lstm, CompiledModel(path), samples) < tolerance
+
+
+@pytest.mark.parametrize("quantization,tolerance", [(None, 1e-4), ("int8", 5e-2)])
+def test_onnx_accuracy(keras_lstm, samples, tmp_path, quantization, tolerance):
+    """Test that ONNX exports stay within tolerance of the Keras model"""
+    pytest.importorskip("tf2onnx")
+    pytest.importorskip("onnxruntime")
+    path = export_model(
+        Wrapper(keras_lstm), export_path(str(tmp_path), "lstm", LOOKBACK, "onnx", quantization),
+        "onnx", quantization
+    )
+    
+    assert compare_outputs(keras_lstm, CompiledModel(path), samples) < tolerance
+
+
+def test_use_exported_swaps_model(keras_lstm, samples, tmp_path):
+    """Test that a wrapper runs on its export once one is in the export directory"""
+    export_model(Wrapper(keras_lstm), export_path(str(tmp_path), "lstm", LOOKBACK))
+    wrapper = Wrapper(keras_lstm)
+    
+    assert use_exported(wrapper, "lstm", LOOKBACK, directory=str(tmp_path))
+    assert isinstance(wrapper.model, RuntimeModel)
+    np.testing.assert_allclose(wrapper.model.predict(samples), keras_lstm.predict(samples, verbose=0), atol=1e-4)
+
+
+def test_export_models_uses_trained_models(tmp_path, monkeypatch):
+    """Test that export_models converts the given live models and checks their exports"""
+    converted = {}
+    
+    # The "exported" model answers like its source, off by 0.001
+    def fake_export(model, path, runtime="tflite", quantization=None, representative_data=None):
+        converted[path] = model_export.keras_model(model)
+        return path
+    
+    class FakeRuntime:
+        def __init__(self, path):
+            self.model = converted[path]
+        
+        def run(self, inputs):
+            return self.model.predict(inputs) + 0.001
+    
+    monkeypatch.setattr(model_export, "export_model", fake_export)
+    monkeypatch.setattr(model_export, "CompiledModel", FakeRuntime)
+    live = {"lstm": Wrapper(FakeKeras(0.1)), "transformer": Wrapper(RuntimeModel(FakeCompiled(), FakeKeras(0.2)))}
+    
+    result = export_models(str(tmp_path), LOOKBACK, models=live)
+    
+    assert result["success"] is True
+    assert sorted(converted.values(), key=lambda model: model.bias) == [live["lstm"].model, live["transformer"].model.original]
+    assert result["paths"]["LSTM"] == export_path(str(tmp_path), "lstm", LOOKBACK)
+    assert result["errors"]["LSTM"] == pytest.approx(0.001, abs=1e-6)
+    assert result["errors"]["Transformer"] == pytest.approx(0.001, abs=1e-6)
+
+
+def test_export_models_requires_weights(tmp_path):
+    """Test that untrained models are not exported"""
+    result = export_models(str(tmp_path), LOOKBACK, models={"lstm": Wrapper(FakeKeras())})
+    
+    assert result["success"] is False
+    assert "Transformer" in result["message"]
+    assert os.listdir(tmp_path) == []
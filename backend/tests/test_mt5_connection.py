@@ -1,18 +1,26 @@
 import pytest
+import io
 import json
 import os
 import sys
+import threading
+import numpy as np
 from unittest.mock import patch, MagicMock
 
 # Add the scripts directory to the path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from scripts.mt5_connection import connect, get_market_data, get_positions, place_trade, close_trade, modify_trade
+from scripts import mt5_connection
+from scripts.mt5_connection import connect, get_market_data, serialize_rates, get_positions, place_trade, close_trade, modify_trade, MT5Session, serve, stream_ticks, execute_batch
+from scripts.market_data import RATES_DTYPE
 
 # Mock MT5 module
 class MockMT5:
     def __init__(self):
         self.initialized = False
         self.authorized = False
+        self.initialize_calls = 0
+        self.range_calls = []
+        self.available_bars = 100
         self.account_info = None
         self.positions = []
         self.rates = []
@@ -34,14 +42,25 @@ class MockMT5:
         self.TRADE_ACTION_SLTP = 2
         
         self.ORDER_TIME_GTC = 1
-        self.ORDER_FILLING_IOC = 2
+        self.ORDER_FILLING_FOK = 0
+        self.ORDER_FILLING_IOC = 1
+        self.ORDER_FILLING_RETURN = 2
+        
+        self.SYMBOL_FILLING_FOK = 1
+        self.SYMBOL_FILLING_IOC = 2
         
         self.TRADE_RETCODE_DONE = 10009
     
     def initialize(self):
+        self.initialize_calls += 1
         self.initialized = True
         return self.initialized
     
+    def terminal_info(self):
+        if not self.initialized:
+            return None
+        return object()
+    
     def login(self, login=None, password=None, server=None):
         if not self.initialized:
             return False
@@ -120,6 +139,13 @@ class MockMT5:
         
         return np.array(rates, dtype=dtype)
     
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        self.range_calls.append((symbol, timeframe, date_from))
+        rates = self.copy_rates_from_pos(symbol, timeframe, 0, self.available_bars)
+        if rates is None:
+            return None
+        return rates[(rates['time'] >= date_from) & (rates['time'] <= date_to)]
+    
     def positions_get(self, ticket=None):
         if not self.authorized:
             return None
@@ -154,8 +180,12 @@ class MockMT5:
     def symbol_info_tick(self, symbol):
         class Tick:
             def __init__(self, bid, ask):
+                self.time = 1617235200
+                self.time_msc = 1617235200000
                 self.bid = bid
                 self.ask = ask
+                self.last = 0.0
+                self.volume = 0
         
         if symbol == "EURUSD":
             return Tick(1.2045, 1.2047)
@@ -164,6 +194,24 @@ class MockMT5:
         else:
             return Tick(1.0000, 1.0001)
     
+    def symbol_select(self, symbol, enable=True):
+        return True
+    
+    def symbol_info(self, symbol):
+        self.symbol_info_calls = getattr(self, 'symbol_info_calls', 0) + 1
+        
+        class SymbolInfo:
+            def __init__(self, name):
+                self.name = name
+                self.point = 0.00001
+                self.digits = 5
+                self.volume_min = 0.01
+                self.volume_max = 100.0
+                self.volume_step = 0.01
+                self.filling_mode = 1  # FOK only
+        
+        return SymbolInfo(symbol)
+    
     def order_send(self, request):
         class Result:
             def __init__(self, retcode, order, price):
@@ -181,6 +229,21 @@ def mock_mt5():
         yield mock
 
 
+@pytest.fixture
+def resident_mt5():
+    mock = MockMT5()
+    
+    def login(login=None, password=None, server=None):
+        mock.authorized = mock.initialized
+        return mock.authorized
+    
+    mock.login = login
+    
+    with patch.object(mt5_connection, 'mt5', mock), \
+         patch.object(mt5_connection, '_session', MT5Session(persistent=True)):
+        yield mock
+
+
 def test_connect_success(mock_mt5):
     result = json.loads(connect("MetaQuotes-Demo", "12345678", "password123"))
     
@@ -258,3 +321,456 @@ def test_modify_trade(mock_mt5):
     assert result["result"]["ticket"] == 123456
     assert result["result"]["sl"] == 1.1850
     assert result["result"]["tp"] == 1.2150
+
+
+def test_persistent_session_reused(resident_mt5):
+    first = json.loads(get_positions("MetaQuotes-Demo", "12345678"))
+    second = json.loads(modify_trade("MetaQuotes-Demo", "12345678", "123456", "1.1850", "1.2150"))
+    
+    assert first["success"] is True
+    assert second["success"] is True
+    assert resident_mt5.initialize_calls == 1
+
+
+def test_persistent_session_reconnects_and_evicts(resident_mt5):
+    session = mt5_connection._session
+    
+    # A dropped terminal connection is re-established on the next command
+    assert session.open("MetaQuotes-Demo", "12345678") is None
+    resident_mt5.shutdown()
+    assert session.open("MetaQuotes-Demo", "12345678") is None
+    assert resident_mt5.initialize_calls == 2
+    
+    # Idle sessions are shut down
+    session.idle_timeout = 0
+    session.last_used -= 1
+    session.evict_if_idle()
+    assert session.key is None
+    assert resident_mt5.initialized is False
+
+
+def test_session_relogs_in_after_eviction(resident_mt5):
+    session = mt5_connection._session
+    passwords = []
+    
+    def login(login=None, password=None, server=None):
+        passwords.append(password)
+        resident_mt5.authorized = resident_mt5.initialized
+        return resident_mt5.authorized
+    
+    resident_mt5.login = login
+    
+    assert session.open("MetaQuotes-Demo", "12345678", "password123") is None
+    
+    # Eviction keeps the credentials, so the next command logs in again with them
+    session.idle_timeout = 0
+    session.last_used -= 1
+    session.evict_if_idle()
+    assert json.loads(get_positions("MetaQuotes-Demo", "12345678"))["success"] is True
+    assert passwords == ["password123", "password123"]
+    
+    # DISCONNECT forgets them
+    mt5_connection.disconnect("MetaQuotes-Demo", "12345678")
+    assert session.passwords == {}
+
+
+def test_serve(resident_mt5):
+    requests = [
+        {"id": 1, "command": "POSITIONS", "server": "MetaQuotes-Demo", "login": "12345678"},
+        {"id": 2, "command": "CLOSE", "server": "MetaQuotes-Demo", "login": "12345678", "args": [123456]},
+        {"id": 3, "command": "UNKNOWN", "server": "MetaQuotes-Demo", "login": "12345678"}
+    ]
+    input_stream = io.StringIO("\n".join(json.dumps(r) for r in requests) + "\n")
+    output_stream = io.StringIO()
+    
+    serve(input_stream, output_stream)
+    
+    responses = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+    
+    assert [r["id"] for r in responses] == [1, 2, 3]
+    assert len(responses[0]["positions"]) == 2
+    assert responses[1]["result"]["ticket"] == 123456
+    assert responses[2]["success"] is False
+    assert resident_mt5.initialize_calls == 1
+
+
+def test_serve_framed(resident_mt5):
+    from scripts.protocol import FrameChannel
+    
+    requests = [
+        {"id": 1, "command": "MARKET_DATA", "server": "MetaQuotes-Demo", "login": "12345678", "args": ["EURUSD", "5m", 100, "columnar"]},
+        {"id": 2, "command": "BATCH", "server": "MetaQuotes-Demo", "login": "12345678", "args": [[{"action": "CLOSE", "ticket": 123457}]]},
+        {"id": 3, "command": "MARKET_DATA", "server": "MetaQuotes-Demo", "login": "12345678", "args": ["EURUSD", "5m", 100, "columnar"], "encoding": "orjson"}
+    ]
+    input_stream = io.BytesIO()
+    for request in requests:
+        FrameChannel(None, input_stream).send(request)
+    input_stream.seek(0)
+    output_stream = io.BytesIO()
+    
+    serve(input_stream, output_stream, framed=True)
+    
+    # Structured arguments arrive as JSON, without string-encoding them first
+    output_stream.seek(0)
+    channel = FrameChannel(output_stream, None)
+    responses = [channel.decode(payload) for payload in channel]
+    assert [r["id"] for r in responses] == [1, 2, 3]
+    assert len(responses[0]["data"]["close"]) == 100
+    assert responses[1]["results"][0]["result"]["ticket"] == 123457
+    
+    # Negotiated encodings carry the same response
+    assert responses[2]["data"]["time"] == responses[0]["data"]["time"]
+    assert len(responses[2]["data"]["close"]) == 100
+
+
+def test_serve_broken_frames(resident_mt5):
+    from scripts.protocol import FrameChannel, write_frame
+    
+    # A bad format tag is answered and skipped; a truncated frame ends the daemon cleanly
+    input_stream = io.BytesIO()
+    write_frame(input_stream, b"X{}")
+    FrameChannel(None, input_stream).send({"id": 1, "command": "POSITIONS", "server": "MetaQuotes-Demo", "login": "12345678"})
+    input_stream.write(b"\x00\x00\x01\x00J{")
+    input_stream.seek(0)
+    output_stream = io.BytesIO()
+    
+    serve(input_stream, output_stream, framed=True)
+    
+    output_stream.seek(0)
+    channel = FrameChannel(output_stream, None)
+    responses = [channel.decode(payload) for payload in channel]
+    assert responses[0]["message"].startswith("Invalid request")
+    assert responses[1]["id"] == 1 and responses[1]["success"] is True
+    assert len(responses) == 2
+    assert resident_mt5.initialized is False
+
+
+def test_serialize_rates_layouts():
+    mock = MockMT5()
+    mock.authorized = True
+    rates = mock.copy_rates_from_pos("EURUSD", mock.TIMEFRAME_M5, 0, 5)
+    
+    rows = serialize_rates(rates)
+    columns = serialize_rates(rates, "columnar")
+    
+    assert len(rows) == 5
+    assert rows[0]["time"] == "2021-04-01T00:00:00"
+    assert rows[1]["time"] == "2021-04-01T00:05:00"
+    assert list(columns) == ["time", "open", "high", "low", "close", "tick_volume", "spread", "real_volume"]
+    assert columns["close"] == [row["close"] for row in rows]
+    assert all(type(value) is int for value in columns["tick_volume"])
+    assert json.loads(json.dumps(rows)) == rows
+
+
+def test_get_market_data_columnar(resident_mt5):
+    result = json.loads(get_market_data("MetaQuotes-Demo", "12345678", "EURUSD", "5m", "10", "columnar"))
+    
+    assert result["success"] is True
+    assert result["layout"] == "columnar"
+    assert len(result["data"]["time"]) == 10
+    assert len(result["data"]["close"]) == 10
+
+
+def test_get_market_data_bar_store(resident_mt5, tmp_path, monkeypatch):
+    monkeypatch.setenv("BAR_STORE_DIR", str(tmp_path))
+    
+    # First request fills the store
+    first = json.loads(get_market_data("MetaQuotes-Demo", "12345678", "EURUSD", "5m", "50", "columnar"))
+    assert first["success"] is True
+    assert len(first["data"]["time"]) == 50
+    assert resident_mt5.range_calls == []
+    
+    # Later requests only fetch bars from the last stored one onwards
+    resident_mt5.available_bars = 60
+    second = json.loads(get_market_data("MetaQuotes-Demo", "12345678", "EURUSD", "5m", "50", "columnar"))
+    
+    assert len(resident_mt5.range_calls) == 1
+    assert resident_mt5.range_calls[0][2] == 1617235200 + 49 * 300
+    assert second["data"]["time"][-1] == "2021-04-01T04:55:00"
+    assert second["data"]["time"][0] == first["data"]["time"][10]
+
+
+def test_mt5_data_source(resident_mt5, monkeypatch):
+    from scripts import run_model
+    from scripts.data_sources import MT5Source
+    
+    monkeypatch.setenv("BAR_STORE_DIR", "")
+    run_model.BAR_FETCHER.clear()
+    copy_rates_from_pos = resident_mt5.copy_rates_from_pos
+    calls = []
+    
+    def counting_copy(symbol, timeframe, start_pos, count):
+        calls.append((symbol, count))
+        return copy_rates_from_pos(symbol, timeframe, start_pos, count)
+    
+    resident_mt5.copy_rates_from_pos = counting_copy
+    source = {"type": "mt5", "server": "MetaQuotes-Demo", "login": "12345678"}
+    
+    # Two models on the same symbol/timeframe share one read on the session
+    first = run_model.load_data("EURUSD", timeframe="5m", bars=50, data_source=source)
+    second = run_model.load_data("EURUSD", timeframe="5m", bars=50, data_source=source)
+    assert second is first
+    assert len(first) == 50
+    assert calls == [("EURUSD", 50)]
+    
+    mt5_source = MT5Source("MetaQuotes-Demo", "12345678")
+    assert mt5_source.fetch("EURUSD", "2h", 50) is None
+    assert mt5_source.error["message"] == "Invalid timeframe: 2h"
+    
+    # Predictions report the source's error instead of falling back to sample bars
+    monkeypatch.setenv("MODEL_SAMPLE_DATA", "")
+    result = run_model.predict("EURUSD", "2h", {}, {}, data_source=source)
+    assert result["success"] is False
+    assert result["error"] == "Invalid timeframe: 2h"
+
+
+def test_mt5_data_source_keeps_session(resident_mt5):
+    from scripts.data_sources import MT5Source
+    
+    # Starting from the one-shot session of a model worker
+    with patch.object(mt5_connection, '_session', MT5Session()):
+        source = MT5Source("MetaQuotes-Demo", "12345678")
+        assert len(source.fetch("EURUSD", "5m", 10)) == 10
+        assert len(source.fetch("GBPUSD", "5m", 10)) == 10
+        
+        assert mt5_connection._session.persistent is True
+        assert resident_mt5.initialize_calls == 1
+        assert resident_mt5.initialized is True
+
+
+def test_stream_ticks_coalesces_unchanged(resident_mt5):
+    quotes = iter([1.2045, 1.2045, 1.2046, 1.2046])
+    symbol_info_tick = resident_mt5.symbol_info_tick
+    
+    def changing_tick(symbol):
+        tick = symbol_info_tick(symbol)
+        if symbol == "EURUSD":
+            tick.bid = next(quotes)
+        return tick
+    
+    resident_mt5.symbol_info_tick = changing_tick
+    output_stream = io.StringIO()
+    stream_ticks("MetaQuotes-Demo", "12345678", ["EURUSD", "GBPUSD"], output_stream, interval=0, max_polls=4)
+    
+    messages = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+    assert messages[0]["type"] == "status"
+    assert messages[0]["symbols"] == ["EURUSD", "GBPUSD"]
+    
+    ticks = [(m["symbol"], m["bid"]) for m in messages[1:]]
+    assert ticks == [("EURUSD", 1.2045), ("GBPUSD", 1.4995), ("EURUSD", 1.2046)]
+    assert resident_mt5.initialized is False
+
+
+def test_stream_ticks_subscribe(resident_mt5):
+    polled_gbpusd = threading.Event()
+    symbol_info_tick = resident_mt5.symbol_info_tick
+    
+    def tracking_tick(symbol):
+        if symbol == "GBPUSD":
+            polled_gbpusd.set()
+        return symbol_info_tick(symbol)
+    
+    resident_mt5.symbol_info_tick = tracking_tick
+    
+    # Subscribe to a second symbol, then close the control stream
+    def control_stream():
+        yield json.dumps({"command": "SUBSCRIBE", "symbols": ["GBPUSD"]}) + "\n"
+        polled_gbpusd.wait(5)
+    
+    output_stream = io.StringIO()
+    stream_ticks("MetaQuotes-Demo", "12345678", ["EURUSD"], output_stream, control_stream(), interval=0.01)
+    
+    symbols = [json.loads(line).get("symbol") for line in output_stream.getvalue().splitlines()[1:]]
+    assert "EURUSD" in symbols
+    assert "GBPUSD" in symbols
+
+
+def test_stream_ticks_bars(resident_mt5):
+    output_stream = io.StringIO()
+    stream_ticks("MetaQuotes-Demo", "12345678", ["EURUSD"], output_stream, interval=0, max_polls=2, timeframes=["1m", "1h"])
+    
+    bars = [json.loads(line) for line in output_stream.getvalue().splitlines() if '"bar"' in line]
+    assert [(bar["timeframe"], bar["closed"]) for bar in bars] == [("1m", False), ("1h", False)]
+    assert bars[0]["time"] == 1617235200
+    assert bars[0]["close"] == 1.2045
+    assert bars[0]["spread"] == 20
+
+
+def test_stream_ticks_bar_features(resident_mt5):
+    # History up to the 5-minute bar before the streamed tick
+    def copy_rates_from_pos(symbol, timeframe, start_pos, count):
+        rates = np.zeros(count, dtype=RATES_DTYPE)
+        rates['time'] = 1617235200 - np.arange(count, 0, -1) * 300
+        rates['close'] = 1.2 + np.sin(np.arange(count) / 5) * 0.001
+        rates['open'] = rates['close']
+        rates['high'] = rates['close'] + 0.0002
+        rates['low'] = rates['close'] - 0.0002
+        return rates
+    
+    resident_mt5.copy_rates_from_pos = copy_rates_from_pos
+    output_stream = io.StringIO()
+    stream_ticks("MetaQuotes-Demo", "12345678", ["EURUSD"], output_stream, interval=0, max_polls=1, timeframes=["5m"], indicator_params={})
+    
+    bars = [json.loads(line) for line in output_stream.getvalue().splitlines() if '"bar"' in line]
+    
+    # The tick closes the last history bar and starts a new one; both carry seeded indicators
+    assert [bar["closed"] for bar in bars] == [True, False]
+    for bar in bars:
+        assert 0 <= bar["features"]["rsi"] <= 100
+        assert bar["features"]["atr"] > 0
+        assert bar["features"]["sma_50"] is not None
+
+
+def test_execute_batch_rejected_order(resident_mt5):
+    order_send = resident_mt5.order_send
+    
+    # The terminal rejects the second order outright
+    def rejecting_order_send(request):
+        if request["action"] == resident_mt5.TRADE_ACTION_DEAL and request.get("position") is None:
+            return None
+        return order_send(request)
+    
+    resident_mt5.order_send = rejecting_order_send
+    resident_mt5.last_error_message = "(10027, 'AutoTrading disabled by client')"
+    
+    items = [
+        {"action": "CLOSE", "ticket": 123456},
+        {"action": "TRADE", "symbol": "EURUSD", "type": "BUY", "volume": 0.1},
+        {"action": "MODIFY", "ticket": 123457, "sl": 1.49, "tp": 1.51}
+    ]
+    result = json.loads(execute_batch("MetaQuotes-Demo", "12345678", items))
+    
+    assert result["success"] is True
+    assert [r["success"] for r in result["results"]] == [True, False, True]
+    assert "AutoTrading disabled" in result["results"][1]["message"]
+    assert result["failed"] == 1
+
+
+def test_execute_batch_operation_error(resident_mt5):
+    # Unexpected failures of one operation still return the others' results
+    def failing_order_send(request):
+        raise RuntimeError("terminal disconnected")
+    
+    items = [
+        {"action": "CLOSE", "ticket": 123456},
+        {"action": "MODIFY", "ticket": 999, "sl": 1.19}
+    ]
+    resident_mt5.order_send = failing_order_send
+    result = json.loads(execute_batch("MetaQuotes-Demo", "12345678", items))
+    
+    assert result["results"][0]["message"] == "Batch operation failed: terminal disconnected"
+    assert result["results"][1]["message"] == "Position with ticket 999 not found"
+
+
+def test_execute_batch(resident_mt5):
+    sent = []
+    snapshots = []
+    order_send = resident_mt5.order_send
+    positions_get = resident_mt5.positions_get
+    
+    def recording_order_send(request):
+        sent.append(request)
+        return order_send(request)
+    
+    def recording_positions_get(ticket=None):
+        snapshots.append(ticket)
+        return positions_get(ticket)
+    
+    resident_mt5.order_send = recording_order_send
+    resident_mt5.positions_get = recording_positions_get
+    
+    items = [
+        {"action": "CLOSE", "ticket": 123456},
+        {"action": "MODIFY", "ticket": "*", "sl": "breakeven"},
+        {"action": "TRADE", "symbol": "EURUSD", "type": "BUY", "volume": 0.1},
+        {"action": "CLOSE", "ticket": 999},
+        {"action": "HEDGE", "ticket": 123457}
+    ]
+    result = json.loads(execute_batch("MetaQuotes-Demo", "12345678", items))
+    
+    assert result["success"] is True
+    assert result["failed"] == 2
+    assert [(r["index"], r["action"] if "action" in r else None, r["success"]) for r in result["results"]] == [
+        (0, "CLOSE", True),
+        (1, "MODIFY", True),
+        (2, "TRADE", True),
+        (3, "CLOSE", False),
+        (4, None, False)
+    ]
+    assert all(r["elapsed_ms"] >= 0 for r in result["results"])
+    
+    # The closed position is not modified; the other one moves to breakeven
+    assert result["results"][1]["result"] == {"ticket": 123457, "sl": 1.5050, "tp": 1.4900}
+    
+    # One session and one positions snapshot for the whole batch
+    assert resident_mt5.initialize_calls == 1
+    assert snapshots == [None]
+    assert len(sent) == 3
+
+
+def test_batch_command(resident_mt5):
+    result = json.loads(mt5_connection.run_command("BATCH", "MetaQuotes-Demo", "12345678", ['[{"action": "CLOSE", "ticket": 123457}]']))
+    assert result["results"][0]["result"]["ticket"] == 123457
+    
+    result = json.loads(mt5_connection.run_command("BATCH", "MetaQuotes-Demo", "12345678", ["not json"]))
+    assert result["success"] is False
+
+
+def test_order_path_snapshots(resident_mt5):
+    sent = []
+    ticks = []
+    order_send = resident_mt5.order_send
+    symbol_info_tick = resident_mt5.symbol_info_tick
+    
+    def recording_order_send(request):
+        sent.append(request)
+        return order_send(request)
+    
+    def recording_symbol_info_tick(symbol):
+        ticks.append(symbol)
+        return symbol_info_tick(symbol)
+    
+    resident_mt5.order_send = recording_order_send
+    resident_mt5.symbol_info_tick = recording_symbol_info_tick
+    
+    place_trade("MetaQuotes-Demo", "12345678", "EURUSD", "SELL", "0.30000000000000004", sl="1.2100004")
+    place_trade("MetaQuotes-Demo", "12345678", "EURUSD", "BUY", "0.1")
+    close_trade("MetaQuotes-Demo", "12345678", "123456")
+    
+    # One tick per order, one symbol_info per session
+    assert ticks == ["EURUSD", "EURUSD", "EURUSD"]
+    assert resident_mt5.symbol_info_calls == 1
+    
+    assert sent[0]["volume"] == 0.3
+    assert sent[0]["sl"] == 1.21
+    assert sent[0]["price"] == 1.2045
+    assert sent[1]["price"] == 1.2047
+    assert sent[2]["price"] == 1.2045
+    assert all(request["type_filling"] == resident_mt5.ORDER_FILLING_FOK for request in sent)
+    
+    # The cache goes with the session
+    mt5_connection._session.shutdown()
+    assert mt5_connection._session.symbols == {}
+
+
+def test_trade_rejects_invalid_volume(resident_mt5):
+    sent = []
+    order_send = resident_mt5.order_send
+    
+    def recording_order_send(request):
+        sent.append(request)
+        return order_send(request)
+    
+    resident_mt5.order_send = recording_order_send
+    mt5_connection._session.open("MetaQuotes-Demo", "12345678", None)
+    
+    # Volumes off the step or outside the limits are refused, not rounded
+    for volume in (0.015, 0.001, 150):
+        result = mt5_connection._send_trade("EURUSD", "BUY", volume)
+        assert result["success"] is False
+        assert result["message"].startswith(f"Invalid volume {float(volume)} for EURUSD")
+    assert sent == []
+    
+    result = mt5_connection._send_trade("EURUSD", "BUY", 0.07)
+    assert result["success"] is True
+    assert sent[0]["volume"] == 0.07
@@ -0,0 +1,105 @@
+import pytest
+import json
+import os
+import sys
+import numpy as np
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.backtest import run_backtest, settings_from_features
+from scripts.optimizer import (
+    expand_grid, build_table, evaluate_trial, walk_forward_windows, features_fragment,
+    apply_settings, optimize
+)
+from scripts.run_model import ForexModel, INDICATOR_PARAMS
+
+
+@pytest.fixture
+def prices():
+    rng = np.random.default_rng(11)
+    bars = 8000
+    close = 1.2 + np.cumsum(rng.normal(0, 0.0005, bars))
+    high = close + np.abs(rng.normal(0, 0.0004, bars))
+    low = close - np.abs(rng.normal(0, 0.0004, bars))
+    return high, low, close
+
+
+GRID = {
+    "rsi_period": [9, 14],
+    "sma_fast": [10, 20],
+    "confidence_threshold": [0.5, 0.7]
+}
+
+
+def test_expand_grid_skips_crossed_periods():
+    trials = expand_grid({"sma_fast": [20, 60], "sma_slow": [50]}, settings_from_features({}))
+    
+    assert len(trials) == 1
+    assert trials[0]["indicator_params"]["sma_fast"] == 20
+    assert trials[0]["confidence_threshold"] == 0.7
+
+
+def test_shared_table_matches_backtest(prices):
+    high, low, close = prices
+    trials = expand_grid(GRID, settings_from_features({}))
+    table, index = build_table(high, low, close, np.zeros(len(close)), trials)
+    
+    # Columns are shared: two RSI periods, two fast SMAs, one of everything else
+    assert sum(1 for key in index if key[0] == "rsi") == 2
+    assert sum(1 for key in index if key[0] == "sma_50") == 1
+    
+    costs = {"commission": 0.0, "volume": 100000, "initial_balance": 10000.0, "max_bars_held": None}
+    for trial in trials:
+        stats = evaluate_trial(trial, [(0, len(close))], table, index, costs)[0]
+        expected = run_backtest(
+            high, low, close,
+            confidence_threshold=trial["confidence_threshold"],
+            indicator_params=trial["indicator_params"]
+        )["stats"]
+        
+        assert stats["trades"] == expected["trades"]
+        assert stats["netProfit"] == pytest.approx(expected["netProfit"])
+        assert sum(regime["trades"] for regime in stats["regimes"].values()) == stats["trades"]
+
+
+def test_walk_forward_windows():
+    windows = walk_forward_windows(1000, folds=4, train_fraction=0.75)
+    
+    assert windows[0] == ((0, 187), (187, 250))
+    assert windows[-1][1][1] == 1000
+    assert all(train[1] == test[0] for train, test in windows)
+
+
+def test_optimize(prices):
+    high, low, close = prices
+    result = optimize(high, low, close, grid=GRID, folds=3, keep_fraction=0.5, min_trades=1, workers=1)
+    
+    assert result["trials"] == 8
+    assert result["pruned"] == 4
+    assert len(result["folds"]) == 3
+    assert result["best"]["settings"] == result["folds"][-1]["settings"]
+    json.dumps(result)
+    
+    # The best settings can be applied to a features dict and read back by ForexModel
+    features = {"Deep Learning": {"enabled": False, "parameters": {"lookbackPeriod": 60}}}
+    features = apply_settings(features, result["best"]["features"])
+    
+    assert features["Deep Learning"]["parameters"]["lookbackPeriod"] == 60
+    assert features["Deep Learning"]["parameters"]["confidenceThreshold"] == result["best"]["settings"]["confidence_threshold"]
+    
+    model = ForexModel("EURUSD", "5m", features, {})
+    assert model.indicator_params == result["best"]["settings"]["indicator_params"]
+    assert settings_from_features(features)["indicator_params"] == model.indicator_params
+
+
+def test_features_fragment():
+    trial = {
+        "confidence_threshold": 0.6,
+        "risk_reward_minimum": 1.2,
+        "indicator_params": dict(INDICATOR_PARAMS, rsi_period=21)
+    }
+    fragment = features_fragment(trial)
+    
+    assert fragment["Technical Indicators"]["parameters"]["rsiPeriod"] == 21
+    assert fragment["Deep Learning"]["parameters"]["confidenceThreshold"] == 0.6
+    assert fragment["Advanced Risk Management"]["parameters"]["riskRewardMinimum"] == 1.2
@@ -0,0 +1,93 @@
+import pytest
+import io
+import os
+import sys
+import json
+import numpy as np
+from unittest.mock import patch
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import protocol
+from scripts.protocol import FrameChannel, LineChannel, open_channel, read_frame, write_frame
+
+
+class TrickleStream(io.BytesIO):
+    """Binary stream returning at most a few bytes per read, like a slow pipe"""
+    
+    def read(self, size=-1):
+        return super().read(min(size, 3) if size and size > 0 else size)
+
+
+def frames(*messages):
+    stream = io.BytesIO()
+    for message in messages:
+        write_frame(stream, b"J" + json.dumps(message).encode("utf-8"))
+    return stream.getvalue()
+
+
+def test_frame_round_trip():
+    payload = json.dumps({"bars": list(range(50000))}).encode("utf-8")
+    stream = io.BytesIO()
+    write_frame(stream, payload)
+    write_frame(stream, b"")
+    
+    stream.seek(0)
+    assert read_frame(stream) == payload
+    assert read_frame(stream) == b""
+    assert read_frame(stream) is None
+    
+    # Short reads are joined into whole frames
+    assert read_frame(TrickleStream(frames({"symbol": "EURUSD"}))) == b'J{"symbol": "EURUSD"}'
+
+
+def test_frame_errors():
+    data = frames({"symbol": "EURUSD"})
+    with pytest.raises(EOFError):
+        read_frame(io.BytesIO(data[:-2]))
+    
+    with patch.object(protocol, 'MAX_FRAME_SIZE', 4):
+        with pytest.raises(ValueError):
+            read_frame(io.BytesIO(data))
+
+
+def test_frame_channel_stops_on_broken_frames():
+    data = frames({"id": 1}, {"id": 2})
+    
+    # A frame cut short by the end of the input ends the iteration cleanly
+    channel = FrameChannel(io.BytesIO(data[:-2]), io.BytesIO())
+    assert [channel.decode(payload) for payload in channel] == [{"id": 1}]
+    
+    # An oversized header is answered with an error frame
+    output_stream = io.BytesIO()
+    channel = FrameChannel(io.BytesIO(data + b"\xff\xff\xff\xff" + data), output_stream)
+    with patch.object(protocol, 'MAX_FRAME_SIZE', 1024):
+        assert len(list(channel)) == 2
+    
+    output_stream.seek(0)
+    error = channel.decode(read_frame(output_stream))
+    assert error["success"] is False
+    assert error["message"].startswith("Invalid frame")
+
+
+def test_channels():
+    output_stream = io.BytesIO()
+    channel = open_channel(io.BytesIO(frames({"id": 1}, {"id": 2})), output_stream, framed=True)
+    assert isinstance(channel, FrameChannel)
+    assert [channel.decode(payload) for payload in channel] == [{"id": 1}, {"id": 2}]
+    
+    channel.send({"id": 1, "success": True, "price": np.float64(1.2)})
+    output_stream.seek(0)
+    assert read_frame(output_stream) == b'J{"id": 1, "success": true, "price": 1.2}'
+    
+    with pytest.raises(ValueError):
+        channel.decode(b"X{}")
+    
+    output_stream = io.StringIO()
+    channel = open_channel(io.StringIO('{"id": 1}\n\n{"id": 2}\n'), output_stream)
+    assert isinstance(channel, LineChannel)
+    assert [channel.decode(line) for line in channel] == [{"id": 1}, {"id": 2}]
+    
+    # Binary encodings fall back to JSON on text lines
+    channel.send({"id": 2}, "msgpack")
+    assert output_stream.getvalue() == '{"id": 2}\n'
@@ -0,0 +1,90 @@
+import os
+import sys
+import numpy as np
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.synthetic_data import REGIMES, ar1, generate_rates, generate_market_data
+from scripts.market_data import RATES_DTYPE
+from scripts.run_model import ForexModel, generate_sample_data
+
+END = 1617235200
+
+TECHNICAL_FEATURES = {
+    "Deep Learning": {"enabled": False},
+    "Sentiment Analysis": {"enabled": False},
+    "Advanced Risk Management": {"enabled": False},
+    "Adaptive Parameters": {"enabled": False}
+}
+
+
+def test_generate_rates_layout():
+    rates, regimes = generate_rates(20000, "USDJPY", "1h", seed=1, end=END + 100, return_regimes=True)
+    
+    assert rates.dtype == RATES_DTYPE
+    assert rates['time'][-1] == END
+    assert np.all(np.diff(rates['time']) == 3600)
+    assert np.all(rates['high'] >= np.maximum(rates['open'], rates['close']))
+    assert np.all(rates['low'] <= np.minimum(rates['open'], rates['close']))
+    assert np.all(rates['open'][1:] == rates['close'][:-1])
+    assert 50 < rates['close'].mean() < 250
+    assert set(np.unique(regimes)) == {0, 1, 2}
+    
+    # Same seed, same bars; no global random state involved
+    np.random.seed(0)
+    again = generate_rates(20000, "USDJPY", "1h", seed=1, end=END + 100)
+    assert np.array_equal(rates, again)
+
+
+def test_volatility_clusters():
+    rates = generate_rates(200000, seed=3, end=END)
+    moves = np.abs(np.diff(np.log(rates['close'])))
+    
+    # Large moves follow large moves
+    assert np.corrcoef(moves[:-1], moves[1:])[0, 1] > 0.1
+
+
+def test_regimes_exercise_detection():
+    model = ForexModel("EURUSD", "5m", TECHNICAL_FEATURES, {})
+    
+    def detected(regimes):
+        return [
+            model.detect_market_regime(model.preprocess_data(generate_rates(300, seed=seed, end=END, regimes=regimes)))
+            for seed in range(20)
+        ]
+    
+    assert detected("TRENDING").count("TRENDING") > detected("RANGING").count("TRENDING")
+    
+    # A volatility burst after a quiet range
+    codes = np.full(300, REGIMES.index("RANGING"))
+    codes[-3:] = REGIMES.index("VOLATILE")
+    assert "VOLATILE" in detected(codes)
+
+
+def test_ar1():
+    shocks = np.random.default_rng(0).standard_normal(1000)
+    expected = np.empty_like(shocks)
+    expected[0] = shocks[0]
+    for t in range(1, len(shocks)):
+        expected[t] = 0.9 * expected[t - 1] + shocks[t]
+    
+    assert np.allclose(ar1(shocks, 0.9), expected)
+
+
+def test_generate_market_data():
+    data = generate_market_data(["EURUSD", "GBPUSD"], 500, "15m", seed=7, end=END)
+    assert data["EURUSD"]['time'][-1] == data["GBPUSD"]['time'][-1]
+    assert not np.array_equal(data["EURUSD"]['close'] / 1.2, data["GBPUSD"]['close'] / 1.5)
+    
+    frames = generate_market_data(["EURUSD"], 500, "15m", seed=7, end=END, frame=True)
+    assert np.allclose(frames["EURUSD"]['close'], data["EURUSD"]['close'])
+    assert frames["EURUSD"]['time'].dtype.kind == "M"
+
+
+def test_generate_sample_data():
+    data = generate_sample_data("EURUSD", 100)
+    
+    assert len(data) == 100
+    assert set(data[0]) == {"time", "open", "high", "low", "close", "tick_volume", "spread", "real_volume"}
+    assert data[0]["time"] < data[-1]["time"]
+    assert [bar["close"] for bar in generate_sample_data("EURUSD", 100)] == [bar["close"] for bar in data]
@@ -0,0 +1,110 @@
+import pytest
+import os
+import sys
+import numpy as np
+
+# Add the scripts directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.tick_aggregator import TickAggregator
+from scripts.indicators import IncrementalIndicators
+from scripts.market_data import RATES_DTYPE
+
+START = 1617235200
+
+
+def random_ticks(count=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.sort(START + rng.integers(0, 2 * 86400, count))
+    prices = 1.2 + np.cumsum(rng.normal(0, 0.0001, count))
+    volumes = rng.integers(0, 5, count)
+    return times, prices, volumes
+
+
+def test_add_tick_builds_bars():
+    aggregator = TickAggregator(["1m", "5m"])
+    
+    updates = aggregator.add_tick("EURUSD", START + 10, 1.2000, volume=2)
+    assert [(timeframe, closed) for timeframe, _, closed in updates] == [("1m", False), ("5m", False)]
+    
+    aggregator.add_tick("EURUSD", START + 20, 1.2010)
+    aggregator.add_tick("EURUSD", START + 30, 1.1990)
+    
+    # An older tick is ignored
+    assert aggregator.add_tick("EURUSD", START - 60, 1.3000) == []
+    
+    # The next minute closes the 1m bar only
+    updates = aggregator.add_tick("EURUSD", START + 65, 1.2005, volume=1)
+    assert [(timeframe, closed) for timeframe, _, closed in updates] == [("1m", True), ("1m", False), ("5m", False)]
+    
+    closed = updates[0][1]
+    assert closed == {
+        "time": START, "open": 1.2000, "high": 1.2010, "low": 1.1990, "close": 1.1990,
+        "tick_volume": 3, "spread": 0, "real_volume": 2
+    }
+    
+    five_minutes = aggregator.bar("EURUSD", "5m")
+    assert five_minutes["tick_volume"] == 4
+    assert five_minutes["close"] == 1.2005
+    assert aggregator.bar("GBPUSD", "5m") is None
+
+
+def test_add_ticks_matches_add_tick():
+    times, prices, volumes = random_ticks()
+    single = TickAggregator()
+    batch = TickAggregator()
+    
+    closed = []
+    for time, price, volume in zip(times, prices, volumes):
+        closed += [update for update in single.add_tick("EURUSD", time, price, int(volume)) if update[2]]
+    
+    # Split the batch so the forming bars carry over between calls
+    updates = batch.add_ticks("EURUSD", times[:1234], prices[:1234], volumes[:1234])
+    updates += batch.add_ticks("EURUSD", times[1234:], prices[1234:], volumes[1234:])
+    
+    key = lambda update: (update[0], update[1]["time"])
+    assert sorted(closed, key=key) == sorted([update for update in updates if update[2]], key=key)
+    assert single.bars == batch.bars
+
+
+def test_features_follow_closed_bars():
+    times, prices, volumes = random_ticks(20000)
+    aggregator = TickAggregator(["5m"], indicator_params={})
+    
+    closed = [update[1] for update in aggregator.add_ticks("EURUSD", times, prices, volumes) if update[2]]
+    
+    # The forming bar's indicators equal a full recomputation over all bars
+    engine = IncrementalIndicators()
+    for bar in closed:
+        engine.update(bar)
+    expected = engine.update(aggregator.bar("EURUSD", "5m"))
+    
+    features = aggregator.features("EURUSD", "5m")
+    for name in ("sma_20", "rsi", "atr", "macd", "adx"):
+        assert features[name] == pytest.approx(expected[name])
+    
+    # Peeking does not advance the indicators
+    assert aggregator.engines[("EURUSD", "5m")].bars == len(closed)
+
+
+def test_seed_from_history():
+    rates = np.zeros(60, dtype=RATES_DTYPE)
+    rates['time'] = START + np.arange(60) * 300
+    rates['close'] = rates['open'] = 1.2 + np.arange(60) * 0.0001
+    rates['high'] = rates['close'] + 0.0002
+    rates['low'] = rates['close'] - 0.0002
+    
+    aggregator = TickAggregator(["5m"], indicator_params={})
+    aggregator.seed("EURUSD", "5m", rates)
+    assert aggregator.engines[("EURUSD", "5m")].bars == 59
+    
+    # A tick in the last (forming) bar updates it, the next one closes it
+    aggregator.add_tick("EURUSD", rates['time'][-1] + 10, 1.3)
+    assert aggregator.bar("EURUSD", "5m")["high"] == 1.3
+    
+    updates = aggregator.add_tick("EURUSD", rates['time'][-1] + 300, 1.25)
+    assert updates[0][2] is True
+    assert updates[0][1]["close"] == 1.3
+    assert aggregator.engines[("EURUSD", "5m")].bars == 60
+    assert aggregator.features("EURUSD", "5m")["sma_50"] == pytest.approx(
+        (rates['close'][-49:].sum() + 1.25 - rates['close'][-1] + 1.3) / 50
+    )